@@ -1,22 +1,46 @@
-from flask import Flask
-from .utils import load_users, verify_password, load_all_qa_into_chroma # Assuming verify_password might be used by routes
-
-app = Flask(__name__)
-app.secret_key = 'your_very_secret_key_here_change_me' # Replace with a strong, environment-based key in production
-
-# Import routes after app initialization to avoid circular imports
-from . import routes
-
-print("Attempting to load all Q&A data into ChromaDB at startup...")
-try:
-    # Make sure sentence_transformer_ef is initialized in utils before this is called
-    # or that load_all_qa_into_chroma handles its absence.
-    # Based on previous utils.py, it should handle it.
-    load_all_qa_into_chroma()
-    print("ChromaDB loading process initiated. Check console for details and completion.")
-except Exception as e:
-    print(f"Error during initial loading of data into ChromaDB: {e}")
-    print("The application will continue, but Q&A search functionality might be impaired.")
+import time
+
+from flask import Flask, current_app
+from .utils import load_users, verify_password # Assuming verify_password might be used by routes
+from . import startup, warmup
+
+
+def create_app(config=None) -> Flask:
+    """Application factory.
+
+    `config` may be a mapping or a config object. Building an app only imports
+    Flask and the app's own modules; chromadb, the embedding model and the LLM client
+    are loaded on first use (or by the background warm-up). Set
+    `WARMUP_ON_FIRST_REQUEST` to False for workers that never serve retrieval.
+    """
+    started = time.perf_counter()
+    app = Flask(__name__)
+    app.secret_key = 'your_very_secret_key_here_change_me' # Replace with a strong, environment-based key in production
+    app.config['WARMUP_ON_FIRST_REQUEST'] = True
+    if isinstance(config, dict):
+        app.config.from_mapping(config)
+    elif config is not None:
+        app.config.from_object(config)
+
+    # Import routes inside the factory to avoid circular imports
+    from .routes import bp
+    app.register_blueprint(bp)
+
+    # Model loading and Q&A indexing run in a background thread (see app/warmup.py)
+    # so workers can answer /healthz and /readyz straight away. The thread is
+    # started by the first request each worker process receives.
+    app.before_request(start_background_warmup)
+
+    startup.record("create_app", time.perf_counter() - started)
+    return app
+
+
+def start_background_warmup():
+    if current_app.config.get('WARMUP_ON_FIRST_REQUEST') and not current_app.config.get('TESTING'):
+        warmup.start_warmup()
+
+
+app = create_app()
 
 # The following is for running the app directly using `python -m app`
 # For development only. Use a WSGI server in production.
@@ -0,0 +1,258 @@
+"""Retrieval benchmarks: `python -m app.bench <benchmark> [options]`.
+
+    backends   Chroma vs the NumPy vector index (app/vector_store.py): build
+               time, single-query latency (as /api/ask issues them), recall@k
+               against exact search, and on-disk size.
+    compression
+               int8 / binary / PCA codes with exact re-rank (app/quantization.py)
+               vs the full-precision NumPy index: latency, recall@k and
+               in-memory index size.
+    coalescing Query embedding throughput and p50/p99 latency at 1, 8 and
+               64 concurrent askers, each embedding on its own vs micro-batched
+               across threads (app/coalescer.py).
+
+By default the vectors are synthetic (clustered random unit vectors of the
+model's dimension), so no model download is needed. `--company` benchmarks the
+embeddings stored in that company's collection instead. `coalescing` uses a
+simulated model by default (a fixed cost per forward pass plus a cost per
+sentence, one pass at a time); `--model` loads the real sentence-transformer.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_DIM = 384 # all-MiniLM-L6-v2
+
+
+def synthetic_embeddings(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Unit vectors around n // 8 centres, so that near neighbours exist as in a real KB."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(max(1, n // 8), dim))
+    vectors = centres[rng.integers(0, len(centres), size=n)] + rng.normal(scale=0.35, size=(n, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def make_queries(embeddings: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    """Perturbed copies of stored vectors, like paraphrases of known questions."""
+    rng = np.random.default_rng(seed)
+    picks = embeddings[rng.integers(0, len(embeddings), size=count)]
+    queries = picks + rng.normal(scale=0.02, size=picks.shape)
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+
+def exact_top_k(embeddings: np.ndarray, queries: np.ndarray, k: int) -> list[set]:
+    normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    scores = queries @ normalized.T
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+
+def recall_at_k(found: list[list[int]], truth: list[set], k: int) -> float:
+    return float(np.mean([len(set(ids[:k]) & expected) / k for ids, expected in zip(found, truth)]))
+
+
+def latency_summary(seconds: list[float]) -> dict:
+    ms = np.asarray(seconds) * 1000
+    return {'p50_ms': round(float(np.percentile(ms, 50)), 3), 'p95_ms': round(float(np.percentile(ms, 95)), 3),
+            'mean_ms': round(float(ms.mean()), 3)}
+
+
+def directory_bytes(path: str) -> int:
+    """Allocated bytes (preallocated sparse files only count the pages written)."""
+    return sum(os.stat(os.path.join(root, name)).st_blocks * 512 for root, _, names in os.walk(path) for name in names)
+
+
+def _time_queries(collection, queries: np.ndarray, k: int):
+    found, seconds = [], []
+    for query in queries:
+        started = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=k, include=['distances'])
+        seconds.append(time.perf_counter() - started)
+        found.append([int(qa_id) for qa_id in result['ids'][0]])
+    return found, seconds
+
+
+def _build(collection, embeddings: np.ndarray, batch_size: int = 1000) -> float:
+    started = time.perf_counter()
+    for start in range(0, len(embeddings), batch_size):
+        chunk = embeddings[start:start + batch_size]
+        collection.add(ids=[str(i) for i in range(start, start + len(chunk))],
+                       documents=[f"question {i}" for i in range(start, start + len(chunk))],
+                       embeddings=chunk.tolist())
+    return time.perf_counter() - started
+
+
+def bench_backends(embeddings: np.ndarray, queries: np.ndarray, k: int = 3, backends=('chroma', 'numpy')) -> dict:
+    from app import vector_store
+    truth = exact_top_k(embeddings, queries, k)
+    results = {'items': len(embeddings), 'dim': embeddings.shape[1], 'queries': len(queries), 'k': k}
+    workdir = tempfile.mkdtemp(prefix="qa-bench-")
+    try:
+        for backend in backends:
+            path = os.path.join(workdir, backend)
+            if backend == 'chroma':
+                import chromadb
+                collection = chromadb.PersistentClient(path=path).get_or_create_collection(name="bench_qa")
+            else:
+                collection = vector_store.NumpyCollection(path, "bench_qa")
+            build_seconds = _build(collection, embeddings)
+            _time_queries(collection, queries[:10], k) # warm-up
+            found, seconds = _time_queries(collection, queries, k)
+            results[backend] = {
+                'build_seconds': round(build_seconds, 3),
+                **latency_summary(seconds),
+                f'recall@{k}': round(recall_at_k(found, truth, k), 4),
+                'disk_bytes': directory_bytes(path),
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def bench_compression(embeddings: np.ndarray, queries: np.ndarray, k: int = 3,
+                      specs=('none', 'int8', 'binary', 'pca64'), oversample: int = None) -> dict:
+    from app import vector_store
+    truth = exact_top_k(embeddings, queries, k)
+    results = {'items': len(embeddings), 'dim': embeddings.shape[1], 'queries': len(queries), 'k': k}
+    workdir = tempfile.mkdtemp(prefix="qa-bench-")
+    try:
+        collection = vector_store.NumpyCollection(workdir, "bench_qa")
+        _build(collection, embeddings)
+        float_bytes = collection.memory_bytes()['vectors']
+        for spec in specs:
+            collection = vector_store.NumpyCollection(workdir, "bench_qa", compression=spec)
+            if oversample and collection._compressed is not None:
+                collection._compressed.oversample = oversample
+            _time_queries(collection, queries[:10], k) # warm-up (fits and encodes the codes)
+            found, seconds = _time_queries(collection, queries, k)
+            in_memory = collection.memory_bytes()['codes'] or float_bytes
+            results[spec] = {
+                **latency_summary(seconds),
+                f'recall@{k}': round(recall_at_k(found, truth, k), 4),
+                'index_bytes': in_memory,
+                'compression_ratio': round(float_bytes / in_memory, 1),
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+class SimulatedModel:
+    """Stands in for the sentence-transformer: each forward pass costs `overhead_ms` plus `per_item_ms` per text.
+
+    Passes are serialized, as on a CPU that one pass already saturates.
+    """
+
+    def __init__(self, overhead_ms: float = 8.0, per_item_ms: float = 0.4, dim: int = DEFAULT_DIM):
+        self.overhead = overhead_ms / 1000
+        self.per_item = per_item_ms / 1000
+        self.dim = dim
+        self._lock = threading.Lock()
+
+    def __call__(self, input):
+        with self._lock:
+            time.sleep(self.overhead + self.per_item * len(input))
+        return [np.full(self.dim, len(text), dtype=np.float32) for text in input]
+
+
+def _run_askers(embedding_function, askers: int, requests_per_asker: int) -> dict:
+    seconds = []
+    lock = threading.Lock()
+
+    def asker(number):
+        mine = []
+        for i in range(requests_per_asker):
+            started = time.perf_counter()
+            embedding_function([f"question {number} {i}"])
+            mine.append(time.perf_counter() - started)
+        with lock:
+            seconds.extend(mine)
+
+    threads = [threading.Thread(target=asker, args=(number,)) for number in range(askers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    ms = np.asarray(seconds) * 1000
+    return {'queries_per_second': round(len(seconds) / elapsed, 1), 'p50_ms': round(float(np.percentile(ms, 50)), 3),
+            'p99_ms': round(float(np.percentile(ms, 99)), 3)}
+
+
+def bench_coalescing(model, concurrency=(1, 8, 64), requests_per_asker: int = 20, window_ms: float = 3.0,
+                     max_batch: int = 32) -> dict:
+    from app.coalescer import CoalescingEmbeddingFunction
+    coalesced = CoalescingEmbeddingFunction(model, window_ms / 1000, max_batch)
+    results = {'window_ms': window_ms, 'max_batch': max_batch, 'requests_per_asker': requests_per_asker}
+    for askers in concurrency:
+        results[f'{askers}_askers'] = {
+            'direct': _run_askers(model, askers, requests_per_asker),
+            'coalesced': _run_askers(coalesced, askers, requests_per_asker),
+        }
+    return results
+
+
+def load_embeddings(args) -> np.ndarray:
+    if args.company:
+        from app import dedup, utils
+        _, _, embeddings = dedup.load_collection_embeddings(utils.get_or_create_collection(args.company))
+        return embeddings
+    return synthetic_embeddings(args.items, args.dim)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.bench", description="Retrieval benchmarks.")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    backends = subparsers.add_parser('backends', help="Chroma vs the NumPy vector index")
+    backends.add_argument('--backend', action='append', choices=['chroma', 'numpy'], help="Backends to run (default: both)")
+
+    compression = subparsers.add_parser('compression', help="Compact codes + exact re-rank vs the full-precision NumPy index")
+    compression.add_argument('--spec', action='append', help="Compression specs (default: none, int8, binary, pca64)")
+    compression.add_argument('--oversample', type=int, help="Candidates re-ranked per result (default 10)")
+
+    coalescing = subparsers.add_parser('coalescing', help="Per-call vs micro-batched query embedding under concurrency")
+    coalescing.add_argument('--concurrency', type=int, action='append', help="Concurrent askers (default: 1, 8, 64)")
+    coalescing.add_argument('--requests', type=int, default=20, help="Questions per asker")
+    coalescing.add_argument('--window-ms', type=float, default=3.0)
+    coalescing.add_argument('--max-batch', type=int, default=32)
+    coalescing.add_argument('--model', action='store_true', help="Use the real sentence-transformer instead of a simulated one")
+
+    for subparser in (backends, compression):
+        subparser.add_argument('--company', help="Use this company's stored embeddings instead of synthetic ones")
+        subparser.add_argument('--items', type=int, default=5000, help="Synthetic items")
+        subparser.add_argument('--dim', type=int, default=DEFAULT_DIM, help="Synthetic dimension")
+        subparser.add_argument('--queries', type=int, default=200)
+        subparser.add_argument('--k', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.benchmark == 'coalescing':
+        if args.model:
+            from chromadb.utils import embedding_functions
+            from app import utils
+            model = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=utils.DEFAULT_EMBEDDING_MODEL)
+        else:
+            model = SimulatedModel()
+        results = bench_coalescing(model, concurrency=args.concurrency or (1, 8, 64), requests_per_asker=args.requests,
+                                   window_ms=args.window_ms, max_batch=args.max_batch)
+        print(json.dumps(results, indent=2))
+        return
+
+    embeddings = load_embeddings(args)
+    queries = make_queries(embeddings, args.queries)
+    if args.benchmark == 'backends':
+        results = bench_backends(embeddings, queries, k=args.k, backends=args.backend or ('chroma', 'numpy'))
+    elif args.benchmark == 'compression':
+        results = bench_compression(embeddings, queries, k=args.k, specs=args.spec or ('none', 'int8', 'binary', 'pca64'),
+                                    oversample=args.oversample)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Circuit breaker that makes LLM calls fail fast while the upstream is degraded.
+
+Without it, every /api/ask waits out the full timeout and retry budget of
+the LLM client during an outage before it can report the error. The
+breaker watches the outcome of each call:
+
+- closed (normal): calls go through. LLM_CIRCUIT_FAILURES consecutive
+  failures open the circuit. Upstream errors count as failures: timeouts,
+  connection errors, 429 and 5xx after retries, interrupted streams. So do
+  calls slower than LLM_CIRCUIT_SLOW_SECONDS;
+- open: calls are rejected at once with CircuitOpenError, for
+  LLM_CIRCUIT_RESET_SECONDS;
+- half-open: one probe call is let through. Its success closes the circuit
+  and its failure opens it again. If the probe never reports, another one is
+  allowed after LLM_CIRCUIT_RESET_SECONDS.
+
+The state is per process. /api/ask answers from the best retrieved snippet
+while the circuit is open; see `routes._extractive_response`. Transitions
+are counted in app/metrics.py (llm.circuit_opened, llm.circuit_rejected).
+"""
+import threading
+import time
+
+from app import metrics
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(RuntimeError):
+    """The LLM circuit is open, so the call was not attempted."""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, slow_call_seconds: float = 20.0, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0 # consecutive
+        self._opened_at = 0.0
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raises CircuitOpenError unless the call may go ahead (closed, or the half-open probe)."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probe_started = None
+            if self.state == HALF_OPEN and (self._probe_started is None or now - self._probe_started >= self.reset_timeout):
+                self._probe_started = now
+                return
+            if self.state == CLOSED:
+                return
+            retry_in = max(0.0, self.reset_timeout - (now - self._opened_at))
+        metrics.increment("llm.circuit_rejected")
+        raise CircuitOpenError(f"LLM circuit open after {self.failures} consecutive failures; retrying in {retry_in:.0f}s")
+
+    def record_success(self, seconds: float = 0.0):
+        if seconds >= self.slow_call_seconds > 0:
+            self.record_failure()
+            return
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                self._probe_started = None
+                metrics.increment("llm.circuit_opened")
+
+    def release_probe(self):
+        """A call let through by before_call() ended without reaching the upstream: let the next call probe."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_started = None
+
+    def is_open(self) -> bool:
+        """True while calls are being rejected (no probe due yet)."""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self._opened_at < self.reset_timeout
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'state': self.state, 'consecutive_failures': self.failures}
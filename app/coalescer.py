@@ -0,0 +1,115 @@
+"""Cross-request micro-batching of embedding calls.
+
+Every /api/ask thread embeds its one question on its own, so the model runs
+one sentence per forward pass and the threads queue up behind each other.
+An `EmbeddingCoalescer` collects the texts that arrive within a short window
+(EMBEDDING_COALESCE_WINDOW_MS after the first one) or until
+EMBEDDING_COALESCE_MAX_BATCH texts are waiting. It then embeds them all in
+one batched call on a collector thread and hands each caller its vectors.
+The window is skipped when no other caller is in flight, so a lone asker
+does not pay for it.
+
+Calls that already carry a full batch (bulk appends, sync) bypass the queue.
+`utils.get_embedding_function` places the coalescer behind the embedding
+cache, so only cache misses wait for a window. Batches and texts are
+counted in app/metrics.py (embedding_coalescer.batches / .texts).
+Measure with `python -m app.bench coalescing`.
+"""
+import os
+import threading
+import time
+
+from app import metrics
+from app.embedding_cache import EmbeddingFunctionWrapper
+
+
+class _Request:
+    __slots__ = ('texts', 'vectors', 'error', 'done')
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.vectors = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class EmbeddingCoalescer:
+    def __init__(self, embedding_function, window: float = 0.003, max_batch: int = 32):
+        self.embedding_function = embedding_function
+        self.window = window # seconds
+        self.max_batch = max_batch
+        self._pending = []
+        self._pending_texts = 0
+        self._callers = 0 # threads inside embed(), queued or waiting for their batch
+        self._cond = threading.Condition()
+        self._thread_pid = None
+
+    def embed(self, texts: list) -> list:
+        texts = list(texts)
+        if self.window <= 0 or len(texts) >= self.max_batch:
+            return list(self.embedding_function(texts))
+        request = _Request(texts)
+        with self._cond:
+            self._ensure_collector()
+            self._pending.append(request)
+            self._pending_texts += len(texts)
+            self._callers += 1
+            self._cond.notify()
+        request.done.wait()
+        with self._cond:
+            self._callers -= 1
+            self._cond.notify() # the queued callers may now be all there are
+        if request.error is not None:
+            raise request.error
+        return request.vectors
+
+    def _ensure_collector(self):
+        # Threads do not survive a fork (gunicorn --preload), so each process starts its own.
+        if self._thread_pid != os.getpid():
+            self._pending = []
+            self._pending_texts = 0
+            self._callers = 0
+            threading.Thread(target=self._collect, name="embedding-coalescer", daemon=True).start()
+            self._thread_pid = os.getpid()
+
+    def _collect(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.window
+                # Stop early once every caller inside embed() is queued (e.g. a single asker): waiting could not grow the batch.
+                while self._pending_texts < self.max_batch and len(self._pending) < self._callers:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending, []
+                self._pending_texts = 0
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: list):
+        distinct = list(dict.fromkeys(text for request in batch for text in request.texts))
+        try:
+            by_text = dict(zip(distinct, self.embedding_function(distinct)))
+            metrics.increment("embedding_coalescer.batches")
+            metrics.increment("embedding_coalescer.texts", len(distinct))
+        except Exception as e:
+            for request in batch:
+                request.error = e
+                request.done.set()
+            return
+        for request in batch:
+            request.vectors = [by_text[text] for text in request.texts]
+            request.done.set()
+
+
+class CoalescingEmbeddingFunction(EmbeddingFunctionWrapper):
+    """Embedding function whose small calls are micro-batched across threads by an EmbeddingCoalescer."""
+
+    def __init__(self, embedding_function, window: float = 0.003, max_batch: int = 32):
+        super().__init__(embedding_function)
+        self.coalescer = EmbeddingCoalescer(embedding_function, window, max_batch)
+
+    def __call__(self, input):
+        return self.coalescer.embed(input)
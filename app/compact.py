@@ -0,0 +1,55 @@
+"""Compaction of the Q&A text files: `python -m app.compact [--company NAME ...] [--dry-run]`.
+
+Every correction appends a new pair after a `##Update##` marker and leaves the
+pair it supersedes in the file. Compaction rewrites the file with only the
+live pairs, in order and without markers, and then syncs the company's
+collection, which deletes the vectors of the superseded pairs. The rewrite
+holds the same file lock as append_qa_pair, so it is safe to run while the
+web app is serving. For companies on the NumPy vector backend, the index
+files are compacted as well.
+"""
+import argparse
+import json
+import os
+
+from app import utils
+
+
+def compact_company(company: str, dry_run: bool = False) -> dict:
+    filepath = utils.get_qa_filepath(company)
+    with utils.qa_file_lock(company):
+        index = utils.build_qa_index(company)
+        stats = {'company': company, 'records_before': index.record_count,
+                 'records_after': len(index), 'superseded_removed': index.superseded_count}
+        if dry_run:
+            return stats
+
+        if index.superseded_count:
+            tmp_path = f"{filepath}.compact.tmp"
+            with open(tmp_path, 'w') as f:
+                for qa_item in index.live_items():
+                    f.write(f"{qa_item.question}\n{qa_item.answer}\n\n")
+            os.replace(tmp_path, filepath)
+            utils.invalidate_qa_index(company)
+
+    if utils.get_embedding_function() is not None:
+        if index.superseded_count:
+            stats['sync'] = utils.sync_company_into_chroma(company)
+        if utils.get_vector_backend(company) == 'numpy':
+            # Drop the index rows retired by deletes and re-upserts
+            stats['index_rows_dropped'] = utils.get_or_create_collection(company).compact()
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.compact", description="Drop superseded Q&A pairs from the knowledge base.")
+    parser.add_argument('--company', action='append', help="Company to compact (repeatable; defaults to all)")
+    parser.add_argument('--dry-run', action='store_true', help="Only report what would be removed")
+    args = parser.parse_args(argv)
+
+    for company in args.company or utils.get_companies():
+        print(json.dumps(compact_company(company, dry_run=args.dry_run)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""Company (tenant) registry and the LRU of open collection handles.
+
+The companies served are listed in COMPANIES_FILE (default
+app/data/companies.json), a JSON list such as:
+
+    [{"name": "Tallman"},
+     {"name": "Acme", "qa_file": "/srv/qa/Acme_QA.txt", "collection": "acme_qa"}]
+
+"qa_file" defaults to app/data/<name>_QA.txt and "collection" to
+<name lowercased>_qa. The file is checked for changes at most once a second,
+so a company is onboarded by adding it there, without restarting workers.
+Without the file, the built-in `utils.COMPANIES` are served, with their
+`utils.*_QA_FILE` paths.
+
+`CollectionCache` keeps the most recently used COLLECTION_CACHE_SIZE
+collection handles. A handle is opened on first use, and the least recently
+used one is dropped when the cache is full, so memory follows the active
+tenants rather than all registered ones. Hits, misses and evictions are
+counted in app/metrics.py (collection_cache.hits / .misses / .evictions).
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app import metrics
+
+
+class Company:
+    def __init__(self, name: str, qa_file: str = None, collection: str = None):
+        self.name = name
+        self.qa_file = qa_file
+        self.collection = collection
+
+    @property
+    def collection_name(self) -> str:
+        return self.collection or f"{self.name.lower()}_qa"
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'qa_file': self.qa_file,
+            'collection': self.collection
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        name = data.get('name')
+        if not isinstance(name, str) or not name.strip() or name == 'all':
+            raise ValueError(f"Invalid company name in registry: {name!r}")
+        return cls(
+            name=name.strip(),
+            qa_file=data.get('qa_file'),
+            collection=data.get('collection')
+        )
+
+
+class CompanyRegistry:
+    def __init__(self, path: str, defaults, check_interval: float = 1.0):
+        """`defaults` is called for the companies (Company objects or names) to serve while `path` does not exist."""
+        self.path = path
+        self.defaults = defaults
+        self.check_interval = check_interval
+        self._companies = None # name -> Company, from the file; None while there is no file
+        self._signature = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return self._companies
+            self._checked_at = now
+            try:
+                stat = os.stat(self.path)
+                signature = (stat.st_size, stat.st_mtime_ns)
+            except FileNotFoundError:
+                self._companies = self._signature = None
+                return None
+            if signature != self._signature:
+                try:
+                    self._companies = _read_registry(self.path)
+                    print(f"Loaded {len(self._companies)} companies from {self.path}.")
+                except (OSError, ValueError) as e:
+                    # Keep serving the last good list rather than dropping every tenant.
+                    print(f"Error loading company registry {self.path}: {e}")
+                self._signature = signature
+            return self._companies
+
+    def _default_companies(self) -> dict:
+        defaults = (entry if isinstance(entry, Company) else Company(entry) for entry in self.defaults())
+        return {company.name: company for company in defaults}
+
+    def names(self) -> list:
+        companies = self._load()
+        return list(companies if companies is not None else self._default_companies())
+
+    def get(self, name: str) -> Company:
+        """The registered company called `name`, or None."""
+        companies = self._load()
+        return (companies if companies is not None else self._default_companies()).get(name)
+
+    def reload(self):
+        """Re-reads the file on the next lookup."""
+        with self._lock:
+            self._checked_at = None
+            self._signature = None
+
+
+def _read_registry(path: str) -> dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        raise ValueError("expected a JSON list of companies")
+    companies = {}
+    for entry in data:
+        company = Company.from_dict(entry if isinstance(entry, dict) else {'name': entry})
+        if company.name in companies:
+            raise ValueError(f"company {company.name} is listed twice")
+        companies[company.name] = company
+    return companies
+
+
+class CollectionCache:
+    def __init__(self, capacity: int, on_evict=None):
+        """`on_evict(key, collection)` is called for every handle dropped to make room."""
+        self.capacity = capacity
+        self.on_evict = on_evict
+        self._handles = OrderedDict() # key -> (collection, owner), least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, key, owner, open_collection):
+        """The cached handle for `key`, or `open_collection()` on a miss.
+
+        `owner` names what the handle was opened with (client, embedding
+        function); a handle cached for a different owner is reopened.
+        """
+        if self.capacity <= 0:
+            return open_collection()
+        with self._lock:
+            cached = self._handles.get(key)
+            if cached is not None and all(a is b for a, b in zip(cached[1], owner)):
+                self._handles.move_to_end(key)
+                metrics.increment("collection_cache.hits")
+                return cached[0]
+        metrics.increment("collection_cache.misses")
+        collection = open_collection()
+        evicted = []
+        with self._lock:
+            self._handles[key] = (collection, owner)
+            self._handles.move_to_end(key)
+            while len(self._handles) > self.capacity:
+                evicted.append(self._handles.popitem(last=False))
+        for evicted_key, (evicted_collection, _) in evicted:
+            metrics.increment("collection_cache.evictions")
+            if self.on_evict is not None:
+                self.on_evict(evicted_key, evicted_collection)
+        return collection
+
+    def invalidate(self, key=None):
+        """Drops the handle for `key` (every handle if no key is given)."""
+        with self._lock:
+            if key is None:
+                self._handles.clear()
+            else:
+                self._handles.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'open': len(self._handles), 'capacity': self.capacity}
@@ -0,0 +1,139 @@
+"""Cache of LLM completions, keyed by a fingerprint of the exact request.
+
+`get_llm_answer` sends the same messages again whenever the same question
+retrieves the same snippets, and pays for a fresh completion each time. The
+key is a sha256 of the model, the system message and the final prompt. The
+prompt contains the snippets, so a different context is always a different
+key.
+
+There are two tiers: an in-process LRU (COMPLETION_CACHE_MEMORY_ENTRIES) in
+front of a SQLite file (COMPLETION_CACHE_PATH) shared by all workers.
+Entries expire after COMPLETION_CACHE_TTL seconds. Each entry also stores
+the knowledge-base version of the companies its snippets came from: their
+Q&A file signatures, see `utils.get_kb_version`. Any change to those files,
+such as `append_qa_pair` or `/api/correct_answer` from any worker, makes the
+entry stale. A stale entry is deleted when it is looked up, together with
+any expired ones. The file keeps at most
+COMPLETION_CACHE_MAX_ROWS entries, dropping the least recently written ones.
+
+Hits (split into memory and disk hits) and misses are counted in
+app/metrics.py as completion_cache.hits / .disk_hits / .misses.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from app import metrics
+
+PRUNE_EVERY = 100 # Puts between checks of the row limit
+
+
+def fingerprint(model: str, messages: list) -> str:
+    return hashlib.sha256(json.dumps([model, messages], sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class CompletionCache:
+    def __init__(self, path: str, memory_entries: int = 1024, ttl: float = 86400, max_rows: int = 100_000):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._memory = OrderedDict() # key -> (answer, version, created)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._puts = 0
+
+    def _db(self):
+        # One connection per thread and process; SQLite connections must not cross either.
+        local = self._local
+        if getattr(local, 'db', None) is None or local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, company TEXT, version TEXT,"
+                       " answer TEXT NOT NULL, created REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS completions_created ON completions (created)")
+            local.db, local.pid = db, os.getpid()
+        return local.db
+
+    def get(self, key: str, version: str) -> str:
+        """The cached answer, or None if there is none, it expired, or the knowledge base changed since."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                answer, entry_version, created = entry
+                if entry_version == version and now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    metrics.increment("completion_cache.hits")
+                    return answer
+                del self._memory[key]
+        try:
+            row = self._db().execute("SELECT answer, version, created FROM completions WHERE key = ?",
+                                     (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Completion cache lookup failed: {e}")
+            row = None
+        if row is None or row[1] != version or now - row[2] > self.ttl:
+            if row is not None:
+                self._delete_stale(key, now)
+            metrics.increment("completion_cache.misses")
+            return None
+        self._remember(key, row[0], version, row[2])
+        metrics.increment("completion_cache.hits")
+        metrics.increment("completion_cache.disk_hits")
+        return row[0]
+
+    def _delete_stale(self, key, now):
+        # Only this row is known to be stale: another row of the same company may carry a different but
+        # current version (e.g. a federated entry covering several companies' files).
+        try:
+            self._db().execute("DELETE FROM completions WHERE key = ? OR created < ?", (key, now - self.ttl))
+        except sqlite3.Error as e:
+            print(f"Completion cache cleanup failed: {e}")
+
+    def _remember(self, key, answer, version, created):
+        with self._lock:
+            self._memory[key] = (answer, version, created)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def put(self, key: str, company: str, version: str, answer: str):
+        created = time.time()
+        self._remember(key, answer, version, created)
+        try:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO completions (key, company, version, answer, created) VALUES (?, ?, ?, ?, ?)",
+                       (key, company, version, answer, created))
+            with self._lock:
+                self._puts += 1
+                prune = self._puts % PRUNE_EVERY == 0
+            if prune:
+                db.execute("DELETE FROM completions WHERE key IN (SELECT key FROM completions ORDER BY created DESC"
+                           " LIMIT -1 OFFSET ?)", (self.max_rows,))
+        except sqlite3.Error as e:
+            print(f"Completion cache write failed: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        self._db().execute("DELETE FROM completions")
+
+    def stats(self) -> dict:
+        with self._lock:
+            memory = len(self._memory)
+        rows = 0
+        if os.path.exists(self.path): # a stats request alone does not create the file
+            try:
+                rows = self._db().execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+            except sqlite3.Error:
+                rows = None
+        return {'memory_entries': memory, 'disk_entries': rows, 'ttl_seconds': self.ttl}
@@ -0,0 +1,171 @@
+"""Near-duplicate detection for Q&A questions.
+
+Paraphrased copies of the same question waste top-k retrieval slots. Two
+tools deal with them:
+
+* `find_near_duplicates` checks questions that are about to be appended
+  against the company collection (and against each other) by cosine
+  similarity. append_qa_pair(s) use it to skip or merge duplicates when
+  `DEDUP_MODE` (or their `dedup` argument) is 'skip' or 'merge'.
+* `python -m app.dedup` runs an offline report. It computes all-pairs
+  similarity over a company's stored embeddings, tile by tile so memory
+  stays bounded, and groups the pairs above the threshold into clusters:
+
+    python -m app.dedup --company Tallman [--threshold 0.92] [--block-size 2048] [--output report.json]
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from app import utils
+
+DEFAULT_THRESHOLD = utils.DEDUP_THRESHOLD
+DEFAULT_BLOCK_SIZE = 2048
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def find_near_duplicates(collection, embeddings, threshold: float) -> list:
+    """For each embedding, the closest stored item as (id, question, embedding, similarity) if it reaches `threshold`, else None."""
+    matches = [None] * len(embeddings)
+    if not len(embeddings) or collection.count() == 0:
+        return matches
+    raw = np.asarray(embeddings, dtype=np.float32)
+    queries = normalize_rows(raw)
+    for start in range(0, len(queries), utils.CHROMA_BATCH_SIZE):
+        result = collection.query(
+            query_embeddings=raw[start:start + utils.CHROMA_BATCH_SIZE].tolist(),
+            n_results=1,
+            include=['embeddings', 'documents']
+        )
+        for offset, (ids, documents, stored) in enumerate(zip(result['ids'], result['documents'], result['embeddings'])):
+            if not ids:
+                continue
+            stored_vector = np.asarray(stored[0], dtype=np.float32)
+            similarity = float(normalize_rows(stored_vector)[0] @ queries[start + offset])
+            if similarity >= threshold:
+                matches[start + offset] = (ids[0], documents[0], stored_vector, similarity)
+    return matches
+
+
+def find_batch_duplicates(embeddings, threshold: float, block_size: int = DEFAULT_BLOCK_SIZE) -> list:
+    """For each embedding, (index, similarity) of the earliest earlier embedding it duplicates, else None."""
+    first = [None] * len(embeddings)
+    for i, j, similarity in iter_similar_pairs(embeddings, threshold, block_size):
+        if first[j] is None or i < first[j][0]:
+            first[j] = (i, similarity)
+    return first
+
+
+def iter_similar_pairs(embeddings, threshold: float, block_size: int = DEFAULT_BLOCK_SIZE):
+    """Yields (i, j, similarity) for i < j with cosine similarity >= threshold.
+
+    The similarity matrix is computed in block_size x block_size tiles over its
+    upper triangle, so at most one tile is held in memory at a time.
+    """
+    matrix = normalize_rows(embeddings)
+    n = len(matrix)
+    for row_start in range(0, n, block_size):
+        rows = matrix[row_start:row_start + block_size]
+        for col_start in range(row_start, n, block_size):
+            tile = rows @ matrix[col_start:col_start + block_size].T
+            hits = tile >= threshold
+            if col_start == row_start:
+                hits = np.triu(hits, k=1)
+            for i, j in zip(*np.nonzero(hits)):
+                yield row_start + int(i), col_start + int(j), float(tile[i, j])
+
+
+def cluster_pairs(n: int, pairs) -> list[list[int]]:
+    """Connected components (size > 1) of the similarity graph, via union-find."""
+    parent = list(range(n))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for i, j in pairs:
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    groups = {}
+    for x in range(n):
+        groups.setdefault(find(x), []).append(x)
+    return [members for members in groups.values() if len(members) > 1]
+
+
+def load_collection_embeddings(collection):
+    """Pages through the collection; returns (ids, questions, embedding matrix)."""
+    ids, questions, vectors = [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=['embeddings', 'documents'], limit=utils.CHROMA_BATCH_SIZE, offset=offset)
+        page_ids = page.get('ids') or []
+        ids.extend(page_ids)
+        questions.extend(page['documents'])
+        vectors.extend(page['embeddings'])
+        if len(page_ids) < utils.CHROMA_BATCH_SIZE:
+            break
+        offset += len(page_ids)
+    return ids, questions, np.asarray(vectors, dtype=np.float32)
+
+
+def dedup_report(company: str, threshold: float = DEFAULT_THRESHOLD, block_size: int = DEFAULT_BLOCK_SIZE) -> dict:
+    ids, questions, embeddings = load_collection_embeddings(utils.get_or_create_collection(company))
+    pairs = {}
+    for i, j, similarity in iter_similar_pairs(embeddings, threshold, block_size):
+        pairs[(i, j)] = similarity
+    clusters = [{'members': members, 'similarities': []} for members in cluster_pairs(len(ids), pairs)]
+    cluster_of = {member: cluster for cluster in clusters for member in cluster['members']}
+    for (i, _), similarity in pairs.items():
+        cluster_of[i]['similarities'].append(similarity)
+    clusters = [{
+        'size': len(cluster['members']),
+        'max_similarity': round(max(cluster['similarities']), 4),
+        'min_similarity': round(min(cluster['similarities']), 4),
+        'items': [{'id': ids[m], 'question': questions[m]} for m in cluster['members']],
+    } for cluster in clusters]
+    clusters.sort(key=lambda cluster: (-cluster['size'], -cluster['max_similarity']))
+    return {
+        'company': company,
+        'threshold': threshold,
+        'items': len(ids),
+        'similar_pairs': len(pairs),
+        'clusters': len(clusters),
+        'redundant_items': sum(cluster['size'] - 1 for cluster in clusters),
+        'cluster_details': clusters,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.dedup", description="Report clusters of near-duplicate questions.")
+    parser.add_argument('--company', required=True)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="Cosine similarity threshold")
+    parser.add_argument('--block-size', type=int, default=DEFAULT_BLOCK_SIZE, help="Rows per similarity tile")
+    parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = dedup_report(args.company, threshold=args.threshold, block_size=args.block_size)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"{report['clusters']} clusters ({report['redundant_items']} redundant items) written to {args.output}")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""Persistent on-disk embedding cache.
+
+Embeddings are stored in a memory-mapped matrix, one row per text, next to a
+matrix of row keys (sha256 of model name and text) and a last-use tick per
+row for LRU eviction:
+
+    <cache_dir>/<model_name>/header.i64   [rows used, LRU clock]
+                              keys.u8      (capacity, 32) sha256 digests
+                              ticks.i64    (capacity,)    last use
+                              vectors.f32  (capacity, dim) or vectors.f16
+
+Each process keeps a digest -> row dict for the rows it knows about. Writers
+take an flock on the cache directory, and row allocation goes through the
+shared header, so several gunicorn workers can share one cache. A row that
+another process evicted is detected because its stored key no longer matches,
+and is treated as a miss. Readers do not take the file lock, so a row is
+rewritten seqlock-style: its key is zeroed, then the vector is written, then
+the new key. A reader checks the key again after copying the vector and
+treats a change as a miss. The dim, capacity and dtype in meta.json win over
+the constructor's; a vector of another dim is refused.
+
+`CachedEmbeddingFunction` wraps the sentence-transformer embedding function
+used by get_or_create_collection. It is a drop-in for Chroma: only the texts
+that miss the cache reach the model, in one batch.
+"""
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from app.file_lock import file_lock
+
+DIGEST_SIZE = 32
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: str, model_name: str, capacity: int = 100_000, dtype: str = 'float32'):
+        self.model_name = model_name
+        self.path = os.path.join(cache_dir, model_name.replace('/', '__'))
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._rows = {} # digest -> row
+        self._known_rows = 0 # rows of the shared matrix already indexed into _rows
+        self._header = self._keys = self._ticks = self._vectors = None
+        os.makedirs(self.path, exist_ok=True)
+        if os.path.exists(os.path.join(self.path, 'meta.json')):
+            self._open()
+
+    def key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode('utf-8')).digest()
+
+    def _open(self, dim: int = None):
+        meta_path = os.path.join(self.path, 'meta.json')
+        mode = 'r+' if os.path.exists(meta_path) else 'w+'
+        if mode == 'r+': # created by us earlier or by another process: its layout is the one on disk
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if dim is not None and dim != meta['dim']:
+                raise ValueError(f"Embedding cache {self.path} holds {meta['dim']}-dim vectors, not {dim}-dim.")
+            if (meta['capacity'], meta['dtype']) != (self.capacity, self.dtype.name):
+                print(f"Embedding cache {self.path} uses capacity {meta['capacity']} and {meta['dtype']} from its meta.json.")
+            dim, self.capacity, self.dtype = meta['dim'], meta['capacity'], np.dtype(meta['dtype'])
+        self._header = np.memmap(os.path.join(self.path, 'header.i64'), dtype=np.int64, mode=mode, shape=(2,))
+        self._keys = np.memmap(os.path.join(self.path, 'keys.u8'), dtype=np.uint8, mode=mode, shape=(self.capacity, DIGEST_SIZE))
+        self._ticks = np.memmap(os.path.join(self.path, 'ticks.i64'), dtype=np.int64, mode=mode, shape=(self.capacity,))
+        vectors_name = 'vectors.f16' if self.dtype == np.float16 else 'vectors.f32'
+        self._vectors = np.memmap(os.path.join(self.path, vectors_name), dtype=self.dtype, mode=mode, shape=(self.capacity, dim))
+        if mode == 'w+':
+            with open(meta_path, 'w') as f:
+                json.dump({'dim': dim, 'capacity': self.capacity, 'dtype': self.dtype.name, 'model_name': self.model_name}, f)
+        self._index_new_rows()
+
+    def _index_new_rows(self):
+        used = int(self._header[0])
+        for row in range(self._known_rows, used):
+            self._rows[self._keys[row].tobytes()] = row
+        self._known_rows = used
+
+    def _file_lock(self):
+        return file_lock(os.path.join(self.path, 'lock'))
+
+    def get_many(self, texts: list[str]) -> list:
+        """Cached vectors (float32 arrays) for the texts, with None for misses."""
+        results = [None] * len(texts)
+        with self._lock:
+            if self._vectors is None:
+                self.misses += len(texts)
+                return results
+            if int(self._header[0]) > self._known_rows:
+                self._index_new_rows()
+            clock = int(self._header[1])
+            for i, text in enumerate(texts):
+                digest = self.key(text)
+                row = self._rows.get(digest)
+                if row is not None and self._keys[row].tobytes() == digest:
+                    vector = np.array(self._vectors[row], dtype=np.float32)
+                    if self._keys[row].tobytes() != digest: # rewritten by another process while we copied
+                        self.misses += 1
+                        continue
+                    results[i] = vector
+                    clock += 1
+                    self._ticks[row] = clock
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            self._header[1] = clock
+        return results
+
+    def put_many(self, texts: list[str], vectors) -> None:
+        if not texts or self.capacity <= 0:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock, self._file_lock():
+            if self._vectors is None:
+                self._open(dim=vectors.shape[1])
+            elif vectors.shape[1] != self._vectors.shape[1]:
+                raise ValueError(f"Embedding cache {self.path} holds {self._vectors.shape[1]}-dim vectors, not {vectors.shape[1]}-dim.")
+            self._index_new_rows()
+            used = int(self._header[0])
+            free = self.capacity - used
+            wanted = min(len(texts), self.capacity)
+            texts, vectors = texts[-wanted:], vectors[-wanted:]
+
+            rows = list(range(used, used + min(free, wanted)))
+            if len(rows) < wanted:
+                # Evict the least recently used rows of the full part of the matrix.
+                evict = wanted - len(rows)
+                victims = np.argpartition(self._ticks[:used], evict - 1)[:evict] if evict < used else np.arange(used)
+                for row in victims:
+                    self._rows.pop(self._keys[row].tobytes(), None)
+                rows.extend(int(row) for row in victims)
+                self.evictions += evict
+
+            clock = int(self._header[1])
+            for row, text, vector in zip(rows, texts, vectors):
+                digest = self.key(text)
+                self._keys[row] = 0 # readers see a miss until the new key is in place
+                self._vectors[row] = vector
+                self._keys[row] = np.frombuffer(digest, dtype=np.uint8)
+                clock += 1
+                self._ticks[row] = clock
+                self._rows[digest] = row
+            self._header[0] = min(self.capacity, used + len(texts))
+            self._header[1] = clock
+            self._known_rows = int(self._header[0])
+
+    def flush(self):
+        with self._lock:
+            for array in (self._header, self._keys, self._ticks, self._vectors):
+                if array is not None:
+                    array.flush()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'model_name': self.model_name,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'evictions': self.evictions,
+            'size': int(self._header[0]) if self._header is not None else 0,
+            'capacity': self.capacity,
+        }
+
+
+class EmbeddingFunctionWrapper:
+    """Base for embedding functions that wrap another one.
+
+    It reports the wrapped function's name and config to Chroma, so existing
+    collections see the same embedding function as before.
+    """
+
+    def __init__(self, embedding_function):
+        self.embedding_function = embedding_function
+
+    def __call__(self, input):
+        return self.embedding_function(input)
+
+    def embed_query(self, input):
+        return self(input)
+
+    def name(self):
+        return self.embedding_function.name()
+
+    def get_config(self):
+        return self.embedding_function.get_config()
+
+    def build_from_config(self, config):
+        return self.embedding_function.build_from_config(config)
+
+    def is_legacy(self):
+        return self.embedding_function.is_legacy()
+
+    def default_space(self):
+        return self.embedding_function.default_space()
+
+    def supported_spaces(self):
+        return self.embedding_function.supported_spaces()
+
+    def validate_config_update(self, old_config, new_config):
+        return self.embedding_function.validate_config_update(old_config, new_config)
+
+    @staticmethod
+    def validate_config(config):
+        return None
+
+
+class CachedEmbeddingFunction(EmbeddingFunctionWrapper):
+    """Embedding function that serves repeated texts from an EmbeddingCache."""
+
+    def __init__(self, embedding_function, cache: EmbeddingCache):
+        super().__init__(embedding_function)
+        self.cache = cache
+
+    def __call__(self, input):
+        texts = list(input)
+        vectors = self.cache.get_many(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Embed each distinct missing text once
+            distinct = list(dict.fromkeys(texts[i] for i in missing))
+            computed = [np.asarray(vector, dtype=np.float32) for vector in self.embedding_function(distinct)]
+            self.cache.put_many(distinct, computed)
+            by_text = dict(zip(distinct, computed))
+            for i in missing:
+                vectors[i] = by_text[texts[i]]
+        return vectors
@@ -0,0 +1,312 @@
+"""Shared embedding service: `python -m app.embedding_server [--socket PATH] [--model NAME]`.
+
+Each gunicorn worker normally loads its own copy of the sentence-transformer
+model and the torch runtime. With EMBEDDING_SERVER_SOCKET set, workers use
+`EmbeddingServerClient` instead: a thin embedding function that sends texts
+to this one process over a Unix domain socket. The model then lives in
+memory once per box instead of once per worker. Calls from all workers are
+micro-batched into shared forward passes by the server's coalescer
+(app/coalescer.py). The worker-side embedding cache still sits in front of
+the client.
+
+Protocol: every message is a header `!4sBI` (magic b"EMB1", op or status,
+payload length) followed by the payload.
+
+    embed request   op 1, payload `!I` n, n × `!I` UTF-8 lengths, the UTF-8 texts
+    info request    op 2, empty payload
+    embed response  status 0, payload `!II` rows, dim, rows × dim little-endian float32
+    info response   status 0, payload JSON {'model_name', 'name', 'config', 'default_space', 'supported_spaces'}
+    error response  status 1, payload the UTF-8 error message
+
+A connection carries any number of requests, one at a time.
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import numpy as np
+
+MAGIC = b"EMB1"
+HEADER = struct.Struct("!4sBI")
+OP_EMBED = 1
+OP_INFO = 2
+STATUS_OK = 0
+STATUS_ERROR = 1
+MAX_PAYLOAD = 64 * 1024 * 1024 # Bytes; larger requests are refused
+CLIENT_BATCH_SIZE = 256 # Texts per embed request; larger calls are split
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def _recv_exactly(sock, size: int) -> bytes:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ConnectionError("embedding server connection closed")
+        received += count
+    return bytes(buffer)
+
+
+def _send_message(sock, code: int, payload: bytes = b""):
+    sock.sendall(HEADER.pack(MAGIC, code, len(payload)) + payload)
+
+
+def _recv_message(sock):
+    """Returns (op or status, payload), or None if the peer closed the connection between messages."""
+    first = sock.recv(HEADER.size)
+    if not first:
+        return None
+    header = first + _recv_exactly(sock, HEADER.size - len(first)) if len(first) < HEADER.size else first
+    magic, code, length = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ProtocolError("bad magic")
+    if length > MAX_PAYLOAD:
+        raise ProtocolError(f"payload of {length} bytes exceeds {MAX_PAYLOAD}")
+    return code, _recv_exactly(sock, length)
+
+
+def encode_texts(texts: list) -> bytes:
+    encoded = [text.encode('utf-8') for text in texts]
+    return struct.pack(f"!I{len(encoded)}I", len(encoded), *(len(data) for data in encoded)) + b"".join(encoded)
+
+
+def decode_texts(payload: bytes) -> list:
+    (count,) = struct.unpack_from("!I", payload)
+    lengths = struct.unpack_from(f"!{count}I", payload, 4)
+    offset = 4 + 4 * count
+    if offset + sum(lengths) != len(payload):
+        raise ProtocolError("text lengths do not match the payload")
+    texts = []
+    for length in lengths:
+        texts.append(payload[offset:offset + length].decode('utf-8'))
+        offset += length
+    return texts
+
+
+def encode_vectors(vectors) -> bytes:
+    matrix = np.asarray(vectors, dtype='<f4')
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(len(vectors), -1)
+    return struct.pack("!II", *matrix.shape) + matrix.tobytes()
+
+
+def decode_vectors(payload: bytes) -> np.ndarray:
+    rows, dim = struct.unpack_from("!II", payload)
+    return np.frombuffer(payload, dtype='<f4', count=rows * dim, offset=8).reshape(rows, dim).astype(np.float32)
+
+
+def model_info(embedding_function, model_name: str) -> dict:
+    """What clients report to Chroma, so collections see the server's embedding function."""
+    info = {'model_name': model_name, 'name': None, 'config': None, 'default_space': None, 'supported_spaces': None}
+    for key in ('name', 'get_config', 'default_space', 'supported_spaces'):
+        method = getattr(embedding_function, key, None)
+        if method is not None:
+            try:
+                info[key.replace('get_', '')] = method()
+            except Exception:
+                pass
+    return info
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def setup(self):
+        with self.server.connections_lock:
+            self.server.connections.add(self.request)
+
+    def finish(self):
+        with self.server.connections_lock:
+            self.server.connections.discard(self.request)
+
+    def handle(self):
+        server = self.server
+        while True:
+            try:
+                message = _recv_message(self.request)
+            except (ConnectionError, ProtocolError, OSError):
+                return
+            if message is None:
+                return
+            op, payload = message
+            try:
+                if op == OP_EMBED:
+                    texts = decode_texts(payload)
+                    response = encode_vectors(server.embedding_function(texts)) if texts else struct.pack("!II", 0, 0)
+                elif op == OP_INFO:
+                    response = json.dumps(server.info).encode('utf-8')
+                else:
+                    raise ProtocolError(f"unknown op {op}")
+            except Exception as e:
+                _send_message(self.request, STATUS_ERROR, f"{type(e).__name__}: {e}".encode('utf-8'))
+                continue
+            _send_message(self.request, STATUS_OK, response)
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128 # connections from every worker thread may arrive at once
+
+    def __init__(self, socket_path: str, embedding_function, model_name: str):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path) # left behind by a server that did not shut down cleanly
+        self.embedding_function = embedding_function
+        self.info = model_info(embedding_function, model_name)
+        self.connections = set()
+        self.connections_lock = threading.Lock()
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o660)
+
+    def server_close(self):
+        super().server_close()
+        with self.connections_lock:
+            for connection in self.connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+class EmbeddingServerClient:
+    """Embedding function that embeds through an EmbeddingServer.
+
+    Each thread keeps its own connection, reopened after a fork or a dropped
+    connection. It reports the server model's name and config to Chroma.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 30.0, batch_size: int = CLIENT_BATCH_SIZE):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._info = None
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'sock', None) is None or local.pid != os.getpid():
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            local.sock, local.pid = sock, os.getpid()
+        return local.sock
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            sock.close()
+        self._local.sock = None
+
+    def _request(self, op: int, payload: bytes = b"") -> bytes:
+        for attempt in range(2):
+            reused = getattr(self._local, 'sock', None) is not None
+            try:
+                sock = self._connection()
+                _send_message(sock, op, payload)
+                message = _recv_message(sock)
+                if message is None:
+                    raise ConnectionError("embedding server connection closed")
+            except (OSError, ProtocolError):
+                self._close()
+                # A pooled connection may have been closed by a server restart: retry once on a new one.
+                if attempt or not reused:
+                    raise
+                continue
+            status, response = message
+            if status != STATUS_OK:
+                raise RuntimeError(f"Embedding server error: {response.decode('utf-8', 'replace')}")
+            return response
+
+    def __call__(self, input):
+        texts = list(input)
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(decode_vectors(self._request(OP_EMBED, encode_texts(texts[start:start + self.batch_size]))))
+        return vectors
+
+    def embed_query(self, input):
+        return self(input)
+
+    def info(self) -> dict:
+        if self._info is None:
+            self._info = json.loads(self._request(OP_INFO))
+        return self._info
+
+    def wait_ready(self, timeout: float) -> dict:
+        """Polls until the server answers (it may still be loading the model); returns its info."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self.info()
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.1)
+
+    @property
+    def model_name(self) -> str:
+        return self.info()['model_name']
+
+    def name(self):
+        return self.info()['name'] or "embedding_server"
+
+    def get_config(self):
+        return self.info()['config'] or {'model_name': self.model_name}
+
+    def is_legacy(self):
+        return False
+
+    def default_space(self):
+        return self.info()['default_space'] or "l2"
+
+    def supported_spaces(self):
+        return self.info()['supported_spaces'] or ["cosine", "l2", "ip"]
+
+    def build_from_config(self, config):
+        return self
+
+    def validate_config_update(self, old_config, new_config):
+        return None
+
+    @staticmethod
+    def validate_config(config):
+        return None
+
+
+def main(argv=None):
+    from app import utils
+    parser = argparse.ArgumentParser(prog="python -m app.embedding_server", description="Serve query and document embeddings to all workers over a Unix socket.")
+    parser.add_argument('--socket', default=utils.EMBEDDING_SERVER_SOCKET or "app/data/embedding.sock", help="Unix socket path")
+    parser.add_argument('--model', default=utils.DEFAULT_EMBEDDING_MODEL, help="Sentence-transformer model name")
+    args = parser.parse_args(argv)
+
+    from chromadb.utils import embedding_functions
+    started = time.perf_counter()
+    model = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=args.model)
+    server = EmbeddingServer(args.socket, utils.coalesced_embedding_function(model), args.model)
+    print(f"Loaded {args.model} in {time.perf_counter() - started:.1f}s; serving embeddings on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+"""Offline bulk ingest of a Q&A source into a company's ChromaDB collection.
+
+    python -m app.ingest --company Tallman [--source path] [--format txt|json|ndjson]
+                         [--batch-size 256] [--upsert-size 1000] [--workers 4]
+                         [--skip-existing] [--restart]
+
+The source is streamed record by record (`*_QA.txt` through the mmap parser
+and NDJSON in constant memory; a JSON array is parsed in one go). Questions
+are embedded in batches across a process pool, and each worker loads its own
+copy of the model behind the shared on-disk embedding cache, so re-indexing
+unchanged text skips inference. The results are upserted in bounded chunks
+together with their precomputed embeddings. After every upserted chunk a checkpoint
+(records and bytes committed) is written, so an interrupted run resumes after
+the last committed record. It refuses to resume if the source no longer
+matches the checkpoint. Records from a source other than the company's own
+`*_QA.txt` file are also appended to that file (under its lock, with their
+`##Update##` markers), which stays the source of truth for the startup sync;
+their IDs are minted from that file's QAIndex as they are appended. The
+checkpoint notes how far each append reaches before it is written, so a run
+that crashed between the append and the next checkpoint does not append those
+records again on resume: records of that window whose pair is already live in
+the file are upserted under the existing IDs instead.
+
+Corrections win as everywhere else: a pair superseded by a later
+`##Update##` of the same question is not embedded, and its vector is deleted.
+"""
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from app import qa_parser, utils
+from app.models import QA
+
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_UPSERT_SIZE = utils.CHROMA_BATCH_SIZE
+
+
+def detect_format(source: str) -> str:
+    extension = os.path.splitext(source)[1].lower()
+    if extension in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    if extension == '.json':
+        return 'json'
+    return 'txt'
+
+
+def _qa_from_record(record, company: str, position: int) -> QA:
+    if not isinstance(record, dict) or not isinstance(record.get('question'), str) or not isinstance(record.get('answer'), str):
+        raise ValueError(f"Record {position}: expected an object with string 'question' and 'answer' keys.")
+    return QA(question=record['question'], answer=record['answer'], company=company,
+              is_update=bool(record.get('is_update', False)))
+
+
+def _iter_raw_source(source: str, company: str, fmt: str):
+    """Yields (QA without ID, byte offset just past the record) from the source; the offset is None for JSON arrays."""
+    if fmt == 'txt':
+        for record in qa_parser.iter_qa_records(source):
+            yield QA(question=record.question, answer=record.answer, company=company,
+                     is_update=record.is_update), record.end_offset
+    elif fmt == 'ndjson':
+        with open(source, 'rb') as f:
+            offset = 0
+            for n, line in enumerate(f, 1):
+                offset += len(line)
+                if line.strip():
+                    yield _qa_from_record(json.loads(line), company, n), offset
+    elif fmt == 'json':
+        with open(source, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, list):
+            raise ValueError("JSON source must be a list of Q&A objects.")
+        for n, record in enumerate(data, 1):
+            yield _qa_from_record(record, company, n), None
+    else:
+        raise ValueError(f"Unsupported source format: {fmt}")
+
+
+def iter_source(source: str, company: str, fmt: str = None):
+    """Yields (QA with stable ID, end offset) pairs for the source's records, in order.
+
+    The IDs are numbered within the source itself, so for the company's own
+    KB file they are its KB IDs.
+    """
+    occurrences = {}
+    for qa_item, end_offset in _iter_raw_source(source, company, fmt or detect_format(source)):
+        yield utils.set_stable_qa_id(qa_item, occurrences), end_offset
+
+
+def default_checkpoint_path(source: str, company: str) -> str:
+    return f"{source}.{company.lower()}.ingest-checkpoint.json"
+
+
+def load_checkpoint(path: str) -> dict:
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_checkpoint(path: str, checkpoint: dict) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+# Process pool workers each hold their own embedding function.
+_worker_embedding_function = None
+
+def _init_worker(model_name: str):
+    global _worker_embedding_function
+    from chromadb.utils import embedding_functions
+    _worker_embedding_function = utils.cached_embedding_function(
+        embedding_functions.SentenceTransformerEmbeddingFunction(model_name=model_name), model_name
+    )
+
+def _embed_in_worker(texts: list[str]):
+    return [list(map(float, vector)) for vector in _worker_embedding_function(texts)]
+
+
+class _InlineExecutor:
+    """Executor stand-in that embeds in the current process (--workers 0)."""
+
+    def __init__(self, embedding_function):
+        self.embedding_function = embedding_function
+
+    def submit(self, fn, texts):
+        future = Future()
+        future.set_result(self.embedding_function(texts))
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def _iter_batches(records, batch_size: int, consumed: int, offset: int, skip):
+    """Groups records into embedding batches, each tagged with the source position it reaches.
+
+    The position is (records consumed, byte offset just past the last one).
+    Records for which `skip(qa_item, record_number)` is true are consumed but
+    not batched (record numbers start at 1).
+    """
+    batch = []
+    last_yielded = consumed
+    for qa_item, end_offset in records:
+        consumed += 1
+        offset = end_offset
+        if not skip(qa_item, consumed):
+            batch.append(qa_item)
+        if len(batch) >= batch_size:
+            yield batch, (consumed, offset)
+            batch = []
+            last_yielded = consumed
+    if batch or consumed != last_yielded:
+        yield batch, (consumed, offset)
+
+
+def _append_to_kb_file(company: str, qa_items: list[QA], vectors: list) -> tuple[list[QA], list, set]:
+    """Appends the pairs to the company's KB file and returns (live pairs with KB IDs, their vectors, stale IDs).
+
+    Pairs superseded within the batch are dropped; the stale IDs are earlier
+    pairs of the file that the batch's corrections superseded.
+    """
+    new_items, superseded = utils.write_qa_pairs(company, [(qa_item.question, qa_item.answer, qa_item.is_update)
+                                                           for qa_item in qa_items])
+    superseded_ids = {qa_item.id for qa_item in superseded}
+    live = [position for position, qa_item in enumerate(new_items) if qa_item.id not in superseded_ids]
+    stale_ids = superseded_ids - {qa_item.id for qa_item in new_items}
+    return [new_items[position] for position in live], [vectors[position] for position in live], stale_ids
+
+
+def _is_live_pair(index, qa_item: QA) -> bool:
+    return any(match.answer.strip() == qa_item.answer.strip() for match in index.lookup(qa_item.question))
+
+
+def ingest(company: str, source: str = None, fmt: str = None, batch_size: int = DEFAULT_BATCH_SIZE,
+           upsert_size: int = DEFAULT_UPSERT_SIZE, workers: int = 0, checkpoint_path: str = None,
+           restart: bool = False, skip_existing: bool = False, progress=print) -> dict:
+    """Embeds and upserts `source` into the company's collection. Returns throughput statistics."""
+    kb_filepath = utils.get_qa_filepath(company)
+    source = source or kb_filepath
+    append_to_kb = os.path.abspath(source) != os.path.abspath(kb_filepath)
+    checkpoint_path = checkpoint_path or default_checkpoint_path(source, company)
+
+    checkpoint = {} if restart else load_checkpoint(checkpoint_path)
+    if checkpoint and checkpoint.get('source') != os.path.abspath(source):
+        raise ValueError(f"Checkpoint {checkpoint_path} belongs to a different source; use --restart to discard it.")
+    start_record = checkpoint.get('records_done', 0)
+    appended_until = checkpoint.get('appending_until', 0) # records a crashed run may already have appended
+    if start_record:
+        progress(f"Resuming {company} ingest after record {start_record}.")
+
+    embedding_function = utils.get_embedding_function()
+    if embedding_function is None:
+        raise RuntimeError("SentenceTransformerEmbeddingFunction not initialized. Cannot ingest.")
+    collection = utils.get_or_create_collection(company)
+    existing_ids = utils.get_collection_ids(collection) if skip_existing and not append_to_kb else set()
+    stats = {'company': company, 'source': source, 'resumed_from': start_record, 'records_done': start_record,
+             'embedded': 0, 'skipped_existing': 0, 'superseded': 0, 'recovered': 0}
+    stale_ids = set()
+    recovered = set() # id() of records in flight that a crashed run already appended to the KB file
+    last_checkpoint = {'source': os.path.abspath(source), 'company': company,
+                       'records_done': start_record, 'offset': checkpoint.get('offset')}
+
+    if append_to_kb:
+        # Source records get their IDs when appended; "existing" means already live in the KB file.
+        claimed_ids = set()
+
+        def skip(qa_item, record_number):
+            if skip_existing and _is_live_pair(utils.get_qa_index(company), qa_item):
+                stats['skipped_existing'] += 1
+                return True
+            if record_number <= appended_until:
+                # Appended before the crash: reuse the pair in the file rather than appending a copy.
+                for match in utils.get_qa_index(company).lookup(qa_item.question):
+                    if match.answer.strip() == qa_item.answer.strip() and match.id not in claimed_ids:
+                        qa_item.id = match.id
+                        claimed_ids.add(match.id)
+                        recovered.add(id(qa_item))
+                        stats['recovered'] += 1
+                        break
+            return False
+    else:
+        live_ids = {qa_item.id for qa_item in utils.load_qa_data(company)}
+
+        def skip(qa_item, record_number):
+            if qa_item.id not in live_ids: # superseded by a later ##Update## in the file
+                stale_ids.add(qa_item.id)
+                return True
+            if qa_item.id in existing_ids:
+                stats['skipped_existing'] += 1
+                return True
+            return False
+
+    records = iter_source(source, company, fmt)
+    start_offset = None
+    for _ in range(start_record):
+        # Skipped records are still parsed (but not embedded) so that duplicate
+        # occurrence numbers, and so IDs, stay stable.
+        _, start_offset = next(records, (None, None))
+    if start_record and start_offset != checkpoint.get('offset'):
+        raise ValueError(f"{source} changed since checkpoint {checkpoint_path} was written; use --restart.")
+
+    if workers > 0:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(utils.DEFAULT_EMBEDDING_MODEL,))
+        embed = _embed_in_worker
+    else:
+        executor = _InlineExecutor(embedding_function)
+        embed = None
+    max_in_flight = max(1, workers) * 2
+
+    started = time.perf_counter()
+    pending = deque()
+    buffer_items, buffer_vectors = [], []
+
+    def flush(position: tuple):
+        records_done, offset = position
+        items, vectors = buffer_items, buffer_vectors
+        if append_to_kb:
+            new_positions = [position for position, qa_item in enumerate(buffer_items) if id(qa_item) not in recovered]
+            recovered.difference_update(id(qa_item) for qa_item in buffer_items)
+        if append_to_kb and new_positions:
+            # Written first: if the upsert fails, the startup sync still picks the pairs up from the file.
+            save_checkpoint(checkpoint_path, {**last_checkpoint, 'appending_until': records_done})
+            appended, appended_vectors, superseded_ids = _append_to_kb_file(
+                company, [buffer_items[position] for position in new_positions],
+                [buffer_vectors[position] for position in new_positions])
+            new_set = set(new_positions)
+            items = [qa_item for position, qa_item in enumerate(buffer_items) if position not in new_set] + appended
+            vectors = [vector for position, vector in enumerate(buffer_vectors) if position not in new_set] + appended_vectors
+            stale_ids.update(superseded_ids)
+            stats['superseded'] += len(new_positions) - len(appended)
+        for start in range(0, len(items), upsert_size):
+            chunk = items[start:start + upsert_size]
+            collection.upsert(
+                ids=[qa_item.id for qa_item in chunk],
+                documents=[qa_item.question for qa_item in chunk],
+                metadatas=[qa_item.to_dict() for qa_item in chunk],
+                embeddings=vectors[start:start + upsert_size]
+            )
+        delete_stale()
+        stats['embedded'] += len(buffer_items)
+        stats['records_done'] = records_done
+        buffer_items.clear()
+        buffer_vectors.clear()
+        last_checkpoint.update(records_done=records_done, offset=offset)
+        save_checkpoint(checkpoint_path, last_checkpoint)
+        elapsed = time.perf_counter() - started
+        progress(f"{company}: {records_done} records committed, {stats['embedded'] / elapsed if elapsed else 0:.1f} pairs/sec")
+
+    def delete_stale():
+        if not stale_ids:
+            return
+        ids = sorted(stale_ids)
+        for start in range(0, len(ids), upsert_size):
+            collection.delete(ids=ids[start:start + upsert_size])
+        stats['superseded'] += len(stale_ids)
+        stale_ids.clear()
+
+    def drain_one():
+        future, batch, position = pending.popleft()
+        if batch:
+            buffer_items.extend(batch)
+            buffer_vectors.extend(future.result())
+        if len(buffer_items) >= upsert_size:
+            flush(position)
+
+    position = (start_record, start_offset)
+    try:
+        for batch, batch_position in _iter_batches(records, batch_size, start_record, start_offset, skip):
+            position = batch_position
+            texts = [qa_item.question for qa_item in batch]
+            future = executor.submit(embed, texts) if batch else None
+            pending.append((future, batch, position))
+            while len(pending) >= max_in_flight:
+                drain_one()
+        while pending:
+            drain_one()
+        flush(position)
+    finally:
+        executor.shutdown(wait=True)
+
+    elapsed = time.perf_counter() - started
+    stats['seconds'] = round(elapsed, 3)
+    stats['pairs_per_second'] = round(stats['embedded'] / elapsed, 1) if elapsed else 0.0
+    os.remove(checkpoint_path)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.ingest", description="Bulk-ingest a Q&A source into ChromaDB.")
+    parser.add_argument('--company', required=True)
+    parser.add_argument('--source', help="Q&A source file (defaults to the company's *_QA.txt)")
+    parser.add_argument('--format', choices=['txt', 'json', 'ndjson'], help="Source format (guessed from the extension)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Questions per embedding call")
+    parser.add_argument('--upsert-size', type=int, default=DEFAULT_UPSERT_SIZE, help="Items per Chroma upsert")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Embedding processes (0 embeds in-process)")
+    parser.add_argument('--checkpoint', help="Checkpoint file (defaults to <source>.<company>.ingest-checkpoint.json)")
+    parser.add_argument('--skip-existing', action='store_true', help="Do not re-embed IDs already in the collection")
+    parser.add_argument('--restart', action='store_true', help="Ignore any existing checkpoint")
+    args = parser.parse_args(argv)
+
+    stats = ingest(
+        args.company, source=args.source, fmt=args.format, batch_size=args.batch_size,
+        upsert_size=args.upsert_size, workers=args.workers, checkpoint_path=args.checkpoint,
+        restart=args.restart, skip_existing=args.skip_existing
+    )
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""In-process background jobs for long-running admin work (bulk Q&A uploads).
+
+A job is queued on a small thread pool and its ID returned straight away, so a
+large upload no longer ties up a web worker past proxy and gunicorn timeouts.
+The task reports progress through its Job (`advance`, `add_error`,
+`fail_items`), and calls `check_cancelled()` between chunks. A job whose
+task returns normally ends `succeeded`. If some of its items failed, it ends
+`partial`, and if all of them failed, `failed`. `/admin/jobs/<id>` serves
+`Job.snapshot()`.
+
+Jobs live in the memory of the worker process that accepted them, so a
+status poll has to reach the same process (one gunicorn worker, or sticky
+sessions), and jobs do not survive a restart.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+MAX_FINISHED_JOBS = 100 # Finished jobs kept for polling; the oldest are dropped first
+MAX_REPORTED_ERRORS = 1000 # Per-item errors kept per job (the total is always counted)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind: str, total: int = 0, **details):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.details = details
+        self.total = total
+        self.processed = 0
+        self.errors = []
+        self.error_count = 0
+        self.failed_items = 0
+        self.status = 'queued' # queued -> running -> succeeded | partial | failed | cancelled
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+    def advance(self, count: int = 1):
+        with self._lock:
+            self.processed += count
+
+    def add_error(self, message: str):
+        with self._lock:
+            self.error_count += 1
+            if len(self.errors) < MAX_REPORTED_ERRORS:
+                self.errors.append(message)
+
+    def fail_items(self, count: int, message: str):
+        """Records `count` items as processed but failed, with one error message for them."""
+        with self._lock:
+            self.processed += count
+            self.failed_items += count
+        self.add_error(message)
+
+    def _outcome(self) -> str:
+        with self._lock:
+            if not self.failed_items:
+                return 'succeeded'
+            return 'failed' if self.failed_items >= self.processed else 'partial'
+
+    def cancel(self) -> bool:
+        """Asks the job to stop at its next checkpoint. Returns False if it has already finished."""
+        with self._lock:
+            if self.finished_at is not None:
+                return False
+            self._cancel.set()
+            return True
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def _start(self):
+        with self._lock:
+            self.status = 'running'
+            self.started_at = time.time()
+
+    def _finish(self, status: str, error: str = None, result=None):
+        with self._lock:
+            self.status = status
+            self.error = error
+            self.result = result
+            self.finished_at = time.time()
+        self._done.set()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            elapsed = None
+            if self.started_at is not None:
+                elapsed = (self.finished_at or time.time()) - self.started_at
+            return {
+                'job_id': self.id,
+                'kind': self.kind,
+                'status': self.status,
+                'cancel_requested': self._cancel.is_set(),
+                'total': self.total,
+                'processed': self.processed,
+                'progress': round(self.processed / self.total, 4) if self.total else None,
+                'items_per_second': round(self.processed / elapsed, 1) if elapsed else None,
+                'elapsed_seconds': round(elapsed, 3) if elapsed is not None else None,
+                'error': self.error,
+                'error_count': self.error_count,
+                'failed_items': self.failed_items,
+                'errors': list(self.errors),
+                'result': self.result,
+                **self.details,
+            }
+
+
+class JobManager:
+    def __init__(self, max_workers: int = MAX_WORKERS):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._executor = None
+        self._executor_pid = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # A pool inherited through fork has no threads, so each process makes its own.
+        if self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="qa-job")
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def submit(self, kind: str, fn, total: int = 0, **details) -> Job:
+        """Queues `fn(job)`; its return value becomes the job's result."""
+        job = Job(kind, total=total, **details)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+            self._get_executor().submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn):
+        if job.cancel_requested:
+            job._finish('cancelled')
+            return
+        job._start()
+        try:
+            result = fn(job)
+        except JobCancelled:
+            job._finish('cancelled')
+        except Exception as e:
+            print(f"Job {job.id} ({job.kind}) failed: {e}")
+            job._finish('failed', error=str(e))
+        else:
+            job._finish(job._outcome(), result=result)
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if job.finished_at is not None]
+        finished.sort(key=lambda job: job.finished_at)
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id: str) -> Job:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list[Job]:
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+
+manager = JobManager()
@@ -0,0 +1,165 @@
+"""BM25 keyword index over a company's Q&A pairs, fused with vector hits by reciprocal rank.
+
+Embedding search is weak on exact tokens such as part numbers, SKUs and
+product names; BM25 is strong on them. Each `QAIndex` owns a `BM25Index`,
+built on its first keyword search and then kept up to date as pairs are
+appended or superseded. `utils.query_collection` merges its ranking with the
+vector ranking using `reciprocal_rank_fusion`.
+
+Postings are kept per term as two typed arrays: document numbers (uint32)
+and term frequencies (uint16). A query reads only the postings of its own
+terms and scores them with NumPy, so its cost grows with those postings and
+not with the size of the KB. Superseded pairs are tombstoned. The postings
+are rewritten once tombstones outnumber the live pairs.
+"""
+import math
+import re
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+
+K1 = 1.2
+B = 0.75
+RRF_K = 60 # Rank offset of reciprocal-rank fusion (the usual constant from the RRF paper)
+MAX_DF_RATIO = 0.5 # Terms in more than this share of the pairs are skipped when the query has rarer ones
+COMPACT_MIN_DEAD = 1000
+
+_TOKEN_RE = re.compile(r"\w+(?:[-./]\w+)*")
+_PART_RE = re.compile(r"[-./_]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Case-folded word tokens. A compound such as "TM-4500/B" yields "tm4500b" plus its parts "tm", "4500", "b"."""
+    tokens = []
+    for match in _TOKEN_RE.finditer(text.casefold()):
+        parts = [part for part in _PART_RE.split(match.group()) if part]
+        if len(parts) > 1:
+            tokens.append("".join(parts))
+        tokens.extend(parts)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K) -> list:
+    """Merges ranked key lists: each key scores sum(1 / (k + rank)). Ties keep first-seen order."""
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda key: -scores[key])
+
+
+class _Postings:
+    __slots__ = ('docs', 'freqs', 'live')
+
+    def __init__(self):
+        self.docs = array('I')
+        self.freqs = array('H')
+        self.live = 0 # live documents containing the term (document frequency)
+
+
+class BM25Index:
+    def __init__(self):
+        self._postings = {} # term -> _Postings
+        self._keys = [] # document number -> key
+        self._numbers = {} # key -> document number, live documents only
+        self._lengths = array('I')
+        self._alive = bytearray()
+        self._total_length = 0
+        # NumPy views of the arrays block resizing them, so searches and updates are serialized.
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._numbers)
+
+    def add(self, key, text: str):
+        """Indexes `text` under a key that is not in the index yet."""
+        with self._lock:
+            counts = Counter(tokenize(text))
+            number = len(self._keys)
+            self._keys.append(key)
+            self._numbers[key] = number
+            self._lengths.append(sum(counts.values()))
+            self._alive.append(1)
+            self._total_length += self._lengths[number]
+            for term, count in counts.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = _Postings()
+                postings.docs.append(number)
+                postings.freqs.append(min(count, 0xFFFF))
+                postings.live += 1
+
+    def remove(self, key, text: str):
+        """Drops the document indexed under `key`; `text` must be the text it was indexed with."""
+        with self._lock:
+            number = self._numbers.pop(key, None)
+            if number is None:
+                return
+            self._alive[number] = 0
+            self._total_length -= self._lengths[number]
+            for term in set(tokenize(text)):
+                self._postings[term].live -= 1
+            dead = len(self._keys) - len(self._numbers)
+            if dead >= COMPACT_MIN_DEAD and dead > len(self._numbers):
+                self._compact()
+
+    def search(self, query: str, limit: int = 10) -> list[tuple]:
+        """The `limit` best (key, score) pairs for the query, best first."""
+        with self._lock:
+            return self._search(query, limit)
+
+    def _search(self, query, limit):
+        live = len(self._numbers)
+        terms = [term for term in set(tokenize(query)) if term in self._postings and self._postings[term].live]
+        if not live or not terms or limit <= 0:
+            return []
+        rare = [term for term in terms if self._postings[term].live <= MAX_DF_RATIO * live]
+        terms = rare or terms
+        average_length = self._total_length / live
+        lengths = np.frombuffer(self._lengths, dtype=np.uintc)
+        alive = np.frombuffer(self._alive, dtype=np.bool_)
+        doc_parts, score_parts = [], []
+        for term in terms:
+            postings = self._postings[term]
+            idf = math.log(1.0 + (live - postings.live + 0.5) / (postings.live + 0.5))
+            docs = np.frombuffer(postings.docs, dtype=np.uintc)
+            freqs = np.frombuffer(postings.freqs, dtype=np.ushort).astype(np.float32)
+            norm = K1 * (1.0 - B + B * lengths[docs] / average_length)
+            doc_parts.append(docs)
+            score_parts.append(idf * freqs * (K1 + 1.0) / (freqs + norm))
+        docs = np.concatenate(doc_parts)
+        scores = np.concatenate(score_parts)
+        keep = alive[docs]
+        documents, inverse = np.unique(docs[keep], return_inverse=True)
+        if not len(documents):
+            return []
+        totals = np.bincount(inverse, weights=scores[keep])
+        count = min(limit, len(documents))
+        top = np.argpartition(-totals, count - 1)[:count]
+        top = top[np.argsort(-totals[top], kind='stable')]
+        return [(self._keys[documents[i]], float(totals[i])) for i in top]
+
+    def _compact(self):
+        """Renumbers the live documents and drops tombstoned postings."""
+        alive = np.frombuffer(self._alive, dtype=np.bool_).copy()
+        renumber = (np.cumsum(alive) - 1).astype(np.uintc)
+        for term in list(self._postings):
+            postings = self._postings[term]
+            if not postings.live:
+                del self._postings[term]
+                continue
+            docs = np.frombuffer(postings.docs, dtype=np.uintc)
+            keep = alive[docs]
+            compacted = _Postings()
+            compacted.docs.frombytes(renumber[docs[keep]].tobytes())
+            compacted.freqs.frombytes(np.frombuffer(postings.freqs, dtype=np.ushort)[keep].tobytes())
+            compacted.live = postings.live
+            self._postings[term] = compacted
+        lengths = array('I')
+        lengths.frombytes(np.frombuffer(self._lengths, dtype=np.uintc)[alive].tobytes())
+        self._lengths = lengths
+        self._keys = [key for key, is_alive in zip(self._keys, alive) if is_alive]
+        self._numbers = {key: number for number, key in enumerate(self._keys)}
+        self._alive = bytearray(b"\x01") * len(self._keys)
@@ -0,0 +1,261 @@
+"""HTTP client for the OpenAI-compatible chat completions API.
+
+It replaces the module-level `openai.ChatCompletion.create` calls, which had
+no timeout and no retry policy, so that one slow upstream response can no
+longer hold a worker thread indefinitely:
+
+- one pooled keep-alive HTTP connection pool per process (LLM_POOL_SIZE);
+- a connect deadline (LLM_CONNECT_TIMEOUT) and a read deadline between bytes
+  (LLM_READ_TIMEOUT) for every attempt;
+- retries of connection errors, timeouts, 429 and 5xx responses, up to
+  LLM_MAX_RETRIES, with exponential backoff and full jitter (a random wait
+  of up to LLM_BACKOFF_BASE * 2^attempt seconds, capped at LLM_BACKOFF_MAX).
+  A Retry-After header sets the minimum wait;
+- a deadline for the whole call, retries included (LLM_TOTAL_TIMEOUT). No
+  retry starts if its wait would run past the deadline.
+
+Before each attempt the client waits for admission from its rate limiter
+(app/rate_limiter.py), if it has one, and reports 429s and token usage back
+to it. With a circuit breaker (app/circuit_breaker.py), a call made while the
+upstream is known to be failing raises CircuitOpenError without trying.
+
+The endpoint and model are configurable (OPENAI_BASE_URL, LLM_MODEL), so any
+OpenAI-compatible server works, including the fake one used by the tests.
+The module imports httpx, so utils imports it on first LLM use. Calls,
+retries and failures are counted in app/metrics.py (llm.calls /
+.retries / .failures).
+"""
+import json
+import os
+import random
+import threading
+import time
+
+import httpx
+
+from app import metrics
+from app.rate_limiter import PRIORITY_INTERACTIVE, RateLimitTimeout, estimate_tokens
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class LLMError(RuntimeError):
+    """A chat completion failed for good (after any retries). `status` is the last HTTP status, if any."""
+
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+class _RetryableError(Exception):
+    def __init__(self, message: str, status: int = None, retry_after: float = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class LLMClient:
+    def __init__(self, api_key: str, base_url: str = "https://api.openai.com/v1", model: str = "gpt-3.5-turbo",
+                 connect_timeout: float = 5.0, read_timeout: float = 60.0, total_timeout: float = 90.0,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0, pool_size: int = 20,
+                 limiter=None, breaker=None):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self.limiter = limiter
+        self.breaker = breaker
+        self._http = None
+        self._http_pid = None
+        self._lock = threading.Lock()
+
+    def _client(self):
+        # Pooled connections must not be shared with a forked child (gunicorn --preload), so each process opens its own.
+        if self._http is None or self._http_pid != os.getpid():
+            with self._lock:
+                if self._http is None or self._http_pid != os.getpid():
+                    self._http = httpx.Client(
+                        base_url=self.base_url,
+                        headers={'Authorization': f"Bearer {self.api_key}"},
+                        timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout, pool=self.connect_timeout),
+                        limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                    )
+                    self._http_pid = os.getpid()
+        return self._http
+
+    def close(self):
+        with self._lock:
+            if self._http is not None and self._http_pid == os.getpid():
+                self._http.close()
+            self._http = None
+
+    def _backoff(self, attempt: int, retry_after: float = None) -> float:
+        wait = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            wait = max(wait, min(retry_after, self.backoff_max))
+        return wait
+
+    def _admit(self, tokens: int, priority: int, deadline: float):
+        if self.limiter is None:
+            return
+        try:
+            self.limiter.acquire(tokens, priority, deadline)
+        except RateLimitTimeout as e:
+            metrics.increment("llm.failures")
+            raise LLMError(str(e), 429) from e
+
+    def _release(self):
+        if self.limiter is not None:
+            self.limiter.release()
+
+    def _with_retries(self, attempt_call, tokens: int = 0, priority: int = PRIORITY_INTERACTIVE, hold: bool = False):
+        """Runs `attempt_call(deadline)` until it succeeds, fails for good, or the retries or deadline run out.
+
+        Each attempt first waits for the rate limiter. With `hold`, a
+        successful attempt keeps its limiter slot; the caller releases it.
+        The outcome is reported to the circuit breaker: any HTTP response
+        outside 429/5xx shows the upstream is up. Only the attempt itself is
+        timed for the slow-call check, not the queue wait or backoff sleeps.
+        Any other error after an attempt counts as a failure, and a call that
+        never got past the limiter hands a half-open probe back.
+        """
+        if self.breaker is not None:
+            self.breaker.before_call()
+        recorded = False # whether the breaker has been told the outcome of this call
+        admitted = False
+        try:
+            metrics.increment("llm.calls")
+            deadline = time.monotonic() + self.total_timeout
+            attempt = 0
+            while True:
+                admitted = False
+                self._admit(tokens, priority, deadline)
+                admitted = True
+                attempt_started = time.monotonic()
+                try:
+                    try:
+                        result = attempt_call(deadline)
+                    except BaseException:
+                        self._release()
+                        raise
+                    if self.limiter is not None:
+                        self.limiter.succeeded()
+                    if not hold:
+                        self._release()
+                    if self.breaker is not None:
+                        self.breaker.record_success(time.monotonic() - attempt_started)
+                    recorded = True
+                    return result
+                except (_RetryableError, httpx.TransportError) as e:
+                    status = getattr(e, 'status', None)
+                    message = str(e) or type(e).__name__
+                    if status == 429 and self.limiter is not None:
+                        self.limiter.rate_limited(getattr(e, 'retry_after', None))
+                    wait = self._backoff(attempt, getattr(e, 'retry_after', None))
+                    if attempt >= self.max_retries or time.monotonic() + wait >= deadline:
+                        metrics.increment("llm.failures")
+                        if self.breaker is not None:
+                            self.breaker.record_failure()
+                        recorded = True
+                        raise LLMError(f"LLM request failed after {attempt + 1} attempt(s): {message}", status) from e
+                    metrics.increment("llm.retries")
+                    time.sleep(wait)
+                    attempt += 1
+                except LLMError:
+                    metrics.increment("llm.failures")
+                    if self.breaker is not None:
+                        self.breaker.record_success(time.monotonic() - attempt_started)
+                    recorded = True
+                    raise
+        finally:
+            if self.breaker is not None and not recorded:
+                if admitted:
+                    self.breaker.record_failure() # e.g. an undecodable response
+                else:
+                    self.breaker.release_probe() # never reached the upstream (queue timeout)
+
+    def _timeout(self, deadline: float):
+        remaining = max(0.001, deadline - time.monotonic())
+        return httpx.Timeout(min(self.read_timeout, remaining), connect=min(self.connect_timeout, remaining),
+                             pool=min(self.connect_timeout, remaining))
+
+    def _payload(self, messages: list, model: str, params: dict) -> dict:
+        return {'model': model or self.model, 'messages': messages, **params}
+
+    @staticmethod
+    def _check(response):
+        if response.status_code in RETRY_STATUSES:
+            retry_after = response.headers.get('Retry-After')
+            try:
+                retry_after = float(retry_after) if retry_after is not None else None
+            except ValueError:
+                retry_after = None
+            raise _RetryableError(f"HTTP {response.status_code}: {response.text[:200]}", response.status_code, retry_after)
+        if response.status_code >= 400:
+            raise LLMError(f"HTTP {response.status_code}: {response.text[:200]}", response.status_code)
+
+    def chat(self, messages: list, model: str = None, priority: int = PRIORITY_INTERACTIVE, **params) -> str:
+        """The assistant message content of one chat completion."""
+        tokens = estimate_tokens(messages, params.get('max_tokens'))
+
+        def attempt(deadline):
+            response = self._client().post('/chat/completions', json=self._payload(messages, model, params),
+                                           timeout=self._timeout(deadline))
+            self._check(response)
+            try:
+                body = response.json()
+                content = body['choices'][0]['message']['content']
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                raise LLMError(f"Unexpected chat completion response: {e}", response.status_code) from e
+            if self.limiter is not None:
+                self.limiter.record_usage(tokens, (body.get('usage') or {}).get('total_tokens'))
+            return content
+        return self._with_retries(attempt, tokens, priority)
+
+    def stream_chat(self, messages: list, model: str = None, priority: int = PRIORITY_INTERACTIVE, **params):
+        """Yields the content deltas of a streamed chat completion.
+
+        Only the request is retried: once the response has started, a
+        failure raises LLMError, since part of the answer was already
+        yielded.
+        """
+        payload = {**self._payload(messages, model, params), 'stream': True}
+
+        def attempt(deadline):
+            context = self._client().stream('POST', '/chat/completions', json=payload, timeout=self._timeout(deadline))
+            response = context.__enter__()
+            try:
+                if response.status_code >= 400:
+                    response.read()
+                    self._check(response)
+            except BaseException:
+                context.__exit__(None, None, None)
+                raise
+            return context, response
+
+        context, response = self._with_retries(attempt, estimate_tokens(messages, params.get('max_tokens')), priority,
+                                               hold=True)
+        try:
+            for line in response.iter_lines():
+                if not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                delta = json.loads(data)['choices'][0].get('delta', {})
+                if delta.get('content'):
+                    yield delta['content']
+        except (httpx.TransportError, ValueError, KeyError, IndexError) as e:
+            metrics.increment("llm.failures")
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            raise LLMError(f"LLM stream interrupted: {str(e) or type(e).__name__}") from e
+        finally:
+            context.__exit__(None, None, None)
+            self._release()
@@ -0,0 +1,40 @@
+"""Process-wide counters, served as JSON by `/metrics`.
+
+Counters are plain named integers (e.g. `exact_match.hits`). `report()`
+returns them together with a hit ratio for every `<name>.hits` /
+`<name>.misses` pair. Each worker process keeps its own counters.
+"""
+import threading
+
+_counters = {}
+_lock = threading.Lock()
+
+
+def increment(name: str, amount: int = 1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def get(name: str) -> int:
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def hit_ratio(hits: int, misses: int) -> float:
+    return round(hits / (hits + misses), 4) if hits + misses else 0.0
+
+
+def report() -> dict:
+    with _lock:
+        counters = dict(_counters)
+    ratios = {}
+    for name in counters:
+        if name.endswith(".hits"):
+            prefix = name[:-len(".hits")]
+            ratios[f"{prefix}.hit_ratio"] = hit_ratio(counters[name], counters.get(f"{prefix}.misses", 0))
+    return {'counters': counters, 'ratios': ratios}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
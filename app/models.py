@@ -34,11 +34,12 @@ class User:
         )
 
 class QA:
-    def __init__(self, question: str, answer: str, company: str, id: str = None):
+    def __init__(self, question: str, answer: str, company: str, id: str = None, is_update: bool = False):
         self.question = question
         self.answer = answer
         self.company = company
         self.id = id
+        self.is_update = is_update # read after a ##Update## marker: supersedes earlier pairs with the same question
 
     def to_dict(self):
         return {
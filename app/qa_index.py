@@ -0,0 +1,82 @@
+"""In-memory index of the live Q&A pairs of one company, keyed by normalized question.
+
+A pair appended with `##Update##` (a correction) supersedes every earlier pair
+with the same normalized question; plain additions are kept side by side.
+The index therefore holds exactly the pairs that should be retrievable,
+and `add()` reports which ones a correction made stale so they can be pruned
+from the vector collection. It also maintains the BM25 keyword index over
+the live pairs (see app/lexical.py), built on the first keyword search so
+that loading a KB only for its pairs does not pay for tokenizing it.
+"""
+import re
+import threading
+
+from app.lexical import BM25Index
+from app.models import QA
+
+_NON_WORD_RE = re.compile(r"[^\w\s]+")
+
+
+def normalize_question(question: str) -> str:
+    """Folds case, punctuation and whitespace so that trivially different spellings compare equal."""
+    return " ".join(_NON_WORD_RE.sub(" ", question.casefold()).split())
+
+
+def _lexical_text(qa_item: QA) -> str:
+    return f"{qa_item.question}\n{qa_item.answer}"
+
+
+class QAIndex:
+    def __init__(self, company: str):
+        self.company = company
+        self.occurrences = {} # Identical-pair counts, used to mint stable IDs
+        self.record_count = 0
+        self._live = {} # id -> QA, in file order
+        self._by_question = {} # normalized question -> [id]
+        self.lexical = None # BM25Index over question and answer of the live pairs, once searched
+        self._lexical_lock = threading.Lock() # keeps the BM25 index in step with the live pairs
+
+    def add(self, qa_item: QA, is_update: bool = False) -> list[QA]:
+        """Adds a pair read (or just appended) at the end of the file. Returns the pairs it supersedes."""
+        key = normalize_question(qa_item.question)
+        with self._lexical_lock:
+            superseded = []
+            if is_update:
+                superseded = [self._live.pop(qa_id) for qa_id in self._by_question.pop(key, [])]
+            self._live[qa_item.id] = qa_item
+            self._by_question.setdefault(key, []).append(qa_item.id)
+            self.record_count += 1
+            if self.lexical is not None:
+                for stale in superseded:
+                    self.lexical.remove(stale.id, _lexical_text(stale))
+                self.lexical.add(qa_item.id, _lexical_text(qa_item))
+        return superseded
+
+    def get(self, qa_id: str) -> QA:
+        """The live pair with this ID, or None."""
+        return self._live.get(qa_id)
+
+    def lookup(self, question: str) -> list[QA]:
+        """Live pairs whose normalized question matches, oldest first."""
+        return [self._live[qa_id] for qa_id in self._by_question.get(normalize_question(question), [])]
+
+    def keyword_search(self, query: str, limit: int = 10) -> list[QA]:
+        """Live pairs ranked by BM25 score of the query against their question and answer, best first."""
+        with self._lexical_lock:
+            if self.lexical is None:
+                self.lexical = BM25Index()
+                for qa_item in list(self._live.values()):
+                    self.lexical.add(qa_item.id, _lexical_text(qa_item))
+            lexical = self.lexical
+        hits = [self._live.get(qa_id) for qa_id, _ in lexical.search(query, limit)]
+        return [qa_item for qa_item in hits if qa_item is not None] # a concurrent correction may have retired a hit
+
+    def live_items(self) -> list[QA]:
+        return list(self._live.values())
+
+    @property
+    def superseded_count(self) -> int:
+        return self.record_count - len(self._live)
+
+    def __len__(self):
+        return len(self._live)
@@ -0,0 +1,80 @@
+"""Streaming parser for the `*_QA.txt` knowledge-base format.
+
+The file is memory-mapped and scanned line by line, so parsing runs in
+constant memory whatever the file size. Records are yielded as soon as their
+answer line is read. Pairing rules:
+
+* consecutive non-empty lines form a (question, answer) pair;
+* `##Update##` marker lines are skipped, and flag the next pair as an update;
+* a question directly followed by a marker, or left without an answer at the
+  end of the file, is dropped.
+
+Every record carries its byte span: `offset` is where parsing of the record
+starts (just after the previous record) and `end_offset` is just past its
+answer line. `iter_qa_records(path, start_offset=record.end_offset)` resumes
+right after a record, and `build_record_index` gives the offsets needed to
+seek straight to record N.
+"""
+import mmap
+import os
+from array import array
+from collections import namedtuple
+
+UPDATE_MARKER = b"##Update##"
+
+QARecord = namedtuple('QARecord', ['offset', 'end_offset', 'question', 'answer', 'is_update'])
+
+
+def _iter_lines(mapped, start: int, size: int):
+    """Yields (line_start, next_line_start, stripped_line_bytes) from `start`."""
+    position = start
+    while position < size:
+        newline = mapped.find(b"\n", position)
+        line_end = size if newline == -1 else newline + 1
+        yield position, line_end, mapped[position:line_end].strip()
+        position = line_end
+
+
+def iter_qa_records(filepath: str, start_offset: int = 0):
+    """Lazily yields the QARecords of a Q&A file, starting at byte `start_offset`."""
+    with open(filepath, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0 or start_offset >= size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            record_offset = start_offset
+            question = None
+            is_update = False
+            for _, line_end, line in _iter_lines(mapped, start_offset, size):
+                if not line:
+                    continue
+                if line.startswith(UPDATE_MARKER):
+                    question = None
+                    is_update = True
+                    continue
+                if question is None:
+                    question = line
+                    continue
+                yield QARecord(
+                    offset=record_offset,
+                    end_offset=line_end,
+                    question=question.decode('utf-8', errors='replace'),
+                    answer=line.decode('utf-8', errors='replace'),
+                    is_update=is_update,
+                )
+                record_offset = line_end
+                question = None
+                is_update = False
+
+
+def build_record_index(filepath: str) -> array:
+    """Start offsets of every record in the file (8 bytes per record)."""
+    return array('q', (record.offset for record in iter_qa_records(filepath)))
+
+
+def iter_qa_records_from(filepath: str, record_number: int, index: array = None):
+    """Yields records starting at the `record_number`-th one (0-based)."""
+    index = index if index is not None else build_record_index(filepath)
+    if record_number >= len(index):
+        return iter(())
+    return iter_qa_records(filepath, start_offset=index[record_number])
@@ -0,0 +1,233 @@
+"""Admission control for LLM calls: rate buckets, a concurrency cap and priorities.
+
+Under a traffic spike every request thread used to call the LLM at once, ran
+into the provider's rate limits, and then everyone waited on retries
+together. `LLMClient` now asks this limiter before each attempt:
+
+- two token buckets refilled continuously, one for requests per minute
+  (LLM_REQUESTS_PER_MINUTE) and one for tokens per minute
+  (LLM_TOKENS_PER_MINUTE). The tokens of a call are estimated from the
+  prompt length plus the completion allowance and corrected from the
+  response's `usage`. A limit of 0 turns that bucket off;
+- at most LLM_MAX_CONCURRENCY calls in flight per process;
+- callers that cannot go yet queue in priority order. Interactive /api/ask
+  answers (PRIORITY_INTERACTIVE) go before corrections and batch answers
+  (PRIORITY_BACKGROUND); equal priorities are first come, first served. A
+  caller that is still queued after LLM_QUEUE_TIMEOUT seconds, or past its
+  call deadline, gets RateLimitTimeout;
+- a 429 response pauses all calls until its Retry-After has passed and
+  halves the refill rate. Each successful call wins back 5% of the rate.
+
+By default the buckets are per process. With LLM_RATE_LIMIT_FILE set, their
+state lives in that small JSON file, updated under an flock (app/file_lock.py),
+so all workers on the host share one budget and one Retry-After pause.
+Priorities and the concurrency cap stay per process.
+
+Queue waits and 429 pauses are counted in app/metrics.py (llm.queued,
+llm.queue_wait_ms, llm.queue_timeouts, llm.rate_limited).
+"""
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+
+from app import metrics
+from app.file_lock import file_lock
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+MIN_RATE_SCALE = 0.1 # Refill rate floor after repeated 429s, as a share of the configured limits
+RECOVERY_STEP = 0.05 # Share of the configured rate regained per successful call
+DEFAULT_RETRY_AFTER = 1.0 # Pause after a 429 without a usable Retry-After header
+COMPLETION_ALLOWANCE = 512 # Tokens reserved for the completion when the call sets no max_tokens
+MAX_POLL = 0.25 # Longest sleep between re-checks of shared state
+
+
+class RateLimitTimeout(RuntimeError):
+    """A call waited in the LLM queue longer than allowed."""
+
+
+def estimate_tokens(messages: list, max_tokens: int = None) -> int:
+    """Rough token count of a chat call: about 4 characters per prompt token, plus the completion allowance."""
+    prompt_chars = sum(len(str(message.get('content') or '')) for message in messages)
+    return prompt_chars // 4 + len(messages) * 4 + (max_tokens or COMPLETION_ALLOWANCE)
+
+
+class LLMRateLimiter:
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0, max_concurrency: int = 0,
+                 queue_timeout: float = 30.0, state_path: str = None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.state_path = state_path or None
+        self._state = None # per-process bucket state when there is no state_path
+        self._in_flight = 0
+        self._waiting = [] # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+        self._state_lock = threading.Lock()
+
+    # Bucket state: levels, time of the last refill, Retry-After pause and rate scale.
+
+    def _fresh_state(self, now: float) -> dict:
+        return {'requests': self.requests_per_minute, 'tokens': self.tokens_per_minute, 'updated': now,
+                'blocked_until': 0.0, 'scale': 1.0}
+
+    def _update_state(self, change):
+        """Applies `change(state, now)` to the refilled bucket state and returns its result."""
+        with self._state_lock:
+            return self._update_state_locked(change)
+
+    def _update_state_locked(self, change):
+        now = time.time() # wall clock, since the state file is shared between processes
+        if self.state_path is None:
+            if self._state is None:
+                self._state = self._fresh_state(now)
+            state = self._state
+            self._refill(state, now)
+            return change(state, now)
+        directory = os.path.dirname(self.state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with file_lock(f"{self.state_path}.lock"):
+            try:
+                with open(self.state_path) as f:
+                    state = {**self._fresh_state(now), **json.load(f)}
+            except (OSError, ValueError):
+                state = self._fresh_state(now)
+            self._refill(state, now)
+            result = change(state, now)
+            tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_path)
+            return result
+
+    def _read_state(self) -> dict:
+        """A refilled copy of the bucket state, without taking the file lock or writing anything back."""
+        now = time.time()
+        with self._state_lock:
+            if self.state_path is None:
+                state = dict(self._state) if self._state is not None else self._fresh_state(now)
+            else:
+                try:
+                    with open(self.state_path) as f: # replaced atomically by writers, so never half-written
+                        state = {**self._fresh_state(now), **json.load(f)}
+                except (OSError, ValueError):
+                    state = self._fresh_state(now)
+        self._refill(state, now)
+        state['blocked_for'] = max(0.0, state['blocked_until'] - now)
+        return state
+
+    def _refill(self, state: dict, now: float):
+        elapsed = max(0.0, now - state['updated'])
+        for bucket, limit in (('requests', self.requests_per_minute), ('tokens', self.tokens_per_minute)):
+            if limit > 0:
+                state[bucket] = min(limit, state[bucket] + elapsed * limit / 60 * state['scale'])
+        state['updated'] = now
+
+    def _take(self, tokens: int):
+        """Takes one request and `tokens` from the buckets, or returns the seconds to wait before trying again."""
+        def change(state, now):
+            if now < state['blocked_until']:
+                return state['blocked_until'] - now
+            wait = 0.0
+            for bucket, limit, amount in (('requests', self.requests_per_minute, 1),
+                                          ('tokens', self.tokens_per_minute, min(tokens, self.tokens_per_minute))):
+                if limit > 0 and state[bucket] < amount:
+                    wait = max(wait, (amount - state[bucket]) / (limit / 60 * state['scale']))
+            if wait:
+                return wait
+            if self.requests_per_minute > 0:
+                state['requests'] -= 1
+            if self.tokens_per_minute > 0:
+                state['tokens'] -= min(tokens, self.tokens_per_minute)
+            return 0.0
+        return self._update_state(change)
+
+    # Queue
+
+    def acquire(self, tokens: int = 0, priority: int = PRIORITY_INTERACTIVE, deadline: float = None):
+        """Blocks until the call may start, then holds one of the concurrency slots until `release()`.
+
+        `deadline` is a time.monotonic() value; the wait ends at the earlier of
+        it and queue_timeout from now.
+        """
+        started = time.monotonic()
+        give_up = started + self.queue_timeout
+        if deadline is not None:
+            give_up = min(give_up, deadline)
+        ticket = (priority, next(self._seq))
+        queued = False
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    wait = None
+                    if self._waiting[0] == ticket and (self.max_concurrency <= 0 or self._in_flight < self.max_concurrency):
+                        wait = self._take(tokens)
+                        if not wait:
+                            self._in_flight += 1
+                            break
+                    remaining = give_up - time.monotonic()
+                    if remaining <= 0:
+                        metrics.increment("llm.queue_timeouts")
+                        raise RateLimitTimeout(f"LLM call waited {time.monotonic() - started:.1f}s in the rate limit queue")
+                    queued = True
+                    timeout = min(remaining, wait) if wait else remaining
+                    if self.state_path:
+                        timeout = min(timeout, MAX_POLL) # other workers change the shared buckets
+                    self._condition.wait(timeout)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+        if queued:
+            metrics.increment("llm.queued")
+            metrics.increment("llm.queue_wait_ms", int((time.monotonic() - started) * 1000))
+
+    def release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    # Feedback from responses
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int):
+        """Charges (or refunds) the difference between a call's estimated and actual token count."""
+        if self.tokens_per_minute <= 0 or actual_tokens is None:
+            return
+
+        def change(state, now):
+            state['tokens'] = min(self.tokens_per_minute, state['tokens'] + estimated_tokens - actual_tokens)
+        self._update_state(change)
+
+    def rate_limited(self, retry_after: float = None):
+        """A 429 arrived: pause every call until Retry-After has passed and halve the refill rate."""
+        metrics.increment("llm.rate_limited")
+        pause = retry_after if retry_after is not None else DEFAULT_RETRY_AFTER
+
+        def change(state, now):
+            state['blocked_until'] = max(state['blocked_until'], now + pause)
+            state['scale'] = max(MIN_RATE_SCALE, state['scale'] / 2)
+        self._update_state(change)
+
+    def succeeded(self):
+        if self.requests_per_minute <= 0 and self.tokens_per_minute <= 0:
+            return
+
+        def change(state, now):
+            state['scale'] = min(1.0, state['scale'] + RECOVERY_STEP)
+        self._update_state(change)
+
+    def stats(self) -> dict:
+        with self._condition:
+            in_flight, queued = self._in_flight, len(self._waiting)
+        state = self._read_state()
+        return {'in_flight': in_flight, 'queued': queued, 'requests_available': round(state['requests'], 2),
+                'tokens_available': round(state['tokens'], 2), 'rate_scale': round(state['scale'], 3),
+                'paused_seconds': round(state['blocked_for'], 3)}
@@ -1,29 +1,65 @@
 from functools import wraps
-from flask import render_template, request, redirect, url_for, session, jsonify, flash
-from app import app, load_users
+from flask import Blueprint, Response, current_app, render_template, request, redirect, url_for, session, jsonify, flash, stream_with_context
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from app import jobs, load_users, metrics, semantic_cache, startup, utils, warmup
 from app.models import User, QA # QA model needed for type hinting if not direct use
+from app.circuit_breaker import CircuitOpenError
 import uuid
 from app.utils import (
     save_users,
     verify_password,
     query_collection,
+    query_collection_many, # One vector search call for many questions of a company
+    query_companies, # One question over several companies' collections
     get_llm_answer,
+    stream_llm_answer,
     get_corrected_llm_answer,
     append_qa_pair,
     get_or_create_collection,
     format_snippets_for_llm, # For formatting snippets for display
+    find_exact_match, # Stored answer for a question already in the KB
+    embed_query, # Query embedding for the semantic answer cache
+    embed_queries, # Batched query embeddings for /api/ask_batch
+    get_embedding_cache_stats,
     load_qa_data, # For downloading Q&A data
-    append_qa_pair # For uploading Q&A data
+    append_qa_pairs # For uploading Q&A data in one batch
 )
 import json # For parsing uploaded JSON
 
-@app.route('/')
+bp = Blueprint('main', __name__)
+
+@bp.route('/')
 def index():
     if 'user_id' in session:
-        return redirect(url_for('ask_ai_get')) # Redirect to GET version of ask_ai
-    return redirect(url_for('login'))
-
-@app.route('/login', methods=['GET', 'POST'])
+        return redirect(url_for('main.ask_ai_get')) # Redirect to GET version of ask_ai
+    return redirect(url_for('main.login'))
+
+@bp.route('/healthz', methods=['GET'])
+def healthz():
+    # Liveness only: the process is up and serving requests.
+    return jsonify({'status': 'ok'}), 200
+
+@bp.route('/readyz', methods=['GET'])
+def readyz():
+    # Readiness: the embedding model is loaded and the Q&A indexes are synced.
+    snapshot = warmup.state.snapshot()
+    snapshot['startup'] = startup.report()
+    return jsonify(snapshot), 200 if snapshot['status'] == 'ready' else 503
+
+@bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    # Per-process counters (exact-match and semantic cache hit rates, LLM time saved, ...) and cache stats.
+    report = metrics.report()
+    report['embedding_cache'] = get_embedding_cache_stats()
+    report['semantic_cache'] = semantic_cache.cache.stats()
+    report['collection_cache'] = utils.get_collection_cache_stats()
+    report['completion_cache'] = utils.get_completion_cache_stats()
+    report['llm_rate_limiter'] = utils.get_llm_rate_limiter_stats()
+    report['llm_circuit'] = utils.get_llm_circuit_stats()
+    return jsonify(report), 200
+
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         email = request.form.get('email')
@@ -42,23 +78,23 @@ def login():
             session['status'] = user_data.status
             session['name'] = user_data.name
             flash('Login successful!', 'success')
-            return jsonify({'status': 'success', 'message': 'Login successful', 'user_status': user_data.status, 'redirect_url': url_for('ask_ai_get')})
+            return jsonify({'status': 'success', 'message': 'Login successful', 'user_status': user_data.status, 'redirect_url': url_for('main.ask_ai_get')})
         else:
             flash('Invalid email or password.', 'danger')
             return jsonify({'status': 'error', 'message': 'Invalid email or password'}), 401
 
     if 'user_id' in session:
-        return redirect(url_for('ask_ai_get'))
+        return redirect(url_for('main.ask_ai_get'))
     return render_template('login.html')
 
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     session.pop('user_id', None)
     session.pop('status', None)
     session.pop('name', None)
     flash('You have been logged out.', 'info')
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
 
 def login_required(f):
@@ -67,8 +103,8 @@ def login_required(f):
         if 'user_id' not in session:
             flash('Please log in to access this page.', 'warning')
             if request.headers.get("X-Requested-With") == "XMLHttpRequest": # Check if AJAX
-                 return jsonify({'status': 'error', 'message': 'Login required', 'redirect_url': url_for('login', next=request.url)}), 401
-            return redirect(url_for('login', next=request.url))
+                 return jsonify({'status': 'error', 'message': 'Login required', 'redirect_url': url_for('main.login', next=request.url)}), 401
+            return redirect(url_for('main.login', next=request.url))
         return f(*args, **kwargs)
     return decorated_function
 
@@ -78,80 +114,364 @@ def admin_required(f):
         if 'user_id' not in session:
             flash('Please log in.', 'warning')
             if request.headers.get("X-Requested-With") == "XMLHttpRequest":
-                return jsonify({'status': 'error', 'message': 'Login required', 'redirect_url': url_for('login', next=request.url)}), 401
-            return redirect(url_for('login', next=request.url))
+                return jsonify({'status': 'error', 'message': 'Login required', 'redirect_url': url_for('main.login', next=request.url)}), 401
+            return redirect(url_for('main.login', next=request.url))
         if session.get('status') != 'admin':
             flash('You do not have permission to access this page.', 'danger')
             if request.headers.get("X-Requested-With") == "XMLHttpRequest":
                 return jsonify({'status': 'error', 'message': 'Admin access required'}), 403
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         return f(*args, **kwargs)
     return decorated_function
 
 # Renamed placeholder ask_ai to ask_ai_get for clarity
-@app.route('/ask', methods=['GET'])
+@bp.route('/ask', methods=['GET'])
 @login_required
 def ask_ai_get():
-    return render_template('screen1.html')
+    return render_template('screen1.html', companies=utils.get_companies())
 
-@app.route('/api/ask', methods=['POST']) # API endpoint for asking questions
-@login_required
-def ask_ai_post():
-    data = request.json
+def _ask_validation_error(company, question_type):
+    # Basic validation for company and question_type (can be expanded)
+    # PROMPT_TEMPLATES keys can be fetched from utils/Type.py for dynamic validation if needed
+    valid_question_types = ["Product", "Sales", "General Help", "Tutorial", "Default"]
+    if not utils.is_valid_company(company):
+        return f'Invalid company: {company}.'
+    if question_type not in valid_question_types:
+        return f'Invalid question type: {question_type}.'
+    return None
+
+def _is_llm_error(answer: str) -> bool:
+    return "Error generating answer from LLM" in answer or "OpenAI API key not configured" in answer
+
+def _extractive_response(user_question, snippets, company, question_type, companies=None):
+    """While the LLM circuit is open: the best retrieved pair's stored answer, flagged as extractive, or None."""
+    if not snippets:
+        return None
+    metrics.increment("ask.extractive_fallbacks")
+    response = _ask_response(user_question, snippets[0]['answer'], 'extractive_fallback', snippets, company,
+                             question_type, companies)
+    response.update(extractive=True, matched_question=snippets[0]['question'],
+                    message="The AI assistant is temporarily unavailable. This is the closest answer from the knowledge base.")
+    return response
+
+def _parse_ask_request(data):
+    """Reads an /api/ask body. Returns (fields, None), or (None, error message) for a 400."""
     user_question = data.get('user_question')
     company = data.get('company')
     question_type = data.get('question_type')
 
     if not all([user_question, company, question_type]):
-        return jsonify({'status': 'error', 'message': 'Missing required fields (question, company, or type).'}), 400
+        return None, 'Missing required fields (question, company, or type).'
+
+    # "all" or a list of companies searches their collections together (for when the owner is not known).
+    federated = company == 'all' or isinstance(company, list)
+    companies = _requested_companies(company)
+    if federated and len(companies) > utils.max_federated_companies():
+        return None, f'A question can search at most {utils.max_federated_companies()} companies at once; list the companies to search.'
+    for name in companies:
+        validation_error = _ask_validation_error(name, question_type)
+        if validation_error:
+            return None, validation_error
+    fields = {'user_question': user_question, 'company': company, 'question_type': question_type,
+              'companies': companies, 'federated': federated, 'rephrase': data.get('rephrase', utils.EXACT_MATCH_REPHRASE == 'on')}
+    return fields, None
+
+def _ask_context(fields) -> dict:
+    """Everything /api/ask does before the LLM call.
+
+    Returns {'response'} when the answer is known without the LLM (exact
+    match, semantic cache hit). Otherwise returns the 'snippets' and answering
+    'company' for the LLM, the answer 'source', and the 'query_embedding' to
+    cache the answer under.
+    """
+    user_question, company, question_type = fields['user_question'], fields['company'], fields['question_type']
+    companies = fields['companies']
+    context = {'response': None, 'company': company, 'source': 'retrieval', 'query_embedding': None}
+    # A question already in the KB (up to case, whitespace and punctuation) is answered from the
+    # stored pair, skipping the query embedding and the vector search, and the LLM unless a rephrase is asked for.
+    exact_match = None
+    if utils.EXACT_MATCH != 'off':
+        exact_match = next(filter(None, (find_exact_match(name, user_question) for name in companies)), None)
+    if exact_match is not None:
+        context.update(company=exact_match.company, snippets=[exact_match.to_dict()], source='exact_match')
+        if not fields['rephrase']:
+            context['response'] = _ask_response(user_question, exact_match.answer, 'exact_match', context['snippets'],
+                                                exact_match.company, question_type,
+                                                companies if fields['federated'] else None)
+    elif fields['federated']:
+        # One query embedding, every collection searched in parallel, hits merged by distance.
+        context['snippets'] = query_companies(companies, user_question, n_results=3)
+        # The owner of the closest pair answers (and is the one a correction would go to).
+        context['company'] = context['snippets'][0]['company'] if context['snippets'] else companies[0]
+    else:
+        # A paraphrase of a recently answered question reuses that answer (app/semantic_cache.py).
+        # The query embedding is computed once here; the vector search below gets it from the embedding cache.
+        query_embedding = embed_query(user_question) if semantic_cache.cache.enabled else None
+        cached = semantic_cache.cache.get(company, question_type, query_embedding) if query_embedding is not None else None
+        if cached is not None:
+            context['response'] = _ask_response(user_question, cached['answer'], 'semantic_cache', cached['snippets'],
+                                                company, question_type)
+            context['response'].update(cached_question=cached['question'], similarity=cached['similarity'])
+            return context
+        collection = get_or_create_collection(company)
+        context['snippets'] = query_collection(collection, user_question, n_results=3, company=company)
+        context['query_embedding'] = query_embedding
+    return context
 
-    # Basic validation for company and question_type (can be expanded)
-    valid_companies = ["Tallman", "MCR", "Bradley"]
-    # PROMPT_TEMPLATES keys can be fetched from utils/Type.py for dynamic validation if needed
-    valid_question_types = ["Product", "Sales", "General Help", "Tutorial", "Default"]
-    if company not in valid_companies:
-        return jsonify({'status': 'error', 'message': f'Invalid company: {company}.'}), 400
-    if question_type not in valid_question_types:
-        return jsonify({'status': 'error', 'message': f'Invalid question type: {question_type}.'}), 400
+def _cache_answer(fields, context, answer, llm_seconds):
+    if context['query_embedding'] is not None:
+        semantic_cache.cache.put(context['company'], fields['question_type'], fields['user_question'],
+                                 context['query_embedding'], answer, context['snippets'], llm_seconds)
+
+@bp.route('/api/ask', methods=['POST']) # API endpoint for asking questions
+@login_required
+def ask_ai_post():
+    fields, validation_error = _parse_ask_request(request.json)
+    if validation_error:
+        return jsonify({'status': 'error', 'message': validation_error}), 400
+    user_question, question_type = fields['user_question'], fields['question_type']
 
     try:
-        collection = get_or_create_collection(company)
-        retrieved_snippets_dicts = query_collection(collection, user_question, n_results=3)
+        context = _ask_context(fields)
+        if context['response'] is not None:
+            return jsonify(context['response'])
+        company, retrieved_snippets_dicts = context['company'], context['snippets']
 
+        started = time.perf_counter()
         llm_answer = get_llm_answer(user_question, company, question_type, retrieved_snippets_dicts)
-
-        # format_snippets_for_llm expects list of dicts, which retrieved_snippets_dicts is.
-        display_snippets = format_snippets_for_llm(retrieved_snippets_dicts)
-
-        if "Error generating answer from LLM" in llm_answer or "OpenAI API key not configured" in llm_answer :
-             return jsonify({
+        llm_seconds = time.perf_counter() - started
+
+        if llm_answer == utils.LLM_UNAVAILABLE_MESSAGE:
+            # The LLM circuit is open: answer from retrieval alone instead of failing.
+            fallback = _extractive_response(user_question, retrieved_snippets_dicts, company, question_type,
+                                            fields['companies'] if fields['federated'] else None)
+            if fallback is not None:
+                return jsonify(fallback)
+            return jsonify({'status': 'error', 'message': llm_answer, 'user_question': user_question,
+                            'company': company, 'question_type': question_type}), 503
+
+        if _is_llm_error(llm_answer):
+            return jsonify({
                 'status': 'error',
                 'message': llm_answer,
                 'user_question': user_question,
-                'retrieved_snippets_formatted': display_snippets,
+                'retrieved_snippets_formatted': format_snippets_for_llm(retrieved_snippets_dicts),
                 'raw_snippets': retrieved_snippets_dicts,
                 'company': company,
                 'question_type': question_type
             }), 500
 
-        return jsonify({
-            'status': 'success',
-            'user_question': user_question,
-            'answer': llm_answer,
-            'retrieved_snippets_formatted': display_snippets,
-            'raw_snippets': retrieved_snippets_dicts,
-            'company': company,
-            'question_type': question_type
-        })
+        _cache_answer(fields, context, llm_answer, llm_seconds)
+        return jsonify(_ask_response(user_question, llm_answer, context['source'], retrieved_snippets_dicts, company,
+                                     question_type, fields['companies'] if fields['federated'] else None))
     except RuntimeError as r_e: # Catch errors like sentence transformer not initialized
-        app.logger.error(f"Runtime error in /api/ask: {r_e}")
+        current_app.logger.error(f"Runtime error in /api/ask: {r_e}")
         return jsonify({'status': 'error', 'message': str(r_e)}), 500
     except Exception as e:
-        app.logger.error(f"Exception in /api/ask: {e}")
+        current_app.logger.error(f"Exception in /api/ask: {e}")
         return jsonify({'status': 'error', 'message': 'An internal error occurred while processing your question.'}), 500
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-@app.route('/correct_answer_page', methods=['GET']) # Placeholder if a dedicated page is needed
+@bp.route('/api/ask/stream', methods=['POST'])
+@login_required
+def ask_ai_stream():
+    """/api/ask as Server-Sent Events: 'snippets' as soon as retrieval is done, then 'token's, then 'done'."""
+    fields, validation_error = _parse_ask_request(request.json)
+    if validation_error:
+        return jsonify({'status': 'error', 'message': validation_error}), 400
+    user_question, question_type = fields['user_question'], fields['question_type']
+    companies = fields['companies'] if fields['federated'] else None
+
+    # Retrieval runs before the response starts, so its failures still get a JSON error and status code.
+    try:
+        context = _ask_context(fields)
+    except RuntimeError as r_e:
+        current_app.logger.error(f"Runtime error in /api/ask/stream: {r_e}")
+        return jsonify({'status': 'error', 'message': str(r_e)}), 500
+    except Exception as e:
+        current_app.logger.error(f"Exception in /api/ask/stream: {e}")
+        return jsonify({'status': 'error', 'message': 'An internal error occurred while processing your question.'}), 500
+    logger = current_app.logger
+
+    def generate():
+        if context['response'] is not None:
+            response = context['response']
+            yield _sse('snippets', _ask_response(user_question, None, response['source'], response['raw_snippets'],
+                                                 response['company'], question_type, companies))
+            yield _sse('token', {'text': response['answer']})
+            yield _sse('done', response)
+            return
+        company, snippets = context['company'], context['snippets']
+        yield _sse('snippets', _ask_response(user_question, None, context['source'], snippets, company, question_type,
+                                             companies))
+        parts = []
+        started = time.perf_counter()
+        try:
+            for text in stream_llm_answer(user_question, company, question_type, snippets):
+                parts.append(text)
+                yield _sse('token', {'text': text})
+        except CircuitOpenError as c_e:
+            # Raised before any token: the stored answer of the best snippet replaces the LLM answer.
+            fallback = _extractive_response(user_question, snippets, company, question_type, companies)
+            if fallback is None:
+                yield _sse('error', {'status': 'error', 'message': str(c_e)})
+                return
+            yield _sse('token', {'text': fallback['answer']})
+            yield _sse('done', fallback)
+            return
+        except RuntimeError as r_e:
+            yield _sse('error', {'status': 'error', 'message': str(r_e)})
+            return
+        except Exception as e:
+            logger.error(f"Exception while streaming /api/ask/stream: {e}")
+            yield _sse('error', {'status': 'error', 'message': 'An internal error occurred while generating the answer.'})
+            return
+        answer = "".join(parts).strip()
+        _cache_answer(fields, context, answer, time.perf_counter() - started)
+        yield _sse('done', _ask_response(user_question, answer, context['source'], snippets, company, question_type,
+                                         companies))
+
+    # X-Accel-Buffering stops nginx from holding the events back until the answer is complete.
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _requested_companies(company) -> list:
+    if company == 'all':
+        return utils.get_companies()
+    if isinstance(company, list):
+        return list(dict.fromkeys(str(name) for name in company)) or [None]
+    return [company]
+
+def _ask_response(user_question, answer, source, snippets, company, question_type, companies=None) -> dict:
+    response = {
+        'status': 'success',
+        'user_question': user_question,
+        'answer': answer,
+        'source': source,
+        # format_snippets_for_llm expects list of dicts, which the snippets are.
+        'retrieved_snippets_formatted': format_snippets_for_llm(snippets),
+        'raw_snippets': snippets,
+        'company': company,
+        'question_type': question_type
+    }
+    if companies is not None:
+        response['companies'] = companies
+    return response
+
+
+ASK_BATCH_MAX_ITEMS = 500
+
+def _ask_batch_result(index, question, company, question_type, answer, source, snippets):
+    return {'index': index, 'status': 'success', 'user_question': question, 'answer': answer, 'source': source,
+            'raw_snippets': snippets, 'company': company, 'question_type': question_type}
+
+def _ask_batch_error(index, message, **fields):
+    return {'index': index, 'status': 'error', 'message': message, **fields}
+
+def _answer_batch_item(index, question, company, question_type, snippets, embedding, source):
+    # Runs on a worker thread: get_llm_answer logs and reports its own failures.
+    started = time.perf_counter()
+    answer = get_llm_answer(question, company, question_type, snippets, priority=utils.PRIORITY_BACKGROUND)
+    if _is_llm_error(answer):
+        return _ask_batch_error(index, answer, user_question=question, company=company, question_type=question_type)
+    if embedding is not None:
+        semantic_cache.cache.put(company, question_type, question, embedding, answer, snippets,
+                                 time.perf_counter() - started)
+    return _ask_batch_result(index, question, company, question_type, answer, source, snippets)
+
+@bp.route('/api/ask_batch', methods=['POST'])
+@login_required
+def ask_batch_post():
+    # Answers many questions in one request, streamed back as NDJSON: one JSON object per line, tagged with the
+    # item's index, in completion order. Exact matches and semantic cache hits come first. The rest are
+    # embedded in one batched call, retrieved with one vector search per company, and answered by the LLM
+    # with at most ASK_BATCH_LLM_CONCURRENCY calls in flight.
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({'status': 'error', 'message': 'Expected a non-empty JSON list of {question, company, question_type} items.'}), 400
+    if len(items) > ASK_BATCH_MAX_ITEMS:
+        return jsonify({'status': 'error', 'message': f'At most {ASK_BATCH_MAX_ITEMS} questions per batch.'}), 400
+    rephrase = utils.EXACT_MATCH_REPHRASE == 'on'
+    if isinstance(data, dict):
+        rephrase = data.get('rephrase', rephrase)
+
+    ready = [] # result lines known without an LLM call
+    pending = [] # (index, question, company, question_type, snippets, embedding, source) awaiting the LLM
+    to_retrieve = [] # (index, question, company, question_type)
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            ready.append(_ask_batch_error(index, 'Each item must be a JSON object.'))
+            continue
+        question = item.get('question') or item.get('user_question')
+        company = item.get('company')
+        question_type = item.get('question_type')
+        if not all([question, company, question_type]):
+            ready.append(_ask_batch_error(index, 'Missing required fields (question, company, or type).'))
+            continue
+        validation_error = _ask_validation_error(company, question_type)
+        if validation_error:
+            ready.append(_ask_batch_error(index, validation_error))
+            continue
+        exact_match = find_exact_match(company, question) if utils.EXACT_MATCH != 'off' else None
+        if exact_match is None:
+            to_retrieve.append((index, question, company, question_type))
+        elif rephrase:
+            pending.append((index, question, company, question_type, [exact_match.to_dict()], None, 'exact_match'))
+        else:
+            ready.append(_ask_batch_result(index, question, company, question_type, exact_match.answer, 'exact_match',
+                                           [exact_match.to_dict()]))
+
+    try:
+        if to_retrieve:
+            embeddings = embed_queries([question for _, question, _, _ in to_retrieve])
+            if embeddings is None:
+                raise RuntimeError("SentenceTransformerEmbeddingFunction not initialized. Cannot answer questions.")
+            by_company = {}
+            for entry, embedding in zip(to_retrieve, embeddings):
+                index, question, company, question_type = entry
+                cached = semantic_cache.cache.get(company, question_type, embedding)
+                if cached is not None:
+                    ready.append(_ask_batch_result(index, question, company, question_type, cached['answer'],
+                                                   'semantic_cache', cached['snippets']))
+                else:
+                    by_company.setdefault(company, []).append((entry, embedding))
+            for company, group in by_company.items():
+                snippets_per_question = query_collection_many(
+                    get_or_create_collection(company),
+                    [question for (_, question, _, _), _ in group],
+                    [embedding for _, embedding in group],
+                    n_results=3, company=company
+                )
+                for ((index, question, _, question_type), embedding), snippets in zip(group, snippets_per_question):
+                    pending.append((index, question, company, question_type, snippets, embedding, 'retrieval'))
+    except RuntimeError as r_e:
+        current_app.logger.error(f"Runtime error in /api/ask_batch: {r_e}")
+        return jsonify({'status': 'error', 'message': str(r_e)}), 500
+    except Exception as e:
+        current_app.logger.error(f"Exception in /api/ask_batch: {e}")
+        return jsonify({'status': 'error', 'message': 'An internal error occurred while processing the questions.'}), 500
+
+    def generate():
+        for line in ready:
+            yield json.dumps(line) + "\n"
+        if not pending:
+            return
+        executor = ThreadPoolExecutor(max_workers=min(utils.ASK_BATCH_LLM_CONCURRENCY, len(pending)))
+        try:
+            futures = [executor.submit(_answer_batch_item, *entry) for entry in pending]
+            for future in as_completed(futures):
+                yield json.dumps(future.result()) + "\n"
+        finally:
+            # If the client disconnects, do not start the LLM calls still queued.
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@bp.route('/correct_answer_page', methods=['GET']) # Placeholder if a dedicated page is needed
 @admin_required # Or login_required if any user can suggest corrections via this page
 def correct_answer_page_get():
     # This page might be pre-filled if navigated from screen1 with context
@@ -161,9 +481,10 @@ def correct_answer_page_get():
     return render_template('screen2.html',
                            original_question=original_question,
                            incorrect_answer=incorrect_answer,
-                           company=company)
+                           company=company,
+                           companies=utils.get_companies())
 
-@app.route('/api/correct_answer', methods=['POST'])
+@bp.route('/api/correct_answer', methods=['POST'])
 @admin_required # Only admins can directly correct and update the knowledge base
 def correct_answer_post():
     data = request.json
@@ -175,8 +496,7 @@ def correct_answer_post():
     if not all([original_question, incorrect_answer, user_correction_text, company]):
         return jsonify({'status': 'error', 'message': 'Missing required fields for correction.'}), 400
 
-    valid_companies = ["Tallman", "MCR", "Bradley"]
-    if company not in valid_companies:
+    if not utils.is_valid_company(company):
         return jsonify({'status': 'error', 'message': f'Invalid company: {company}.'}), 400
 
     try:
@@ -197,21 +517,21 @@ def correct_answer_post():
             'qa_id': qa_item.id
         })
     except RuntimeError as r_e:
-        app.logger.error(f"Runtime error in /api/correct_answer: {r_e}")
+        current_app.logger.error(f"Runtime error in /api/correct_answer: {r_e}")
         return jsonify({'status': 'error', 'message': str(r_e)}), 500
     except Exception as e:
-        app.logger.error(f"Exception in /api/correct_answer: {e}")
+        current_app.logger.error(f"Exception in /api/correct_answer: {e}")
         return jsonify({'status': 'error', 'message': 'An internal error occurred while correcting the answer.'}), 500
 
 
-@app.route('/manage_users', methods=['GET'])
+@bp.route('/manage_users', methods=['GET'])
 @admin_required
 def manage_users():
     users = load_users()
-    return render_template('screen3.html', users=[user.to_dict() for user in users])
+    return render_template('screen3.html', users=[user.to_dict() for user in users], companies=utils.get_companies())
 
 # Placeholder for actual user management API endpoints (add, edit, delete)
-@app.route('/api/users', methods=['POST'])
+@bp.route('/api/users', methods=['POST'])
 @admin_required
 def api_add_user():
     data = request.get_json()
@@ -245,7 +565,7 @@ def api_add_user():
 
     return jsonify({'status': 'success', 'message': 'User added successfully', 'user': user_data}), 201
 
-@app.route('/api/users/<user_id>', methods=['PUT', 'DELETE'])
+@bp.route('/api/users/<user_id>', methods=['PUT', 'DELETE'])
 @admin_required
 def api_manage_user(user_id):
     users = load_users()
@@ -289,23 +609,21 @@ def api_manage_user(user_id):
         return jsonify({'status': 'success', 'message': 'User deleted successfully'}), 200 # Or 204 No Content
 
 # Renamed old placeholders to avoid conflicts
-@app.route('/ask_ai_old_placeholder')
+@bp.route('/ask_ai_old_placeholder')
 @login_required
 def ask_ai_placeholder():
     return "Ask AI Page (Screen 1) - Requires Login"
 
-@app.route('/correct_answer_old_placeholder')
+@bp.route('/correct_answer_old_placeholder')
 @login_required # Or admin_required depending on policy
 def correct_answer_placeholder():
     return "Correct Answer Page (Screen 2) - Requires Login/Admin"
 
 
-@app.route('/admin/download_qa/<company_name>', methods=['GET'])
+@bp.route('/admin/download_qa/<company_name>', methods=['GET'])
 @admin_required
 def download_qa_file(company_name):
-    # These should ideally be sourced from a config or from app.utils where file paths are defined
-    valid_companies = ["Tallman", "MCR", "Bradley"]
-    if company_name not in valid_companies:
+    if not utils.is_valid_company(company_name):
         return jsonify({'status': 'error', 'message': 'Invalid or unsupported company name'}), 400
 
     try:
@@ -325,25 +643,25 @@ def download_qa_file(company_name):
         # This might occur if load_qa_data internally raises ValueError for bad company name,
         # though current utils.get_qa_filepath raises FileNotFoundError handled by load_qa_data.
         # Adding for robustness in case utils changes.
-        app.logger.error(f"ValueError during Q&A download for {company_name}: {ve}")
+        current_app.logger.error(f"ValueError during Q&A download for {company_name}: {ve}")
         return jsonify({'status': 'error', 'message': str(ve)}), 400
     except Exception as e:
         # Log the exception for debugging
-        app.logger.error(f"Unexpected error generating Q&A download for {company_name}: {e}")
+        current_app.logger.error(f"Unexpected error generating Q&A download for {company_name}: {e}")
         return jsonify({'status': 'error', 'message': 'An internal error occurred while generating the Q&A file.'}), 500
 
 
 ALLOWED_EXTENSIONS_QA_UPLOAD = {'json'}
+UPLOAD_JOB_CHUNK_SIZE = 1000 # Pairs per append_qa_pairs call in an upload job
 
 def allowed_file_qa(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS_QA_UPLOAD
 
-@app.route('/admin/upload_qa/<company_name>', methods=['POST'])
+@bp.route('/admin/upload_qa/<company_name>', methods=['POST'])
 @admin_required
 def upload_qa_file(company_name):
-    valid_companies = ["Tallman", "MCR", "Bradley"] # Ideally, sync with utils or config
-    if company_name not in valid_companies:
+    if not utils.is_valid_company(company_name):
         return jsonify({'status': 'error', 'message': 'Invalid or unsupported company name'}), 400
 
     if 'file' not in request.files:
@@ -364,13 +682,18 @@ def upload_qa_file(company_name):
     except json.JSONDecodeError:
         return jsonify({'status': 'error', 'message': 'Invalid JSON format in the uploaded file.'}), 400
     except Exception as e:
-        app.logger.error(f"Error reading or parsing Q&A upload for {company_name}: {e}")
+        current_app.logger.error(f"Error reading or parsing Q&A upload for {company_name}: {e}")
         return jsonify({'status': 'error', 'message': f'Error reading or parsing file: {str(e)}'}), 400
 
     if not isinstance(data, list):
         return jsonify({'status': 'error', 'message': 'Invalid JSON content. Expected a list of Q&A objects.'}), 400
 
-    processed_count = 0
+    dedup = request.args.get('dedup') # Near-duplicate handling: off, skip or merge (defaults to DEDUP_MODE)
+    if dedup not in (None, 'off', 'skip', 'merge'):
+        return jsonify({'status': 'error', 'message': 'Invalid dedup mode. Use off, skip or merge.'}), 400
+
+    # Validate the whole payload before queuing anything.
+    pairs = []
     errors = []
 
     for index, item in enumerate(data):
@@ -385,25 +708,10 @@ def upload_qa_file(company_name):
              errors.append(f"Item {index+1}: Question and Answer must be non-empty strings. Question: '{str(question)[:50]}', Answer: '{str(answer)[:50]}'")
              continue
 
-        try:
-            # append_qa_pair's is_update defaults to False, which is correct for new additions.
-            append_qa_pair(company_name, question, answer)
-            processed_count += 1
-        except Exception as e:
-            app.logger.error(f"Error appending Q&A for {company_name} from uploaded file (item {index+1}): {e} on item: {question[:50]}")
-            errors.append(f"Item {index+1} ('{question[:50]}...'): Error processing - {str(e)}")
+        pairs.append((question, answer))
 
-    if errors:
-        if processed_count > 0:
-            # Partial success
-            return jsonify({
-                'status': 'partial_success',
-                'message': f'Processed {processed_count} Q&A pairs for {company_name}. Encountered {len(errors)} errors.',
-                'errors': errors,
-                'processed_count': processed_count,
-                'error_count': len(errors)
-            }), 207 # Multi-Status
-        else:
+    if not pairs:
+        if errors:
             # All items failed
             return jsonify({
                 'status': 'error',
@@ -412,19 +720,77 @@ def upload_qa_file(company_name):
                 'processed_count': 0,
                 'error_count': len(errors)
             }), 400
-
-    if processed_count == 0 and not data: # Empty JSON array was uploaded
-         return jsonify({
+        # Empty JSON array was uploaded
+        return jsonify({
             'status': 'success',
-            'message': 'No Q&A pairs found in the uploaded file to process for {company_name}.',
+            'message': f'No Q&A pairs found in the uploaded file to process for {company_name}.',
             'processed_count': 0,
             'error_count': 0
         }), 200
 
-
+    # The valid pairs are appended by a background job; clients poll /admin/jobs/<job_id>.
+    job = jobs.manager.submit('upload_qa', lambda job: _run_upload_job(job, company_name, pairs, dedup),
+                              total=len(pairs), company=company_name, invalid_items=len(errors))
+    for error in errors:
+        job.add_error(error)
+    current_app.logger.info(f"Queued Q&A upload job {job.id} for {company_name}: {len(pairs)} pairs, {len(errors)} invalid items.")
     return jsonify({
-        'status': 'success',
-        'message': f'Successfully uploaded and processed {processed_count} Q&A pairs for {company_name}.',
-        'processed_count': processed_count,
-        'error_count': 0
-    }), 201 # 201 Created
+        'status': 'accepted',
+        'message': f'Upload of {len(pairs)} Q&A pairs for {company_name} queued as job {job.id}.',
+        'job_id': job.id,
+        'status_url': url_for('main.get_job', job_id=job.id),
+        'queued_count': len(pairs),
+        'errors': errors,
+        'error_count': len(errors)
+    }), 202 # Accepted
+
+def _run_upload_job(job, company_name: str, pairs: list, dedup: str = None) -> dict:
+    """Appends the pairs in chunks so the job reports progress and can be cancelled between them.
+
+    Chunks appended before a cancellation stay in the knowledge base. A chunk
+    that fails still counts as processed, and the job then ends `partial`
+    (or `failed` if no chunk went in).
+    """
+    timings = {}
+    duplicates = []
+    for start in range(0, len(pairs), UPLOAD_JOB_CHUNK_SIZE):
+        job.check_cancelled()
+        chunk = pairs[start:start + UPLOAD_JOB_CHUNK_SIZE]
+        chunk_timings = {}
+        try:
+            append_qa_pairs(company_name, chunk, timings=chunk_timings, dedup=dedup, duplicates=duplicates)
+        except Exception as e:
+            job.fail_items(len(chunk), f"Items {start+1}-{start+len(chunk)} of the valid pairs: Error processing - {str(e)}")
+            continue
+        for phase, seconds in chunk_timings.items():
+            timings[phase] = timings.get(phase, 0.0) + seconds
+        job.advance(len(chunk))
+    return {
+        'timings_ms': {phase: round(seconds * 1000, 2) for phase, seconds in timings.items()},
+        'duplicate_count': len(duplicates),
+        'duplicates': duplicates[:jobs.MAX_REPORTED_ERRORS],
+    }
+
+@bp.route('/admin/jobs', methods=['GET'])
+@admin_required
+def list_jobs():
+    return jsonify({'jobs': [job.snapshot() for job in jobs.manager.list()]})
+
+@bp.route('/admin/jobs/<job_id>', methods=['GET'])
+@admin_required
+def get_job(job_id):
+    job = jobs.manager.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Job not found'}), 404
+    return jsonify(job.snapshot())
+
+@bp.route('/admin/jobs/<job_id>/cancel', methods=['POST'])
+@admin_required
+def cancel_job(job_id):
+    job = jobs.manager.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Job not found'}), 404
+    if not job.cancel():
+        return jsonify({'status': 'error', 'message': f'Job already {job.status}'}), 409
+    current_app.logger.info(f"Cancellation requested for job {job_id}.")
+    return jsonify({'status': 'success', 'message': 'Cancellation requested', 'job': job.snapshot()})
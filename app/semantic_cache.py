@@ -0,0 +1,152 @@
+"""Cache of generated /api/ask answers, looked up by question-embedding similarity.
+
+Paraphrases of a question that was answered recently ("what time do you
+open" / "when are you open?") reuse its answer instead of another LLM call.
+Entries are kept per (company, question type). A lookup returns the closest
+cached question if its cosine similarity reaches SEMANTIC_CACHE_THRESHOLD
+and it is younger than SEMANTIC_CACHE_TTL seconds. Each bucket holds at most
+SEMANTIC_CACHE_CAPACITY entries and evicts the least recently used one.
+
+Each bucket remembers the signature (path, size, mtime) of the company's
+Q&A file when it was filled. Any change to the file empties the bucket on
+its next lookup: appends, corrections, uploads and compaction, whether they
+were made by this worker or another.
+
+Hits, misses and the LLM time saved (the generation time of each reused
+answer) are counted in app/metrics.py as semantic_cache.hits / .misses /
+.saved_ms.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from app import metrics, utils
+
+INITIAL_SLOTS = 16 # Rows a new bucket starts with; it doubles up to the capacity as it fills
+
+
+class _Bucket:
+    def __init__(self, version, capacity: int, dim: int):
+        self.version = version
+        self.capacity = capacity
+        slots = min(INITIAL_SLOTS, capacity)
+        self.vectors = np.zeros((slots, dim), dtype=np.float32)
+        self.entries = [None] * slots # slot -> (question, answer, snippets, created, llm_seconds)
+        self.recency = OrderedDict() # used slots, least recently used first
+
+    def free_slot(self) -> int:
+        """A slot for a new entry: an empty one, else a new one from growing, else the least recently used."""
+        if len(self.recency) < len(self.entries):
+            return next(slot for slot, entry in enumerate(self.entries) if entry is None)
+        if len(self.entries) < self.capacity:
+            slots = min(self.capacity, len(self.entries) * 2)
+            vectors = np.zeros((slots, self.vectors.shape[1]), dtype=np.float32)
+            vectors[:len(self.entries)] = self.vectors
+            self.vectors = vectors
+            self.entries.extend([None] * (slots - len(self.entries)))
+            return len(self.recency)
+        slot, _ = self.recency.popitem(last=False)
+        return slot
+
+
+class SemanticCache:
+    def __init__(self, capacity: int, ttl: float, threshold: float):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.threshold = threshold
+        self._buckets = {} # (company, question_type) -> _Bucket
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def get(self, company: str, question_type: str, embedding) -> dict:
+        """The cached answer for the closest earlier question, or None.
+
+        Returns {'question', 'answer', 'snippets', 'similarity'}.
+        """
+        if not self.enabled:
+            return None
+        query = _unit(embedding)
+        version = utils.get_kb_version(company)
+        with self._lock:
+            bucket = self._buckets.get((company, question_type))
+            if bucket is not None and bucket.version != version:
+                self._drop_company(company)
+                bucket = None
+            hit = self._lookup(bucket, query) if bucket is not None else None
+        if hit is None:
+            metrics.increment("semantic_cache.misses")
+            return None
+        question, answer, snippets, _, llm_seconds, similarity = hit
+        metrics.increment("semantic_cache.hits")
+        metrics.increment("semantic_cache.saved_ms", int(llm_seconds * 1000))
+        return {'question': question, 'answer': answer, 'snippets': snippets, 'similarity': round(similarity, 4)}
+
+    def _lookup(self, bucket, query):
+        if not bucket.recency or len(query) != bucket.vectors.shape[1]:
+            return None
+        now = time.monotonic()
+        for slot in [slot for slot in bucket.recency if now - bucket.entries[slot][3] > self.ttl]:
+            del bucket.recency[slot]
+            bucket.entries[slot] = None
+        if not bucket.recency:
+            return None
+        slots = np.fromiter(bucket.recency, dtype=np.int64, count=len(bucket.recency))
+        similarities = bucket.vectors[slots] @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        slot = int(slots[best])
+        bucket.recency.move_to_end(slot)
+        return (*bucket.entries[slot], float(similarities[best]))
+
+    def put(self, company: str, question_type: str, question: str, embedding, answer: str,
+            snippets: list = None, llm_seconds: float = 0.0):
+        """Caches a generated answer; `llm_seconds` is what generating it cost."""
+        if not self.enabled:
+            return
+        vector = _unit(embedding)
+        version = utils.get_kb_version(company)
+        with self._lock:
+            key = (company, question_type)
+            bucket = self._buckets.get(key)
+            if bucket is not None and bucket.version != version:
+                self._drop_company(company)
+                bucket = None
+            if bucket is None or bucket.vectors.shape[1] != len(vector):
+                bucket = self._buckets[key] = _Bucket(version, self.capacity, len(vector))
+            slot = bucket.free_slot()
+            bucket.vectors[slot] = vector
+            bucket.entries[slot] = (question, answer, snippets or [], time.monotonic(), llm_seconds)
+            bucket.recency[slot] = None
+
+    def invalidate(self, company: str = None):
+        """Empties the company's buckets (every bucket if no company is given)."""
+        with self._lock:
+            if company is None:
+                self._buckets.clear()
+            else:
+                self._drop_company(company)
+
+    def _drop_company(self, company):
+        for key in [key for key in self._buckets if key[0] == company]:
+            del self._buckets[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = sum(len(bucket.recency) for bucket in self._buckets.values())
+        return {'entries': entries, 'buckets': len(self._buckets), 'capacity_per_bucket': self.capacity,
+                'ttl_seconds': self.ttl, 'threshold': self.threshold}
+
+
+def _unit(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+cache = SemanticCache(utils.SEMANTIC_CACHE_CAPACITY, utils.SEMANTIC_CACHE_TTL, utils.SEMANTIC_CACHE_THRESHOLD)
@@ -0,0 +1,34 @@
+"""Startup cost accounting.
+
+The heavy dependencies (chromadb, sentence-transformers/torch, and httpx for
+the LLM client) are imported lazily, so the time they cost is paid on first
+retrieval or LLM use rather than at boot. Each lazy import and initialization step is wrapped in
+`timed()`, and `report()` returns what this process has spent so far (it is
+also included in `/readyz`). See app/startup_report.py for a cold-start
+breakdown per dependency.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+_timings = {}
+_lock = threading.Lock()
+
+
+def record(name: str, seconds: float):
+    with _lock:
+        _timings[name] = _timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def timed(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def report() -> dict:
+    with _lock:
+        return {name: round(seconds, 4) for name, seconds in _timings.items()}
@@ -0,0 +1,57 @@
+"""Prints a cold-start cost breakdown: `python -m app.startup_report`.
+
+Each dependency is imported in a fresh interpreter so that shared transitive
+imports do not hide each other's cost. The app boot line shows what importing
+the app (and so `create_app()`) costs, which should not include any of the
+heavy dependencies since they are loaded on first use.
+"""
+import json
+import subprocess
+import sys
+
+HEAVY_DEPENDENCIES = ["flask", "chromadb", "sentence_transformers", "torch", "httpx"]
+
+
+def measure_import(module_name: str) -> float:
+    """Cold import time of a module in seconds (None if it is not installed)."""
+    code = (
+        "import time; t = time.perf_counter(); "
+        f"import {module_name}; "
+        "print(time.perf_counter() - t)"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def measure_app_boot() -> dict:
+    """Imports the app in a fresh interpreter and returns its startup timings plus the modules it loaded."""
+    code = (
+        "import json, sys, time; t = time.perf_counter(); "
+        "import app; from app import startup; "
+        "r = startup.report(); r['import app (total)'] = time.perf_counter() - t; "
+        f"r['heavy modules loaded'] = [m for m in {HEAVY_DEPENDENCIES[1:]!r} if m in sys.modules]; "
+        "print(json.dumps(r))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if result.returncode != 0:
+        return {'error': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'failed'}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    print("Cold import cost per dependency:")
+    for module_name in HEAVY_DEPENDENCIES:
+        seconds = measure_import(module_name)
+        shown = "not installed" if seconds is None else f"{seconds * 1000:8.1f} ms"
+        print(f"  {module_name:<24} {shown}")
+
+    print("\nApp boot:")
+    for name, value in measure_app_boot().items():
+        shown = f"{value * 1000:8.1f} ms" if isinstance(value, float) else value
+        print(f"  {name:<24} {shown}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,198 @@
+from __future__ import annotations
+
+import hashlib
 import json
 import os
+import threading
+import time
 import uuid
-import chromadb
-from chromadb.utils import embedding_functions
-import openai # Added for LLM integration
+from collections import OrderedDict
+from typing import TYPE_CHECKING
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from app import companies, metrics, qa_parser, startup
+from app.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.file_lock import file_lock
 from app.models import User, QA
+from app.qa_index import QAIndex, normalize_question
+from app.rate_limiter import LLMRateLimiter, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
 from app.data.Type import PROMPT_TEMPLATES # Added for LLM integration
 
-# OpenAI API Key Setup
-openai.api_key = os.getenv("OPENAI_API_KEY")
-if openai.api_key is None:
-    print("Warning: OPENAI_API_KEY environment variable not set. LLM functions will not work.")
+if TYPE_CHECKING:
+    import chromadb
+
+# chromadb, sentence-transformers (torch) and httpx (the LLM client) are imported on first use
+# so that importing the app stays cheap for workers and tests that never
+# touch retrieval or the LLM. See app/startup.py for the cost breakdown.
+llm_client = None
+completion_cache = None
 
 USER_FILE = 'app/data/User.json'
 TALLMAN_QA_FILE = 'app/data/Tallman_QA.txt'
 MCR_QA_FILE = 'app/data/MCR_QA.txt'
 BRADLEY_QA_FILE = 'app/data/Bradley_QA.txt'
+COMPANIES = ["Tallman", "MCR", "Bradley"] # Served when there is no COMPANIES_FILE
+QA_DATA_DIR = 'app/data'
+COMPANIES_FILE = os.environ.get("COMPANIES_FILE", "app/data/companies.json") # Company registry (app/companies.py)
+COLLECTION_CACHE_SIZE = int(os.environ.get("COLLECTION_CACHE_SIZE", "64")) # Open collection handles kept; 0 opens per call
+QA_INDEX_CACHE_SIZE = int(os.environ.get("QA_INDEX_CACHE_SIZE", "64")) # Companies whose parsed Q&A index (and BM25 postings) stay in memory
 
 CHROMA_DATA_PATH = "app/data/chroma_db"
-client = chromadb.PersistentClient(path=CHROMA_DATA_PATH)
 DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2" # "all-mpnet-base-v2" is another good one
+CHROMA_BATCH_SIZE = 1000 # Max items per Chroma get/upsert/delete call
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma") # "chroma" or "numpy" (app/vector_store.py)
+VECTOR_INDEX_PATH = os.environ.get("VECTOR_INDEX_PATH", "app/data/vector_index")
+VECTOR_COMPRESSION = os.environ.get("VECTOR_COMPRESSION", "none") # "int8", "binary" or "pca<N>" (app/quantization.py)
+HYBRID_SEARCH = os.environ.get("HYBRID_SEARCH", "on") # "off" disables BM25 fusion in query_collection (app/lexical.py)
+HYBRID_CANDIDATES = int(os.environ.get("HYBRID_CANDIDATES", "10")) # Vector and keyword hits each fed into the fusion
+ASK_FEDERATED_CONCURRENCY = int(os.environ.get("ASK_FEDERATED_CONCURRENCY", "8")) # Threads shared by all federated searches
+ASK_BATCH_LLM_CONCURRENCY = int(os.environ.get("ASK_BATCH_LLM_CONCURRENCY", "8")) # LLM calls in flight per /api/ask_batch request
+EXACT_MATCH = os.environ.get("EXACT_MATCH", "on") # "off" sends every /api/ask question through retrieval and the LLM
+EXACT_MATCH_REPHRASE = os.environ.get("EXACT_MATCH_REPHRASE", "off") # "on" has the LLM rephrase exact-match answers
+SEMANTIC_CACHE_CAPACITY = int(os.environ.get("SEMANTIC_CACHE_CAPACITY", "1000")) # Answers per (company, question type); 0 disables
+SEMANTIC_CACHE_TTL = float(os.environ.get("SEMANTIC_CACHE_TTL", "3600")) # Seconds a generated answer may be reused
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.95")) # Min cosine similarity of the questions
+EMBEDDING_BATCH_SIZE = 256 # Texts per embedding call for batched appends
+DEDUP_MODE = os.environ.get("DEDUP_MODE", "off") # Near-duplicate handling on append: "off", "skip" or "merge"
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", "0.92")) # Cosine similarity above which questions are duplicates
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "app/data/embedding_cache")
+EMBEDDING_CACHE_CAPACITY = int(os.environ.get("EMBEDDING_CACHE_CAPACITY", "100000")) # 0 disables the cache
+EMBEDDING_CACHE_DTYPE = os.environ.get("EMBEDDING_CACHE_DTYPE", "float32") # or "float16" to halve its size
+EMBEDDING_COALESCE_WINDOW_MS = float(os.environ.get("EMBEDDING_COALESCE_WINDOW_MS", "3")) # 0 embeds each call on its own
+EMBEDDING_COALESCE_MAX_BATCH = int(os.environ.get("EMBEDDING_COALESCE_MAX_BATCH", "32")) # Texts that close a window early
+EMBEDDING_SERVER_SOCKET = os.environ.get("EMBEDDING_SERVER_SOCKET", "") # Embed via app/embedding_server.py instead of a model per worker
+EMBEDDING_SERVER_TIMEOUT = float(os.environ.get("EMBEDDING_SERVER_TIMEOUT", "30")) # Seconds to wait for the server (also at start-up)
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1") # Any OpenAI-compatible endpoint (app/llm_client.py)
+LLM_MODEL = os.environ.get("LLM_MODEL", "gpt-3.5-turbo")
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "5")) # Seconds per connection attempt
+LLM_READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", "60")) # Max seconds between response bytes
+LLM_TOTAL_TIMEOUT = float(os.environ.get("LLM_TOTAL_TIMEOUT", "90")) # Deadline for one LLM call, retries included
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "3")) # Retries of timeouts, connection errors, 429 and 5xx
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", "0.5")) # First retry waits up to this many seconds (doubling, jittered)
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", "8"))
+LLM_POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", "20")) # Keep-alive connections to the LLM endpoint per process
+LLM_REQUESTS_PER_MINUTE = float(os.environ.get("LLM_REQUESTS_PER_MINUTE", "3500")) # Provider rate limits (app/rate_limiter.py); 0 = none
+LLM_TOKENS_PER_MINUTE = float(os.environ.get("LLM_TOKENS_PER_MINUTE", "90000"))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "16")) # LLM calls in flight per process; 0 = no cap
+LLM_QUEUE_TIMEOUT = float(os.environ.get("LLM_QUEUE_TIMEOUT", "30")) # Longest wait for a rate limit slot
+LLM_RATE_LIMIT_FILE = os.environ.get("LLM_RATE_LIMIT_FILE", "") # Shared bucket state for all workers; empty = per process
+LLM_CIRCUIT_FAILURES = int(os.environ.get("LLM_CIRCUIT_FAILURES", "5")) # Consecutive failures that open the circuit (app/circuit_breaker.py)
+LLM_CIRCUIT_SLOW_SECONDS = float(os.environ.get("LLM_CIRCUIT_SLOW_SECONDS", "20")) # A call this slow counts as a failure
+LLM_CIRCUIT_RESET_SECONDS = float(os.environ.get("LLM_CIRCUIT_RESET_SECONDS", "30")) # Open time before a probe call
+LLM_UNAVAILABLE_MESSAGE = "Error generating answer from LLM: the service is temporarily unavailable."
+COMPLETION_CACHE_PATH = os.environ.get("COMPLETION_CACHE_PATH", "app/data/completion_cache.sqlite3")
+COMPLETION_CACHE_TTL = float(os.environ.get("COMPLETION_CACHE_TTL", "86400")) # Seconds an LLM completion is reused; 0 disables
+COMPLETION_CACHE_MEMORY_ENTRIES = int(os.environ.get("COMPLETION_CACHE_MEMORY_ENTRIES", "1024")) # In-process LRU in front of SQLite
+COMPLETION_CACHE_MAX_ROWS = int(os.environ.get("COMPLETION_CACHE_MAX_ROWS", "100000"))
+
+# The Chroma client and the embedding model are expensive to build, so they are
+# created on first use (normally by the background warm-up in app/warmup.py)
+# rather than at import time.
+_NOT_LOADED = object()
+client = None
+sentence_transformer_ef = _NOT_LOADED
+_init_lock = threading.RLock()
+
+def get_chroma_client():
+    global client
+    if client is None:
+        with _init_lock:
+            if client is None:
+                with startup.timed("import chromadb"):
+                    import chromadb
+                with startup.timed("open chroma client"):
+                    client = chromadb.PersistentClient(path=CHROMA_DATA_PATH)
+    return client
+
+def get_embedding_function():
+    """Returns the shared embedding function, loading the model on first call (None if it cannot be loaded)."""
+    global sentence_transformer_ef
+    if sentence_transformer_ef is _NOT_LOADED:
+        with _init_lock:
+            if sentence_transformer_ef is _NOT_LOADED:
+                if EMBEDDING_SERVER_SOCKET:
+                    sentence_transformer_ef = _embedding_server_function()
+                else:
+                    sentence_transformer_ef = _load_embedding_model()
+    return sentence_transformer_ef
 
-try:
-    sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=DEFAULT_EMBEDDING_MODEL)
-except Exception as e:
-    print(f"Error initializing SentenceTransformerEmbeddingFunction: {e}")
-    print("ChromaDB embedding functions might not work. Ensure sentence-transformers is installed and model is accessible.")
-    sentence_transformer_ef = None # Fallback or handle error appropriately
+def _load_embedding_model():
+    try:
+        with startup.timed("import chromadb"):
+            from chromadb.utils import embedding_functions
+        with startup.timed("load embedding model"):
+            return cached_embedding_function(coalesced_embedding_function(
+                embedding_functions.SentenceTransformerEmbeddingFunction(model_name=DEFAULT_EMBEDDING_MODEL)
+            ))
+    except Exception as e:
+        print(f"Error initializing SentenceTransformerEmbeddingFunction: {e}")
+        print("ChromaDB embedding functions might not work. Ensure sentence-transformers is installed and model is accessible.")
+        return None # Fallback or handle error appropriately
+
+def _embedding_server_function():
+    """A client of the shared embedding server (no model or torch in this process), or None if it does not answer."""
+    from app.embedding_server import EmbeddingServerClient
+    embedding_function = EmbeddingServerClient(EMBEDDING_SERVER_SOCKET, timeout=EMBEDDING_SERVER_TIMEOUT)
+    try:
+        with startup.timed("connect embedding server"):
+            info = embedding_function.wait_ready(EMBEDDING_SERVER_TIMEOUT)
+    except Exception as e:
+        print(f"Error connecting to the embedding server at {EMBEDDING_SERVER_SOCKET}: {e}")
+        print("Start it with `python -m app.embedding_server`, or unset EMBEDDING_SERVER_SOCKET to load the model in each worker.")
+        return None
+    return cached_embedding_function(embedding_function, model_name=info['model_name'])
+
+def cached_embedding_function(embedding_function, model_name: str = DEFAULT_EMBEDDING_MODEL):
+    """Puts the on-disk embedding cache in front of an embedding function (unless the cache is disabled)."""
+    if EMBEDDING_CACHE_CAPACITY <= 0:
+        return embedding_function
+    from app.embedding_cache import CachedEmbeddingFunction, EmbeddingCache
+    cache = EmbeddingCache(EMBEDDING_CACHE_PATH, model_name, capacity=EMBEDDING_CACHE_CAPACITY, dtype=EMBEDDING_CACHE_DTYPE)
+    return CachedEmbeddingFunction(embedding_function, cache)
+
+def embed_queries(texts: list[str]) -> list:
+    """Query embeddings of many texts in one batched call, or None if the embedding model is not available."""
+    embedding_function = get_embedding_function()
+    return _embed_questions(embedding_function, texts) if embedding_function is not None else None
+
+def embed_query(text: str) -> list:
+    """The query embedding of `text`, or None if the embedding model is not available."""
+    embedding_function = get_embedding_function()
+    return embedding_function([text])[0] if embedding_function is not None else None
+
+def coalesced_embedding_function(embedding_function):
+    """Micro-batches concurrent small embedding calls (app/coalescer.py), unless the window is 0."""
+    if EMBEDDING_COALESCE_WINDOW_MS <= 0:
+        return embedding_function
+    from app.coalescer import CoalescingEmbeddingFunction
+    return CoalescingEmbeddingFunction(embedding_function, EMBEDDING_COALESCE_WINDOW_MS / 1000.0,
+                                       EMBEDDING_COALESCE_MAX_BATCH)
+
+def get_embedding_cache_stats():
+    """Hit/miss counters of the embedding cache, or None if it is not in use."""
+    cache = getattr(sentence_transformer_ef, 'cache', None)
+    return cache.stats() if cache is not None else None
+
+def get_llm_client():
+    """Returns the shared LLM client (app/llm_client.py), creating it on first call."""
+    global llm_client
+    if llm_client is None:
+        with _init_lock:
+            if llm_client is None:
+                with startup.timed("import httpx"):
+                    from app.llm_client import LLMClient
+                api_key = os.getenv("OPENAI_API_KEY")
+                if api_key is None:
+                    print("Warning: OPENAI_API_KEY environment variable not set. LLM functions will not work.")
+                llm_client = LLMClient(
+                    api_key, base_url=OPENAI_BASE_URL, model=LLM_MODEL, connect_timeout=LLM_CONNECT_TIMEOUT,
+                    read_timeout=LLM_READ_TIMEOUT, total_timeout=LLM_TOTAL_TIMEOUT, max_retries=LLM_MAX_RETRIES,
+                    backoff_base=LLM_BACKOFF_BASE, backoff_max=LLM_BACKOFF_MAX, pool_size=LLM_POOL_SIZE,
+                    limiter=LLMRateLimiter(LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, LLM_MAX_CONCURRENCY,
+                                           LLM_QUEUE_TIMEOUT, LLM_RATE_LIMIT_FILE),
+                    breaker=CircuitBreaker(LLM_CIRCUIT_FAILURES, LLM_CIRCUIT_SLOW_SECONDS, LLM_CIRCUIT_RESET_SECONDS)
+                )
+    return llm_client
 
 
 def hash_password(password: str) -> str:
@@ -68,66 +232,152 @@ def save_users(users: list[User]) -> None:
     with open(USER_FILE, 'w') as f:
         json.dump([user.to_dict() for user in users], f, indent=4)
 
-def get_qa_filepath(company: str) -> str:
-    if company == "Tallman":
-        return TALLMAN_QA_FILE
-    elif company == "MCR":
-        return MCR_QA_FILE
-    elif company == "Bradley":
-        return BRADLEY_QA_FILE
-    else:
+def _builtin_companies() -> list[companies.Company]:
+    """The companies served while there is no COMPANIES_FILE, with their Q&A files."""
+    qa_files = {'Tallman': TALLMAN_QA_FILE, 'MCR': MCR_QA_FILE, 'Bradley': BRADLEY_QA_FILE}
+    return [companies.Company(name, qa_file=qa_files.get(name)) for name in COMPANIES]
+
+company_registry = companies.CompanyRegistry(COMPANIES_FILE, _builtin_companies)
+
+def get_companies() -> list[str]:
+    """Names of the registered companies (app/companies.py)."""
+    return company_registry.names()
+
+def get_company(company: str) -> companies.Company:
+    entry = company_registry.get(company) if isinstance(company, str) else None
+    if entry is None:
         raise ValueError(f"Invalid company name: {company}")
+    return entry
 
-def load_qa_data(company: str) -> list[QA]:
-    filepath = get_qa_filepath(company)
-    qa_list = []
+def is_valid_company(company: str) -> bool:
+    return isinstance(company, str) and company_registry.get(company) is not None
+
+def get_qa_filepath(company: str) -> str:
+    entry = get_company(company)
+    return entry.qa_file or os.path.join(QA_DATA_DIR, f"{entry.name}_QA.txt")
+
+def make_qa_id(company: str, question: str, answer: str, position: int = 0) -> str:
+    """Content-addressed ID for a Q&A pair.
+
+    `position` is the occurrence number of an identical (question, answer) pair
+    within the company file, so exact duplicates still get distinct IDs while
+    inserting or removing other pairs never changes an existing pair's ID.
+    """
+    key = "\x1f".join([company, normalize_question(question), answer.strip(), str(position)])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+def set_stable_qa_id(qa_item: QA, occurrences: dict) -> QA:
+    """Sets the stable ID of the next QA item read from a company file.
+
+    `occurrences` counts the identical pairs seen so far in that file and is
+    updated in place; pass the same dict for every item of one file, in order.
+    """
+    content_key = (qa_item.company, normalize_question(qa_item.question), qa_item.answer.strip())
+    position = occurrences.get(content_key, 0)
+    occurrences[content_key] = position + 1
+    qa_item.id = make_qa_id(qa_item.company, qa_item.question, qa_item.answer, position)
+    return qa_item
+
+def assign_qa_ids(qa_items):
+    """Yields the given QA items (in file order) with their stable IDs set."""
+    occurrences = {}
+    for qa_item in qa_items:
+        yield set_stable_qa_id(qa_item, occurrences)
+
+def qa_file_lock(company: str):
+    """Cross-process lock serializing writers (appends, compaction) of a company's Q&A file."""
+    return file_lock(f"{get_qa_filepath(company)}.lock")
+
+def _qa_file_signature(filepath: str):
     try:
-        with open(filepath, 'r') as f:
-            lines = [line.strip() for line in f if line.strip()]
-
-            i = 0
-            while i < len(lines):
-                if lines[i].startswith("##Update##"):
-                    i += 1
-                    continue
-
-                if i + 1 < len(lines):
-                    question = lines[i]
-                    answer = lines[i+1]
-
-                    if answer.startswith("##Update##"):
-                        i += 1
-                        continue
-
-                    qa_id = uuid.uuid4().hex
-                    qa_list.append(QA(
-                        id=qa_id,
-                        question=question,
-                        answer=answer,
-                        company=company
-                    ))
-                    i += 2
-                else:
-                    break
-            return qa_list
+        stat = os.stat(filepath)
     except FileNotFoundError:
-        return []
+        return None
+    return (filepath, stat.st_size, stat.st_mtime_ns)
 
-def append_qa_pair(company: str, question: str, answer: str, is_update: bool = False) -> QA:
-    filepath = get_qa_filepath(company)
-    qa_id = uuid.uuid4().hex
-    new_qa = QA(id=qa_id, question=question, answer=answer, company=company)
+def get_kb_version(company: str):
+    """Changes whenever the company's Q&A file does (append, correction, upload, compaction)."""
+    return _qa_file_signature(get_qa_filepath(company))
+
+def build_qa_index(company: str) -> QAIndex:
+    """Parses the company's file into a QAIndex, applying ##Update## supersedes."""
+    index = QAIndex(company)
+    try:
+        for record in qa_parser.iter_qa_records(get_qa_filepath(company)):
+            qa_item = QA(question=record.question, answer=record.answer, company=company)
+            index.add(set_stable_qa_id(qa_item, index.occurrences), record.is_update)
+    except FileNotFoundError:
+        pass
+    return index
+
+# company -> (file signature, QAIndex), least recently used first. An entry is rebuilt whenever the
+# file changed other than through append_qa_pair(s) in this process, and at most QA_INDEX_CACHE_SIZE
+# companies are kept, so memory follows the active tenants like the collection handles do.
+_qa_indexes = OrderedDict()
+_qa_index_lock = threading.RLock()
+
+def _remember_qa_index(company: str, signature, index: QAIndex) -> None:
+    with _qa_index_lock:
+        _qa_indexes[company] = (signature, index)
+        _qa_indexes.move_to_end(company)
+        while len(_qa_indexes) > max(QA_INDEX_CACHE_SIZE, 1):
+            _qa_indexes.popitem(last=False)
+            metrics.increment("qa_index_cache.evictions")
+
+def get_qa_index(company: str) -> QAIndex:
+    with _qa_index_lock:
+        signature = _qa_file_signature(get_qa_filepath(company))
+        cached = _qa_indexes.get(company)
+        if cached is None or cached[0] != signature:
+            cached = (signature, build_qa_index(company))
+            _remember_qa_index(company, *cached)
+        else:
+            _qa_indexes.move_to_end(company)
+        return cached[1]
 
-    with open(filepath, 'a') as f:
-        if is_update:
-            f.write("##Update##\n")
-        f.write(f"{question}\n")
-        f.write(f"{answer}\n\n")
+def invalidate_qa_index(company: str) -> None:
+    with _qa_index_lock:
+        _qa_indexes.pop(company, None)
 
-    if sentence_transformer_ef is not None:
+def load_qa_data(company: str) -> list[QA]:
+    """Returns the company's live Q&A pairs: corrections replace the pairs they supersede."""
+    return get_qa_index(company).live_items()
+
+def find_exact_match(company: str, question: str) -> QA:
+    """The newest live pair whose question equals `question` up to case, whitespace and punctuation, or None.
+
+    A hash lookup in the company's QAIndex, which append_qa_pair(s) and
+    corrections keep current. Counted as exact_match.hits / .misses.
+    """
+    matches = get_qa_index(company).lookup(question)
+    metrics.increment("exact_match.hits" if matches else "exact_match.misses")
+    return matches[-1] if matches else None
+
+def append_qa_pair(company: str, question: str, answer: str, is_update: bool = False, dedup: str = None) -> QA:
+    """Appends one Q&A pair. With near-duplicate handling on (see append_qa_pairs), returns None if it was skipped."""
+    if (dedup or DEDUP_MODE) != 'off' and not is_update:
+        new_items = append_qa_pairs(company, [(question, answer)], dedup=dedup)
+        return new_items[0] if new_items else None
+    filepath = get_qa_filepath(company)
+    new_qa = QA(question=question, answer=answer, company=company)
+
+    with _qa_index_lock, qa_file_lock(company):
+        index = get_qa_index(company)
+        with open(filepath, 'a') as f:
+            if is_update:
+                f.write("##Update##\n")
+            f.write(f"{question}\n")
+            f.write(f"{answer}\n\n")
+        set_stable_qa_id(new_qa, index.occurrences)
+        superseded = index.add(new_qa, is_update)
+        _remember_qa_index(company, _qa_file_signature(filepath), index)
+
+    if get_embedding_function() is not None:
         try:
             collection = get_or_create_collection(company)
             add_qa_to_collection(collection, new_qa)
+            if superseded:
+                collection.delete(ids=[qa_item.id for qa_item in superseded])
             print(f"Appended Q&A for {company} to file and ChromaDB.")
         except Exception as e:
             print(f"Error adding appended Q&A to ChromaDB for {company}: {e}")
@@ -136,20 +386,235 @@ def append_qa_pair(company: str, question: str, answer: str, is_update: bool = F
 
     return new_qa
 
-def get_or_create_collection(company_name: str) -> chromadb.api.models.Collection.Collection:
-    if sentence_transformer_ef is None:
-        raise RuntimeError("SentenceTransformerEmbeddingFunction not initialized. Cannot get or create collection.")
-    collection_name = f"{company_name.lower()}_qa"
+def _embed_questions(embedding_function, questions: list[str]) -> list:
+    embeddings = []
+    for chunk in _chunked(questions, EMBEDDING_BATCH_SIZE):
+        embeddings.extend(embedding_function(chunk))
+    return embeddings
+
+def _merge_answers(existing: str, answer: str) -> str:
+    """Keeps the existing answer and adds the new one after it, unless it already says the same."""
+    if normalize_question(answer) in normalize_question(existing):
+        return existing
+    return f"{existing} {answer}" # one line: the Q&A file format has single-line answers
+
+def _resolve_near_duplicates(company: str, collection, entries: list, embeddings: list, mode: str,
+                             duplicates: list) -> tuple[list, list]:
+    """Drops ('skip') or merges ('merge') entries whose question duplicates a stored or earlier one.
+
+    A merge keeps the answers already stored for the question (all of its
+    live pairs, which the correction supersedes) and adds the duplicate's
+    answer to them, written as one correction of that question.
+    """
+    from app import dedup
+    stored_matches = dedup.find_near_duplicates(collection, embeddings, DEDUP_THRESHOLD)
+    batch_matches = dedup.find_batch_duplicates(embeddings, DEDUP_THRESHOLD)
+    index = get_qa_index(company) if mode == 'merge' else None
+    kept_entries, kept_embeddings = [], []
+    resolved = [] # per entry: (question, position in kept_entries or None) it ended up as
+    merged_into = {} # stored ID -> position of its correction in kept_entries
+    stored_answers = {} # position of such a correction -> the answer it started from
+    for i, ((question, answer, is_update), vector) in enumerate(zip(entries, embeddings)):
+        if stored_matches[i] is not None:
+            match_id, match_question, match_vector, similarity = stored_matches[i]
+            target = (match_question, merged_into.get(match_id))
+        elif batch_matches[i] is not None:
+            match_id = None
+            j, similarity = batch_matches[i]
+            target = resolved[j]
+        else:
+            resolved.append((question, len(kept_entries)))
+            kept_entries.append((question, answer, is_update))
+            kept_embeddings.append(vector)
+            continue
+        duplicates.append({'question': question, 'duplicate_of': target[0], 'duplicate_of_id': match_id,
+                           'similarity': round(similarity, 4), 'action': mode})
+        if mode == 'merge':
+            position = target[1]
+            if position is None:
+                # The correction supersedes every live pair with this question, so it carries all their answers.
+                stored = index.lookup(match_question) or [qa_item for qa_item in [index.get(match_id)] if qa_item]
+                position = len(kept_entries)
+                merged_into[match_id] = position
+                if stored:
+                    stored_answers[position] = stored[0].answer
+                    for qa_item in stored[1:]:
+                        stored_answers[position] = _merge_answers(stored_answers[position], qa_item.answer)
+                kept_entries.append((match_question, stored_answers.get(position, answer), True))
+                kept_embeddings.append(match_vector)
+                target = (match_question, position)
+            target_question, existing, target_update = kept_entries[position]
+            kept_entries[position] = (target_question, _merge_answers(existing, answer), target_update)
+        resolved.append(target)
+    # A stored pair whose answer gained nothing needs no correction.
+    unchanged = {position for position, stored_answer in stored_answers.items() if kept_entries[position][1] == stored_answer}
+    return ([entry for position, entry in enumerate(kept_entries) if position not in unchanged],
+            [vector for position, vector in enumerate(kept_embeddings) if position not in unchanged])
+
+def write_qa_pairs(company: str, entries: list[tuple[str, str, bool]]) -> tuple[list[QA], list[QA]]:
+    """Appends (question, answer, is_update) entries to the company's Q&A file under its lock.
+
+    Returns the new pairs, with stable IDs from the file's QAIndex, and the
+    pairs they superseded (possibly including new ones). Does not touch the
+    collection.
+    """
+    filepath = get_qa_filepath(company)
+    new_items = [QA(question=question, answer=answer, company=company, is_update=entry_update)
+                 for question, answer, entry_update in entries]
+    superseded = []
+    with _qa_index_lock, qa_file_lock(company):
+        index = get_qa_index(company)
+        with open(filepath, 'a') as f:
+            f.write("".join(
+                ("##Update##\n" if entry_update else "") + f"{question}\n{answer}\n\n"
+                for question, answer, entry_update in entries
+            ))
+        for qa_item in new_items:
+            set_stable_qa_id(qa_item, index.occurrences)
+            superseded.extend(index.add(qa_item, qa_item.is_update))
+        _remember_qa_index(company, _qa_file_signature(filepath), index)
+    return new_items, superseded
+
+def append_qa_pairs(company: str, pairs: list[tuple[str, str]], is_update: bool = False, timings: dict = None,
+                    dedup: str = None, duplicates: list = None) -> list[QA]:
+    """Appends many Q&A pairs at once: one buffered file write, batched embedding and chunked upserts.
+
+    The pairs must already be validated. If `timings` is given, it is filled
+    with the seconds spent in each phase ('dedup', 'write', 'embed', 'upsert').
+
+    With `dedup` (default DEDUP_MODE) set to 'skip' or 'merge', a question
+    whose cosine similarity to a stored question, or to an earlier one in the
+    batch, reaches DEDUP_THRESHOLD is dropped ('skip'), or has its answer
+    added to that question's answer ('merge', written as a correction that
+    keeps the existing answer first). Each such pair is reported in
+    `duplicates`.
+
+    Errors from embedding or upserting are re-raised after the file write,
+    so callers can report the batch as failed.
+    """
+    timings = timings if timings is not None else {}
+    duplicates = duplicates if duplicates is not None else []
+    dedup = dedup or DEDUP_MODE
+    get_qa_filepath(company) # raises ValueError for an unknown company before any embedding work
+    entries = [(question, answer, is_update) for question, answer in pairs]
+    if not entries:
+        return []
+
+    embedding_function = get_embedding_function()
+    collection = None
+    embeddings = None
+    if dedup != 'off' and embedding_function is not None:
+        collection = get_or_create_collection(company)
+        started = time.perf_counter()
+        embeddings = _embed_questions(embedding_function, [question for question, _, _ in entries])
+        timings['embed'] = time.perf_counter() - started
+        started = time.perf_counter()
+        entries, embeddings = _resolve_near_duplicates(company, collection, entries, embeddings, dedup, duplicates)
+        timings['dedup'] = time.perf_counter() - started
+        if duplicates:
+            print(f"{len(duplicates)} near-duplicate Q&A pairs for {company} ({dedup}).")
+
+    started = time.perf_counter()
+    new_items, superseded = write_qa_pairs(company, entries)
+    timings['write'] = time.perf_counter() - started
+
+    if embedding_function is None:
+        print("ChromaDB embedding function not available. Skipping add to collection for appended Q&A.")
+        return new_items
+
     try:
-        collection = client.get_or_create_collection(
-            name=collection_name,
-            embedding_function=sentence_transformer_ef
-        )
-        return collection
+        collection = collection or get_or_create_collection(company)
+        started = time.perf_counter()
+        # A pair superseded by a later pair of the same batch is never embedded.
+        stale_ids = [qa_item.id for qa_item in superseded]
+        stale_set = set(stale_ids)
+        live = [position for position, qa_item in enumerate(new_items) if qa_item.id not in stale_set]
+        live_items = [new_items[position] for position in live]
+        if embeddings is None:
+            live_embeddings = _embed_questions(embedding_function, [qa_item.question for qa_item in live_items])
+        else:
+            live_embeddings = [embeddings[position] for position in live]
+        timings['embed'] = timings.get('embed', 0.0) + time.perf_counter() - started
+
+        started = time.perf_counter()
+        upsert_qa_items(collection, live_items, live_embeddings)
+        new_ids = {qa_item.id for qa_item in new_items}
+        for chunk in _chunked([qa_id for qa_id in stale_ids if qa_id not in new_ids], CHROMA_BATCH_SIZE):
+            collection.delete(ids=chunk)
+        timings['upsert'] = time.perf_counter() - started
+        print(f"Appended {len(new_items)} Q&A pairs for {company} to file and ChromaDB.")
     except Exception as e:
-        print(f"Error getting or creating collection {collection_name}: {e}")
+        # The pairs are in the file (the next sync indexes them), but not searchable yet: let the caller know.
+        print(f"Error adding appended Q&A batch to ChromaDB for {company}: {e}")
         raise
 
+    return new_items
+
+def get_vector_backend(company_name: str) -> str:
+    """The retrieval backend for a company: VECTOR_BACKEND_<COMPANY> if set, else VECTOR_BACKEND."""
+    return os.environ.get(f"VECTOR_BACKEND_{company_name.upper()}", VECTOR_BACKEND)
+
+def get_vector_compression(company_name: str) -> str:
+    """Compact codes for a NumPy-backend company: VECTOR_COMPRESSION_<COMPANY>, else VECTOR_COMPRESSION."""
+    return os.environ.get(f"VECTOR_COMPRESSION_{company_name.upper()}", VECTOR_COMPRESSION)
+
+def _release_collection(key, collection) -> None:
+    backend, path, collection_name, _ = key
+    if backend == 'numpy':
+        from app import vector_store
+        vector_store.release_collection(path, collection_name)
+
+collection_cache = companies.CollectionCache(COLLECTION_CACHE_SIZE, on_evict=_release_collection)
+_collection_keys = {} # company -> cache key of its collection, to spot backend/compression changes
+
+def _forget_stale_collection(company_name: str, key) -> None:
+    """Drops the company's cached handle if its backend, path or compression changed since it was opened."""
+    previous = _collection_keys.get(company_name)
+    if previous is not None and previous != key:
+        collection_cache.invalidate(previous)
+        _release_collection(previous, None)
+    _collection_keys[company_name] = key
+
+def get_or_create_collection(company_name: str) -> chromadb.api.models.Collection.Collection:
+    """Returns the company's collection: a Chroma collection, or a NumpyCollection with the same API.
+
+    Handles are kept in an LRU (COLLECTION_CACHE_SIZE), so only the first
+    request for a company after it went cold opens the collection. A change
+    of the company's backend or compression settings opens it afresh.
+    """
+    embedding_function = get_embedding_function()
+    if embedding_function is None:
+        raise RuntimeError("SentenceTransformerEmbeddingFunction not initialized. Cannot get or create collection.")
+    entry = company_registry.get(company_name)
+    collection_name = entry.collection_name if entry is not None else companies.Company(company_name).collection_name
+    if get_vector_backend(company_name) == 'numpy':
+        from app import vector_store
+        compression = get_vector_compression(company_name)
+        key = ('numpy', VECTOR_INDEX_PATH, collection_name, compression)
+        _forget_stale_collection(company_name, key)
+        return collection_cache.get(
+            key, (embedding_function,),
+            lambda: vector_store.get_or_create_collection(VECTOR_INDEX_PATH, collection_name, embedding_function,
+                                                          compression=compression))
+    chroma_client = get_chroma_client()
+
+    def open_collection():
+        try:
+            return chroma_client.get_or_create_collection(
+                name=collection_name,
+                embedding_function=embedding_function
+            )
+        except Exception as e:
+            print(f"Error getting or creating collection {collection_name}: {e}")
+            raise
+
+    key = ('chroma', CHROMA_DATA_PATH, collection_name, None)
+    _forget_stale_collection(company_name, key)
+    return collection_cache.get(key, (chroma_client, embedding_function), open_collection)
+
+def get_collection_cache_stats() -> dict:
+    return collection_cache.stats()
+
 def add_qa_to_collection(collection: chromadb.api.models.Collection.Collection, qa_item: QA) -> None:
     if not qa_item.id:
         print(f"Warning: QA item for question '{qa_item.question}' is missing an ID. Generating one.")
@@ -164,52 +629,190 @@ def add_qa_to_collection(collection: chromadb.api.models.Collection.Collection,
     except Exception as e:
         print(f"Error upserting QA item {qa_item.id} into collection {collection.name}: {e}")
 
-def query_collection(collection: chromadb.api.models.Collection.Collection, query_text: str, n_results: int = 3) -> list[dict]:
+def query_collection(collection: chromadb.api.models.Collection.Collection, query_text: str, n_results: int = 3,
+                     company: str = None) -> list[dict]:
+    """Top pairs for the query by vector similarity.
+
+    With `company` given (and HYBRID_SEARCH on), the top HYBRID_CANDIDATES
+    vector hits and BM25 keyword hits from the company's QAIndex are merged
+    by reciprocal-rank fusion, so exact part numbers and product names are
+    found without raising `n_results`.
+    """
+    hybrid = company is not None and HYBRID_SEARCH != 'off'
     try:
         results = collection.query(
             query_texts=[query_text],
-            n_results=n_results
+            n_results=max(n_results, HYBRID_CANDIDATES) if hybrid else n_results
         )
         if results and results.get('metadatas') and results['metadatas'][0]:
-            return results['metadatas'][0]
-        return []
+            vector_hits = results['metadatas'][0]
+        else:
+            vector_hits = []
     except Exception as e:
         print(f"Error querying collection {collection.name} with text '{query_text}': {e}")
-        return []
+        vector_hits = []
+    if not hybrid:
+        return vector_hits
+    return fuse_keyword_hits(company, query_text, vector_hits, n_results)
+
+def query_collection_many(collection: chromadb.api.models.Collection.Collection, query_texts: list[str],
+                          query_embeddings: list, n_results: int = 3, company: str = None) -> list[list[dict]]:
+    """query_collection for many questions at once, with their embeddings already computed.
+
+    Runs a single vector search call for all of them; with `company` given,
+    each question's hits are fused with its keyword hits as in query_collection.
+    """
+    hybrid = company is not None and HYBRID_SEARCH != 'off'
+    try:
+        results = collection.query(
+            query_embeddings=list(query_embeddings),
+            n_results=max(n_results, HYBRID_CANDIDATES) if hybrid else n_results
+        )
+        metadatas = (results or {}).get('metadatas') or []
+    except Exception as e:
+        print(f"Error querying collection {collection.name} with {len(query_texts)} questions: {e}")
+        metadatas = []
+    per_question = [(metadatas[i] or []) if i < len(metadatas) else [] for i in range(len(query_texts))]
+    if not hybrid:
+        return per_question
+    return [fuse_keyword_hits(company, text, hits, n_results) for text, hits in zip(query_texts, per_question)]
+
+def max_federated_companies() -> int:
+    """Most companies one federated search may cover: more would evict each other's open collections."""
+    return COLLECTION_CACHE_SIZE if COLLECTION_CACHE_SIZE > 0 else len(get_companies())
+
+_federated_executor = None # (pid, ThreadPoolExecutor) shared by all federated searches of this process
+
+def _get_federated_executor():
+    global _federated_executor
+    if _federated_executor is None or _federated_executor[0] != os.getpid():
+        with _init_lock:
+            if _federated_executor is None or _federated_executor[0] != os.getpid():
+                from concurrent.futures import ThreadPoolExecutor
+                _federated_executor = (os.getpid(), ThreadPoolExecutor(max_workers=max(1, ASK_FEDERATED_CONCURRENCY),
+                                                                      thread_name_prefix="federated-search"))
+    return _federated_executor[1]
+
+def query_companies(company_names: list[str], query_text: str, n_results: int = 3) -> list[dict]:
+    """Top pairs for one question across several companies, each hit with its cosine 'distance'.
+
+    The question is embedded once and the companies' collections are searched
+    with that vector on a shared pool of ASK_FEDERATED_CONCURRENCY threads.
+    The hits are merged by their cosine distance to it, computed from the
+    returned embeddings, so companies on different backends or distance
+    spaces compare fairly. More than `max_federated_companies()` companies
+    raise ValueError.
+    """
+    import numpy as np
+    if len(company_names) > max_federated_companies():
+        raise ValueError(f"A search may cover at most {max_federated_companies()} companies, not {len(company_names)}.")
+    query_embedding = embed_query(query_text)
+    if query_embedding is None:
+        raise RuntimeError("SentenceTransformerEmbeddingFunction not initialized. Cannot query collections.")
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    def search(company):
+        try:
+            results = get_or_create_collection(company).query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                include=['metadatas', 'embeddings']
+            )
+        except Exception as e:
+            print(f"Error querying collection for {company} with text '{query_text}': {e}")
+            return []
+        metadatas = (results.get('metadatas') or [[]])[0] or []
+        if not metadatas or results.get('embeddings') is None:
+            return []
+        vectors = np.asarray(results['embeddings'][0], dtype=np.float32)
+        similarities = vectors @ query / np.maximum(np.linalg.norm(vectors, axis=1), 1e-12)
+        return [dict(metadata, distance=round(1.0 - float(similarity), 6))
+                for metadata, similarity in zip(metadatas, similarities)]
+
+    hits = [hit for company_hits in _get_federated_executor().map(search, company_names) for hit in company_hits]
+    return sorted(hits, key=lambda hit: hit['distance'])[:n_results]
+
+def fuse_keyword_hits(company: str, query_text: str, vector_hits: list[dict], n_results: int = 3) -> list[dict]:
+    """Reciprocal-rank fusion of ranked vector hits (metadata dicts) with the company's BM25 hits."""
+    from app import lexical
+    keyword_hits = get_qa_index(company).keyword_search(query_text, max(n_results, HYBRID_CANDIDATES))
+    by_id = {qa_item.id: qa_item.to_dict() for qa_item in keyword_hits}
+    by_id.update((hit.get('id'), hit) for hit in vector_hits)
+    fused = lexical.reciprocal_rank_fusion([[hit.get('id') for hit in vector_hits], [qa_item.id for qa_item in keyword_hits]])
+    return [by_id[qa_id] for qa_id in fused[:n_results]]
+
+def _chunked(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def get_collection_ids(collection: chromadb.api.models.Collection.Collection) -> set[str]:
+    """Returns every ID stored in the collection, paging through it without loading embeddings."""
+    ids = set()
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=CHROMA_BATCH_SIZE, offset=offset)
+        page_ids = page.get('ids') or []
+        ids.update(page_ids)
+        if len(page_ids) < CHROMA_BATCH_SIZE:
+            return ids
+        offset += len(page_ids)
+
+def upsert_qa_items(collection: chromadb.api.models.Collection.Collection, qa_items: list[QA], embeddings: list = None) -> None:
+    """Upserts in CHROMA_BATCH_SIZE chunks; precomputed `embeddings` (one per item) skip the collection's embedding function."""
+    for start in range(0, len(qa_items), CHROMA_BATCH_SIZE):
+        chunk = qa_items[start:start + CHROMA_BATCH_SIZE]
+        kwargs = {}
+        if embeddings is not None:
+            kwargs['embeddings'] = embeddings[start:start + CHROMA_BATCH_SIZE]
+        collection.upsert(
+            ids=[qa_item.id for qa_item in chunk],
+            documents=[qa_item.question for qa_item in chunk],
+            metadatas=[qa_item.to_dict() for qa_item in chunk],
+            **kwargs
+        )
 
-def load_all_qa_into_chroma():
-    if sentence_transformer_ef is None:
+def sync_company_into_chroma(company: str, full: bool = False) -> dict:
+    """Brings the company's collection in line with its Q&A text file.
+
+    Only pairs whose stable ID is not in the collection yet are embedded and
+    upserted, and IDs no longer present in the file are deleted, even when
+    the file is now empty or fully superseded. With `full=True` every pair
+    is re-upserted (the pre-sync behaviour).
+    Returns counts of added, deleted and unchanged items.
+    """
+    qa_data = load_qa_data(company)
+    stats = {'added': 0, 'deleted': 0, 'unchanged': 0}
+    if not qa_data:
+        print(f"No Q&A data found for {company}; removing any vectors left in its collection.")
+
+    collection = get_or_create_collection(company)
+    wanted = {qa_item.id: qa_item for qa_item in qa_data}
+    existing_ids = get_collection_ids(collection)
+
+    new_items = list(wanted.values()) if full else [qa_item for qa_id, qa_item in wanted.items() if qa_id not in existing_ids]
+    stale_ids = [qa_id for qa_id in existing_ids if qa_id not in wanted]
+
+    upsert_qa_items(collection, new_items)
+    for chunk in _chunked(stale_ids, CHROMA_BATCH_SIZE):
+        collection.delete(ids=chunk)
+
+    stats['added'] = len(new_items)
+    stats['deleted'] = len(stale_ids)
+    stats['unchanged'] = len(wanted) - len(new_items)
+    print(f"Synced {company}: {stats['added']} added, {stats['deleted']} deleted, {stats['unchanged']} unchanged.")
+    return stats
+
+def load_all_qa_into_chroma(full: bool = False):
+    if get_embedding_function() is None:
         print("SentenceTransformerEmbeddingFunction not initialized. Cannot load Q&A into ChromaDB.")
         return
 
-    companies = ["Tallman", "MCR", "Bradley"]
     print("Starting to load all Q&A data into ChromaDB...")
-    for company in companies:
+    for company in get_companies():
         print(f"Processing company: {company}")
         try:
-            qa_data = load_qa_data(company)
-            if not qa_data:
-                print(f"No Q&A data found for {company}. Skipping.")
-                continue
-
-            collection = get_or_create_collection(company)
-            ids_batch = []
-            documents_batch = []
-            metadatas_batch = []
-
-            for qa_item in qa_data:
-                if not qa_item.id:
-                    qa_item.id = uuid.uuid4().hex
-                ids_batch.append(qa_item.id)
-                documents_batch.append(qa_item.question)
-                metadatas_batch.append(qa_item.to_dict())
-
-            if ids_batch:
-                collection.upsert(ids=ids_batch, documents=documents_batch, metadatas=metadatas_batch)
-                print(f"Successfully loaded {len(ids_batch)} Q&A items into ChromaDB for {company}.")
-            else:
-                print(f"No new Q&A items to load for {company} after processing.")
-
+            sync_company_into_chroma(company, full=full)
         except ValueError as ve:
             print(f"Configuration error for {company}: {ve}")
         except Exception as e:
@@ -223,37 +826,136 @@ def format_snippets_for_llm(snippets: list[dict]) -> str:
         return "No relevant information found."
 
     formatted_string = ""
+    # Snippets from a multi-company search say which company they belong to.
+    several_companies = len({snippet_dict.get('company') for snippet_dict in snippets}) > 1
     for i, snippet_dict in enumerate(snippets):
         # snippet_dict is a QA object in dict form, from ChromaDB metadata
         question = snippet_dict.get('question', 'N/A')
         answer = snippet_dict.get('answer', 'N/A')
-        formatted_string += f"Snippet {i+1}: Q: {question} A: {answer}\n"
+        source = f"[{snippet_dict.get('company')}] " if several_companies else ""
+        formatted_string += f"Snippet {i+1}: {source}Q: {question} A: {answer}\n"
     return formatted_string.strip()
 
-def get_llm_answer(user_question: str, company: str, question_type: str, context_snippets: list[dict]) -> str:
-    if not openai.api_key:
-        return "OpenAI API key not configured. Please set the OPENAI_API_KEY environment variable."
+def get_completion_cache():
+    """The shared LLM completion cache (app/completion_cache.py), or None if it is disabled."""
+    global completion_cache
+    if COMPLETION_CACHE_TTL <= 0:
+        return None
+    if completion_cache is None:
+        with _init_lock:
+            if completion_cache is None:
+                from app.completion_cache import CompletionCache
+                completion_cache = CompletionCache(COMPLETION_CACHE_PATH, memory_entries=COMPLETION_CACHE_MEMORY_ENTRIES,
+                                                   ttl=COMPLETION_CACHE_TTL, max_rows=COMPLETION_CACHE_MAX_ROWS)
+    return completion_cache
+
+def get_llm_rate_limiter_stats() -> dict:
+    # Only a client that was already created has a limiter worth reporting; /metrics must not create one.
+    if llm_client is None or llm_client.limiter is None:
+        return {'enabled': False}
+    return llm_client.limiter.stats()
+
+def get_llm_circuit_stats() -> dict:
+    if llm_client is None or llm_client.breaker is None:
+        return {'state': 'closed', 'consecutive_failures': 0}
+    return llm_client.breaker.stats()
+
+def get_completion_cache_stats() -> dict:
+    cache = get_completion_cache()
+    return cache.stats() if cache is not None else {'enabled': False}
+
+def _completion_cache_key(model: str, company: str, messages: list[dict], context_snippets: list[dict]):
+    """(key, KB version) under which the completion for these messages is cached, or None if it cannot be.
+
+    The version covers every company the snippets came from, so a change to
+    any of their Q&A files retires the entry.
+    """
+    if get_completion_cache() is None:
+        return None
+    from app.completion_cache import fingerprint
+    companies_used = sorted({company} | {snippet.get('company') for snippet in context_snippets if snippet.get('company')})
+    try:
+        version = json.dumps([[name, get_kb_version(name)] for name in companies_used])
+    except ValueError: # not a registered company
+        return None
+    return fingerprint(model, messages), version
 
+def _answer_messages(user_question: str, company: str, question_type: str, context_snippets: list[dict]) -> list[dict]:
     template = PROMPT_TEMPLATES.get(question_type, PROMPT_TEMPLATES["Default"])
     formatted_snippets = format_snippets_for_llm(context_snippets)
 
     final_prompt = template.format(user_question=user_question, context_snippets=formatted_snippets)
+    return [
+        {"role": "system", "content": f"You are a helpful assistant for the {company} company."},
+        {"role": "user", "content": final_prompt}
+    ]
+
+def get_llm_answer(user_question: str, company: str, question_type: str, context_snippets: list[dict],
+                   priority: int = PRIORITY_INTERACTIVE) -> str:
+    """`priority` orders the call in the LLM rate limit queue (PRIORITY_BACKGROUND for batch work).
+
+    Returns LLM_UNAVAILABLE_MESSAGE at once while the LLM circuit is open.
+    """
+    llm = get_llm_client()
+    if not llm.api_key:
+        return "OpenAI API key not configured. Please set the OPENAI_API_KEY environment variable."
 
+    messages = _answer_messages(user_question, company, question_type, context_snippets)
+    # Identical prompts (same question and snippets, unchanged KB) reuse the earlier completion.
+    cache_key = _completion_cache_key(llm.model, company, messages, context_snippets)
+    if cache_key is not None:
+        cached = get_completion_cache().get(*cache_key)
+        if cached is not None:
+            return cached
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": f"You are a helpful assistant for the {company} company."},
-                {"role": "user", "content": final_prompt}
-            ]
-        )
-        return response.choices[0].message.content.strip()
+        answer = llm.chat(messages, priority=priority).strip()
+    except CircuitOpenError as e:
+        print(f"Skipping OpenAI API call: {e}")
+        return LLM_UNAVAILABLE_MESSAGE
     except Exception as e:
         print(f"Error calling OpenAI API: {e}")
         return "Error generating answer from LLM."
+    if cache_key is not None:
+        get_completion_cache().put(cache_key[0], company, cache_key[1], answer)
+    return answer
+
+def stream_llm_answer(user_question: str, company: str, question_type: str, context_snippets: list[dict]):
+    """Yields the answer text piece by piece as the LLM generates it (same prompt as get_llm_answer).
+
+    Failures raise RuntimeError carrying the message get_llm_answer would return,
+    or CircuitOpenError (a RuntimeError) while the LLM circuit is open.
+    """
+    llm = get_llm_client()
+    if not llm.api_key:
+        raise RuntimeError("OpenAI API key not configured. Please set the OPENAI_API_KEY environment variable.")
+
+    messages = _answer_messages(user_question, company, question_type, context_snippets)
+    cache_key = _completion_cache_key(llm.model, company, messages, context_snippets)
+    if cache_key is not None:
+        cached = get_completion_cache().get(*cache_key)
+        if cached is not None:
+            yield cached
+            return
+    parts = []
+    try:
+        for text in llm.stream_chat(messages):
+            if not parts and text:
+                text = text.lstrip() # get_llm_answer strips the complete answer
+            if text:
+                parts.append(text)
+                yield text
+    except CircuitOpenError as e:
+        print(f"Skipping OpenAI API call: {e}")
+        raise CircuitOpenError(LLM_UNAVAILABLE_MESSAGE) from e
+    except Exception as e:
+        print(f"Error streaming from OpenAI API: {e}")
+        raise RuntimeError("Error generating answer from LLM.") from e
+    if cache_key is not None:
+        get_completion_cache().put(cache_key[0], company, cache_key[1], "".join(parts).strip())
 
 def get_corrected_llm_answer(original_question: str, incorrect_answer: str, user_correction_text: str, company: str) -> str:
-    if not openai.api_key:
+    llm = get_llm_client()
+    if not llm.api_key:
         return "OpenAI API key not configured. Please set the OPENAI_API_KEY environment variable."
 
     template = PROMPT_TEMPLATES["Correct"]
@@ -264,19 +966,15 @@ def get_corrected_llm_answer(original_question: str, incorrect_answer: str, user
     )
 
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": f"You are a helpful assistant for the {company} company, tasked with correcting a previous answer based on user feedback."},
-                {"role": "user", "content": final_prompt}
-            ]
-        )
-        return response.choices[0].message.content.strip()
+        return llm.chat([
+            {"role": "system", "content": f"You are a helpful assistant for the {company} company, tasked with correcting a previous answer based on user feedback."},
+            {"role": "user", "content": final_prompt}
+        ], priority=PRIORITY_BACKGROUND).strip()
     except Exception as e:
         print(f"Error calling OpenAI API for correction: {e}")
         return "Error generating corrected answer from LLM."
 
 # Note for environment setup:
-# Ensure 'chromadb', 'sentence-transformers', and 'openai' are installed.
-# pip install chromadb sentence-transformers openai
+# Ensure 'chromadb', 'sentence-transformers', and 'httpx' are installed.
+# pip install chromadb sentence-transformers httpx
 # Also, set the OPENAI_API_KEY environment variable.
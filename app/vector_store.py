@@ -0,0 +1,369 @@
+"""In-process NumPy vector index, a drop-in for a Chroma collection.
+
+For knowledge bases of a few thousand pairs, a brute-force dot product over
+one contiguous float32 matrix beats Chroma's SQLite + HNSW stack on both
+latency and memory. `NumpyCollection` implements the part of the Chroma
+`Collection` API this app uses (add, upsert, get, delete, query, count), so
+`get_or_create_collection` can hand either one to the rest of the code.
+The backend is chosen per company (see utils.get_vector_backend).
+
+On disk, in `<VECTOR_INDEX_PATH>/<name>/`:
+
+    meta.json       {"dim": ..., "space": "cosine"}
+    vectors.f32     float32 matrix, memory-mapped; grown by doubling
+    records.jsonl   append-only log of {"op": "put", "id", "row", "document", "metadata"}
+                    and {"op": "delete", "id"} entries
+
+Vectors are stored L2-normalized, and distances are cosine distances
+(1 - cosine similarity). An upsert of an existing ID writes a new row and
+retires the old one. `compact()` rewrites both files without retired rows.
+With `compression` (int8, binary or pca<N>, see app/quantization.py), queries
+first score compact in-memory codes and re-rank only the best candidates
+exactly.
+Writers hold an flock on the directory and first replay log entries written
+by other processes, so several workers can share one index.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+from app import quantization
+from app.file_lock import file_lock
+
+INITIAL_CAPACITY = 1024
+
+
+def _matches(metadata: dict, where: dict) -> bool:
+    """Chroma's metadata filter subset: `{key: value}`, `{key: {"$eq"|"$ne"|"$in"|"$nin": ...}}`, `$and` and `$or`."""
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == '$and':
+            if not all(_matches(metadata, clause) for clause in condition):
+                return False
+        elif key == '$or':
+            if not any(_matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            for op, operand in condition.items():
+                value = metadata.get(key)
+                if op == '$eq':
+                    ok = key in metadata and value == operand
+                elif op == '$ne':
+                    ok = value != operand
+                elif op == '$in':
+                    ok = key in metadata and value in operand
+                elif op == '$nin':
+                    ok = value not in operand
+                else:
+                    raise ValueError(f"Unsupported where operator: {op}")
+                if not ok:
+                    return False
+        elif key not in metadata or metadata[key] != condition:
+            return False
+    return True
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class NumpyCollection:
+    def __init__(self, path: str, name: str, embedding_function=None, compression: str = None):
+        self.name = name
+        self.path = os.path.join(path, name)
+        self.embedding_function = embedding_function
+        self.compression = compression if compression not in (None, 'none') else None
+        self._lock = threading.RLock()
+        os.makedirs(self.path, exist_ok=True)
+        self._reset()
+        self._refresh()
+
+    # --- persistence -------------------------------------------------------
+
+    def _reset(self):
+        self.dim = None
+        self._matrix = None # memmap of vectors.f32, (capacity, dim)
+        self._alive = np.zeros(0, dtype=bool)
+        self._ids = [] # row -> id
+        self._documents = []
+        self._metadatas = []
+        self._row_of = {} # id -> live row
+        self._log_offset = 0
+        self._log_inode = None
+        self._compressed = quantization.CompressedIndex(self.compression) if self.compression else None
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _dir_lock(self):
+        return file_lock(self._file('lock'))
+
+    def _refresh(self):
+        """Replays log entries written since the last refresh (by this or another process)."""
+        try:
+            stat = os.stat(self._file('records.jsonl'))
+        except FileNotFoundError:
+            return
+        if self._log_inode is not None and stat.st_ino != self._log_inode:
+            self._reset() # compacted by another process
+        if stat.st_size == self._log_offset and self._log_inode == stat.st_ino:
+            return
+        if self.dim is None:
+            with open(self._file('meta.json')) as f:
+                self.dim = json.load(f)['dim']
+        with open(self._file('records.jsonl'), 'rb') as f:
+            f.seek(self._log_offset)
+            data = f.read()
+        complete = data.rfind(b"\n") + 1 # ignore a line another process is still writing
+        for line in data[:complete].splitlines():
+            self._apply(json.loads(line))
+        self._log_offset += complete
+        self._log_inode = stat.st_ino
+        self._map(len(self._ids))
+
+    def _apply(self, entry: dict):
+        if entry['op'] == 'put':
+            row = entry['row']
+            while len(self._ids) <= row:
+                self._ids.append(None)
+                self._documents.append(None)
+                self._metadatas.append(None)
+            self._retire(entry['id'])
+            self._ids[row] = entry['id']
+            self._documents[row] = entry.get('document')
+            self._metadatas[row] = entry.get('metadata')
+            self._row_of[entry['id']] = row
+        elif entry['op'] == 'delete':
+            self._retire(entry['id'])
+
+    def _retire(self, qa_id: str):
+        row = self._row_of.pop(qa_id, None)
+        if row is not None:
+            self._documents[row] = None
+            self._metadatas[row] = None
+
+    def _map(self, rows: int):
+        """(Re)maps vectors.f32 so that it holds at least `rows` rows, growing the file by doubling."""
+        vectors_path = self._file('vectors.f32')
+        row_bytes = self.dim * 4
+        size = os.path.getsize(vectors_path) if os.path.exists(vectors_path) else 0
+        capacity = size // row_bytes
+        if capacity < rows:
+            capacity = max(INITIAL_CAPACITY, capacity * 2, rows)
+            with open(vectors_path, 'ab') as f:
+                f.truncate(capacity * row_bytes)
+        if self._matrix is None or len(self._matrix) != capacity:
+            self._matrix = np.memmap(vectors_path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+        alive = np.zeros(capacity, dtype=bool)
+        alive[list(self._row_of.values())] = True
+        self._alive = alive
+
+    def _append_log(self, entries: list):
+        data = "".join(json.dumps(entry) + "\n" for entry in entries).encode('utf-8')
+        with open(self._file('records.jsonl'), 'ab') as f:
+            f.write(data)
+        self._log_offset += len(data)
+        self._log_inode = os.stat(self._file('records.jsonl')).st_ino
+
+    # --- Chroma Collection API ----------------------------------------------
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._row_of)
+
+    def _embed(self, texts: list) -> np.ndarray:
+        if self.embedding_function is None:
+            raise ValueError(f"Collection {self.name} has no embedding function; pass embeddings.")
+        return np.asarray(self.embedding_function(list(texts)), dtype=np.float32)
+
+    def upsert(self, ids: list, documents: list = None, metadatas: list = None, embeddings=None):
+        if not ids:
+            return
+        vectors = self._embed(documents) if embeddings is None else np.asarray(embeddings, dtype=np.float32)
+        vectors = _normalize(vectors.reshape(len(ids), -1))
+        with self._lock, self._dir_lock():
+            self._refresh()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self._file('meta.json'), 'w') as f:
+                    json.dump({'dim': self.dim, 'space': 'cosine'}, f)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match collection dimension {self.dim}")
+            start = len(self._ids)
+            self._map(start + len(ids))
+            self._matrix[start:start + len(ids)] = vectors
+            self._matrix.flush()
+            entries = [{
+                'op': 'put', 'id': qa_id, 'row': start + i,
+                'document': documents[i] if documents is not None else None,
+                'metadata': metadatas[i] if metadatas is not None else None,
+            } for i, qa_id in enumerate(ids)]
+            for entry in entries:
+                self._apply(entry)
+            self._append_log(entries)
+            self._alive[:start + len(ids)] = False
+            self._alive[list(self._row_of.values())] = True
+
+    add = upsert
+
+    def delete(self, ids: list = None):
+        if not ids:
+            return
+        with self._lock, self._dir_lock():
+            self._refresh()
+            entries = [{'op': 'delete', 'id': qa_id} for qa_id in ids if qa_id in self._row_of]
+            for entry in entries:
+                row = self._row_of[entry['id']]
+                self._apply(entry)
+                self._alive[row] = False
+            if entries:
+                self._append_log(entries)
+
+    def _result_row(self, row: int, include, result: dict):
+        if 'documents' in include:
+            result['documents'].append(self._documents[row])
+        if 'metadatas' in include:
+            result['metadatas'].append(self._metadatas[row])
+        if 'embeddings' in include:
+            result['embeddings'].append(np.array(self._matrix[row]))
+
+    def get(self, ids: list = None, limit: int = None, offset: int = None, include=('documents', 'metadatas'), where=None):
+        with self._lock:
+            self._refresh()
+            if ids is not None:
+                rows = [self._row_of[qa_id] for qa_id in ids if qa_id in self._row_of]
+            else:
+                rows = sorted(self._row_of.values())
+            if where:
+                rows = [row for row in rows if _matches(self._metadatas[row], where)]
+            rows = rows[offset or 0:]
+            if limit is not None:
+                rows = rows[:limit]
+            result = {'ids': [self._ids[row] for row in rows]}
+            for key in ('documents', 'metadatas', 'embeddings'):
+                result[key] = [] if key in include else None
+            for row in rows:
+                self._result_row(row, include, result)
+            return result
+
+    def query(self, query_texts: list = None, query_embeddings=None, n_results: int = 10,
+              include=('documents', 'metadatas', 'distances'), where=None):
+        queries = self._embed(query_texts) if query_embeddings is None else np.asarray(query_embeddings, dtype=np.float32)
+        queries = _normalize(queries.reshape(len(queries), -1))
+        with self._lock:
+            self._refresh()
+            result = {'ids': []}
+            for key in ('documents', 'metadatas', 'embeddings', 'distances'):
+                result[key] = [] if key in include else None
+            alive = self._alive
+            if where:
+                alive = np.zeros_like(self._alive)
+                alive[[row for row in self._row_of.values() if _matches(self._metadatas[row], where)]] = True
+            k = min(n_results, int(alive.sum()))
+            matches = self._search(queries, k, alive) if k else [((), ())] * len(queries)
+            for top, similarities in matches:
+                hits = {'ids': [], 'documents': [], 'metadatas': [], 'embeddings': []}
+                distances = []
+                for row, similarity in zip(top, similarities):
+                    hits['ids'].append(self._ids[row])
+                    self._result_row(row, include, hits)
+                    distances.append(float(1.0 - similarity))
+                result['ids'].append(hits['ids'])
+                for key in ('documents', 'metadatas', 'embeddings'):
+                    if key in include:
+                        result[key].append(hits[key])
+                if 'distances' in include:
+                    result['distances'].append(distances)
+            return result
+
+    def _search(self, queries: np.ndarray, k: int, alive: np.ndarray) -> list:
+        """(rows, cosine similarities) of the k best rows set in `alive` for each query, best first.
+
+        A metadata filter narrows `alive`, and filtered queries skip the
+        compressed first pass so that its candidate pool cannot miss matches.
+        """
+        rows = len(self._ids)
+        if self._compressed is not None and alive is self._alive and rows > self._compressed.candidate_count(k):
+            # First pass over the compact codes, then an exact re-rank of the candidates.
+            self._compressed.sync(self._matrix, rows)
+            matches = []
+            for query, candidates in zip(queries, self._compressed.candidates(queries, self._alive, self._compressed.candidate_count(k))):
+                candidates = np.sort(candidates[self._alive[candidates]])
+                similarities = self._matrix[candidates] @ query
+                order = np.argsort(-similarities, kind='stable')[:k]
+                matches.append((candidates[order], similarities[order]))
+            return matches
+
+        scores = queries @ self._matrix[:rows].T
+        scores[:, ~alive[:rows]] = -np.inf
+        matches = []
+        for row_scores in scores:
+            top = np.argpartition(-row_scores, k - 1)[:k] if k < rows else np.arange(rows)
+            top = top[np.argsort(-row_scores[top], kind='stable')][:k]
+            matches.append((top, row_scores[top]))
+        return matches
+
+    def compact(self) -> int:
+        """Rewrites the files without retired rows. Returns the number of rows dropped."""
+        with self._lock, self._dir_lock():
+            self._refresh()
+            if self.dim is None:
+                return 0
+            live_rows = sorted(self._row_of.values())
+            dropped = len(self._ids) - len(live_rows)
+            if not dropped:
+                return 0
+            vectors = np.array(self._matrix[live_rows]) if live_rows else np.zeros((0, self.dim), dtype=np.float32)
+            capacity = max(INITIAL_CAPACITY, len(live_rows))
+            tmp_vectors = self._file('vectors.f32.tmp')
+            with open(tmp_vectors, 'wb') as f:
+                f.write(vectors.tobytes())
+                f.truncate(capacity * self.dim * 4)
+            tmp_log = self._file('records.jsonl.tmp')
+            with open(tmp_log, 'w') as f:
+                for new_row, row in enumerate(live_rows):
+                    f.write(json.dumps({'op': 'put', 'id': self._ids[row], 'row': new_row,
+                                        'document': self._documents[row], 'metadata': self._metadatas[row]}) + "\n")
+            self._matrix = None
+            os.replace(tmp_vectors, self._file('vectors.f32'))
+            os.replace(tmp_log, self._file('records.jsonl'))
+            self._reset()
+            self._refresh()
+            return dropped
+
+    def memory_bytes(self) -> dict:
+        """Bytes of float vectors (memory-mapped, paged in on demand) and of in-memory compact codes."""
+        return {
+            'vectors': 0 if self._matrix is None else len(self._ids) * self.dim * 4,
+            'codes': self._compressed.nbytes if self._compressed is not None else 0,
+        }
+
+
+_collections = {}
+_collections_lock = threading.Lock()
+
+
+def get_or_create_collection(path: str, name: str, embedding_function=None, compression: str = None) -> NumpyCollection:
+    """Returns the process-wide NumpyCollection for path/name, opening it on first use.
+
+    A collection open with another compression is reopened with this one.
+    """
+    key = os.path.join(os.path.abspath(path), name)
+    with _collections_lock:
+        collection = _collections.get(key)
+        if collection is None or collection.compression != (compression if compression not in (None, 'none') else None):
+            collection = _collections[key] = NumpyCollection(path, name, embedding_function, compression)
+        elif embedding_function is not None:
+            collection.embedding_function = embedding_function
+        return collection
+
+
+def release_collection(path: str, name: str) -> None:
+    """Forgets the process-wide NumpyCollection for path/name; the next get_or_create_collection reopens it."""
+    with _collections_lock:
+        _collections.pop(os.path.join(os.path.abspath(path), name), None)
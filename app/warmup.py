@@ -0,0 +1,122 @@
+"""Background warm-up of the retrieval stack.
+
+Loading the embedding model, opening the Chroma collections and syncing the
+Q&A files used to happen at import time, which blocked every worker before it
+could serve a single request. The warm-up now runs in a daemon thread started
+on the first request a worker process sees (usually the load balancer's first
+`/readyz` probe), and `/readyz` reports ready only once it has finished.
+"""
+import os
+import threading
+import time
+
+from app import utils
+
+
+class WarmupState:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.status = 'pending' # pending -> warming -> ready | failed
+            self.stage = None
+            self.error = None
+            self.started_at = None
+            self.finished_at = None
+            self.companies = {company: {'status': 'pending'} for company in utils.get_companies()}
+
+    def set_stage(self, stage: str):
+        with self._lock:
+            if self.status == 'pending':
+                self.status = 'warming'
+                self.started_at = time.time()
+            self.stage = stage
+
+    def set_company(self, company: str, status: str, **details):
+        with self._lock:
+            self.companies[company] = dict(status=status, **details)
+
+    def finish(self, error: str = None):
+        with self._lock:
+            self.status = 'failed' if error else 'ready'
+            self.error = error
+            self.stage = None
+            self.finished_at = time.time()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            elapsed = None
+            if self.started_at is not None:
+                elapsed = round((self.finished_at or time.time()) - self.started_at, 3)
+            return {
+                'status': self.status,
+                'stage': self.stage,
+                'error': self.error,
+                'elapsed_seconds': elapsed,
+                'companies': {company: dict(progress) for company, progress in self.companies.items()},
+            }
+
+
+state = WarmupState()
+_start_lock = threading.Lock()
+_thread = None
+_thread_pid = None
+
+
+def start_warmup() -> bool:
+    """Starts the warm-up thread once per process. Returns True if this call started it.
+
+    The owning PID is remembered so that a worker forked from a master which
+    already imported the app (gunicorn --preload) still warms itself up.
+    """
+    global _thread, _thread_pid
+    if _thread_pid == os.getpid():
+        return False
+    with _start_lock:
+        if _thread_pid == os.getpid():
+            return False
+        state.reset()
+        _thread = threading.Thread(target=run_warmup, name="qa-warmup", daemon=True)
+        _thread_pid = os.getpid()
+        _thread.start()
+        return True
+
+
+def is_ready() -> bool:
+    return state.status == 'ready'
+
+
+def run_warmup():
+    """Loads the model, opens every company collection and syncs the Q&A files into them."""
+    try:
+        state.set_stage('model')
+        if utils.get_embedding_function() is None:
+            state.finish(error="Embedding model could not be loaded.")
+            return
+
+        state.set_stage('collections')
+        companies = utils.get_companies()
+        if any(utils.get_vector_backend(company) == 'chroma' for company in companies):
+            utils.get_chroma_client()
+        for company in companies:
+            utils.get_or_create_collection(company)
+
+        state.set_stage('sync')
+        for company in companies:
+            state.set_company(company, 'syncing')
+            started = time.perf_counter()
+            try:
+                stats = utils.sync_company_into_chroma(company)
+            except Exception as e:
+                print(f"Warm-up sync failed for {company}: {e}")
+                state.set_company(company, 'failed', error=str(e))
+                continue
+            state.set_company(company, 'ready', seconds=round(time.perf_counter() - started, 3), **stats)
+
+        state.finish()
+        print(f"Warm-up complete in {state.snapshot()['elapsed_seconds']}s.")
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+        state.finish(error=str(e))
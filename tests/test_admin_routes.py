@@ -4,6 +4,7 @@ import io # Added for file uploads
 from unittest.mock import patch, MagicMock, call # Added call for checking multiple calls
 from flask import Flask, session, url_for
 from app import app as flask_app # Original app
+from app import jobs
 from app.models import User, QA # Added QA model
 
 # Utility to log in a user
@@ -11,10 +12,10 @@ def login_admin(client, mock_load_users_func, admin_user_obj, admin_password):
     """Helper to log in the admin user, using the provided mock for load_users."""
     mock_load_users_func.return_value = [admin_user_obj] # Ensure only admin user is findable during login
     with flask_app.app_context():
-        response = client.post(url_for('login'), data=json.dumps({
+        response = client.post(url_for('main.login'), data={
             'email': admin_user_obj.email,
             'password': admin_password
-        }), content_type='application/json')
+        })
     assert response.status_code == 200 # Assuming login success is 200
     # After login, restore the main mock_users_list for other operations if needed,
     # or set it specifically for each test. For simplicity, we'll often reset it in tests.
@@ -29,15 +30,15 @@ class AdminRoutesTests(unittest.TestCase):
         flask_app.config['SECRET_KEY'] = 'test_secret_key'
         self.app = flask_app
         self.client = self.app.test_client()
-        self.app_context = self.app.app_context() # Create an app context
+        self.app_context = self.app.test_request_context() # A request context, so url_for can build URLs
         self.app_context.push() # Push it to use url_for
 
         # Mock users
         self.admin_password = "adminpass"
         self.user_password = "password123"
-        self.admin_user = User(id="admin1", name="Admin User", email="admin@example.com", status="admin")
+        self.admin_user = User(id="admin1", name="Admin User", email="admin@example.com", status="admin", hashed_password=None)
         self.admin_user.set_password(self.admin_password)
-        self.test_user = User(id="user1", name="Test User", email="test@example.com", status="user")
+        self.test_user = User(id="user1", name="Test User", email="test@example.com", status="user", hashed_password=None)
         self.test_user.set_password(self.user_password)
 
         self.mock_users_list = [self.admin_user, self.test_user]
@@ -49,6 +50,7 @@ class AdminRoutesTests(unittest.TestCase):
             'uuid4': patch('app.routes.uuid.uuid4'),
             'load_qa_data': patch('app.routes.load_qa_data'),
             'append_qa_pair': patch('app.routes.append_qa_pair'),
+            'append_qa_pairs': patch('app.routes.append_qa_pairs'),
             # Also patch load_users used by app.login route if it's different
             'app_load_users': patch('app.load_users', MagicMock(return_value=self.mock_users_list))
         }
@@ -57,6 +59,9 @@ class AdminRoutesTests(unittest.TestCase):
         self.mocks['load_users'].return_value = self.mock_users_list
         self.mocks['app_load_users'].return_value = self.mock_users_list # For login route
         self.mocks['uuid4'].return_value = MagicMock(hex='new_user_uuid_123')
+        self.mocks['append_qa_pairs'].side_effect = lambda company, pairs, **kwargs: [
+            QA(question=question, answer=answer, company=company) for question, answer in pairs
+        ]
 
 
     def tearDown(self):
@@ -70,10 +75,10 @@ class AdminRoutesTests(unittest.TestCase):
         # Use the main mock_load_users for login, ensuring admin_user is in its return_value
         self.mocks['load_users'].return_value = [self.admin_user]
         self.mocks['app_load_users'].return_value = [self.admin_user] # Ensure login route also sees admin
-        response = self.client.post(url_for('login'), data=json.dumps({
+        response = self.client.post(url_for('main.login'), data={
             'email': self.admin_user.email,
             'password': self.admin_password
-        }), content_type='application/json')
+        })
         self.assertEqual(response.status_code, 200, f"Admin login failed: {response.get_json()}")
         # Restore mock_users_list for subsequent operations in the test if needed
         self.mocks['load_users'].return_value = self.mock_users_list
@@ -82,7 +87,7 @@ class AdminRoutesTests(unittest.TestCase):
 
     def test_manage_users_page_get_admin(self):
         self._login_admin()
-        response = self.client.get(url_for('manage_users'))
+        response = self.client.get(url_for('main.manage_users'))
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'Admin Panel', response.data) # Updated link text
         self.assertIn(b'Admin User', response.data)
@@ -93,16 +98,16 @@ class AdminRoutesTests(unittest.TestCase):
         # Login as non-admin (test_user)
         self.mocks['load_users'].return_value = [self.test_user]
         self.mocks['app_load_users'].return_value = [self.test_user]
-        response = self.client.post(url_for('login'), data=json.dumps({
+        response = self.client.post(url_for('main.login'), data={
             'email': self.test_user.email,
             'password': self.user_password
-        }), content_type='application/json')
+        })
         self.assertEqual(response.status_code, 200)
 
         self.mocks['load_users'].return_value = self.mock_users_list # Reset for the next call
-        response = self.client.get(url_for('manage_users'), follow_redirects=False)
+        response = self.client.get(url_for('main.manage_users'), follow_redirects=False)
         self.assertEqual(response.status_code, 302)
-        self.assertTrue(response.location.endswith(url_for('index')))
+        self.assertTrue(response.location.endswith(url_for('main.index')))
 
     # --- User CRUD API Tests ---
     def test_api_add_user_success(self):
@@ -116,7 +121,7 @@ class AdminRoutesTests(unittest.TestCase):
         # Ensure load_users returns a list that doesn't contain new@example.com yet
         self.mocks['load_users'].return_value = [self.admin_user, self.test_user]
 
-        response = self.client.post(url_for('api_add_user'), json=new_user_data)
+        response = self.client.post(url_for('main.api_add_user'), json=new_user_data)
 
         self.assertEqual(response.status_code, 201)
         json_data = response.get_json()
@@ -143,7 +148,7 @@ class AdminRoutesTests(unittest.TestCase):
             "password": "password123",
             "status": "user"
         }
-        response = self.client.post(url_for('api_add_user'), json=user_data)
+        response = self.client.post(url_for('main.api_add_user'), json=user_data)
         self.assertEqual(response.status_code, 409)
         json_data = response.get_json()
         self.assertEqual(json_data['status'], 'error')
@@ -152,7 +157,7 @@ class AdminRoutesTests(unittest.TestCase):
 
     def test_api_add_user_missing_fields(self):
         self._login_admin()
-        response = self.client.post(url_for('api_add_user'), json={"name": "Just Name"})
+        response = self.client.post(url_for('main.api_add_user'), json={"name": "Just Name"})
         self.assertEqual(response.status_code, 400)
         json_data = response.get_json()
         self.assertEqual(json_data['status'], 'error')
@@ -161,7 +166,7 @@ class AdminRoutesTests(unittest.TestCase):
     def test_api_add_user_invalid_status(self):
         self._login_admin()
         user_data = {"name": "Bad Status User", "email": "bs@example.com", "password": "pw", "status": "superadmin"}
-        response = self.client.post(url_for('api_add_user'), json=user_data)
+        response = self.client.post(url_for('main.api_add_user'), json=user_data)
         self.assertEqual(response.status_code, 400)
         json_data = response.get_json()
         self.assertEqual(json_data['message'], "Invalid status. Must be 'user' or 'admin'.")
@@ -178,7 +183,7 @@ class AdminRoutesTests(unittest.TestCase):
         # Ensure user_to_edit_id exists and no conflict with new email
         self.mocks['load_users'].return_value = [self.admin_user, self.test_user]
 
-        response = self.client.put(url_for('api_manage_user', user_id=user_to_edit_id), json=updated_data)
+        response = self.client.put(url_for('main.api_manage_user', user_id=user_to_edit_id), json=updated_data)
         self.assertEqual(response.status_code, 200)
         json_data = response.get_json()
         self.assertEqual(json_data['status'], 'success')
@@ -194,7 +199,7 @@ class AdminRoutesTests(unittest.TestCase):
 
     def test_api_edit_user_not_found(self):
         self._login_admin()
-        response = self.client.put(url_for('api_manage_user', user_id="nonexistentuser"), json={"name": "test"})
+        response = self.client.put(url_for('main.api_manage_user', user_id="nonexistentuser"), json={"name": "test"})
         self.assertEqual(response.status_code, 404)
         self.assertEqual(response.get_json()['message'], 'User not found')
         self.mocks['save_users'].assert_not_called()
@@ -205,7 +210,7 @@ class AdminRoutesTests(unittest.TestCase):
         self.mocks['load_users'].return_value = self.mock_users_list
         updated_data = {"email": self.admin_user.email} # Try to change test_user's email to admin_user's email
 
-        response = self.client.put(url_for('api_manage_user', user_id=self.test_user.id), json=updated_data)
+        response = self.client.put(url_for('main.api_manage_user', user_id=self.test_user.id), json=updated_data)
         self.assertEqual(response.status_code, 409)
         self.assertEqual(response.get_json()['message'], 'Email already in use by another user')
         self.mocks['save_users'].assert_not_called()
@@ -214,7 +219,7 @@ class AdminRoutesTests(unittest.TestCase):
         self._login_admin()
         self.mocks['load_users'].return_value = self.mock_users_list
         updated_data = {"status": "superduperadmin"}
-        response = self.client.put(url_for('api_manage_user', user_id=self.test_user.id), json=updated_data)
+        response = self.client.put(url_for('main.api_manage_user', user_id=self.test_user.id), json=updated_data)
         self.assertEqual(response.status_code, 400)
         self.assertEqual(response.get_json()['message'], "Invalid status. Must be 'user' or 'admin'.")
 
@@ -224,7 +229,7 @@ class AdminRoutesTests(unittest.TestCase):
         # Ensure user_to_delete_id exists
         self.mocks['load_users'].return_value = [self.admin_user, self.test_user]
 
-        response = self.client.delete(url_for('api_manage_user', user_id=user_to_delete_id))
+        response = self.client.delete(url_for('main.api_manage_user', user_id=user_to_delete_id))
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.get_json()['message'], 'User deleted successfully')
 
@@ -236,7 +241,7 @@ class AdminRoutesTests(unittest.TestCase):
     def test_api_delete_user_not_found(self):
         self._login_admin()
         self.mocks['load_users'].return_value = self.mock_users_list
-        response = self.client.delete(url_for('api_manage_user', user_id="nonexistentuser"))
+        response = self.client.delete(url_for('main.api_manage_user', user_id="nonexistentuser"))
         self.assertEqual(response.status_code, 404)
         self.assertEqual(response.get_json()['message'], 'User not found')
         self.mocks['save_users'].assert_not_called()
@@ -251,7 +256,7 @@ class AdminRoutesTests(unittest.TestCase):
         ]
         self.mocks['load_qa_data'].return_value = mock_qa_list
 
-        response = self.client.get(url_for('download_qa_file', company_name=company_name))
+        response = self.client.get(url_for('main.download_qa_file', company_name=company_name))
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.headers['Content-Type'], 'application/json')
@@ -268,7 +273,7 @@ class AdminRoutesTests(unittest.TestCase):
         company_name = "MCR"
         self.mocks['load_qa_data'].return_value = [] # No data
 
-        response = self.client.get(url_for('download_qa_file', company_name=company_name))
+        response = self.client.get(url_for('main.download_qa_file', company_name=company_name))
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.headers['Content-Type'], 'application/json')
@@ -278,7 +283,7 @@ class AdminRoutesTests(unittest.TestCase):
 
     def test_api_download_qa_invalid_company(self):
         self._login_admin()
-        response = self.client.get(url_for('download_qa_file', company_name="InvalidCompany"))
+        response = self.client.get(url_for('main.download_qa_file', company_name="InvalidCompany"))
         self.assertEqual(response.status_code, 400)
         json_data = response.get_json()
         self.assertEqual(json_data['status'], 'error')
@@ -297,38 +302,45 @@ class AdminRoutesTests(unittest.TestCase):
         mock_file = (io.BytesIO(file_content), 'test_qa.json')
 
         response = self.client.post(
-            url_for('upload_qa_file', company_name=company_name),
+            url_for('main.upload_qa_file', company_name=company_name),
             data={'file': mock_file},
             content_type='multipart/form-data'
         )
 
-        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.status_code, 202) # Queued as a background job
         json_data = response.get_json()
-        self.assertEqual(json_data['status'], 'success')
-        self.assertEqual(json_data['processed_count'], 2)
+        self.assertEqual(json_data['status'], 'accepted')
+        self.assertEqual(json_data['queued_count'], 2)
         self.assertEqual(json_data['error_count'], 0)
-
-        self.mocks['append_qa_pair'].assert_has_calls([
-            call(company_name, "Q1 up", "A1 up"),
-            call(company_name, "Q2 up", "A2 up")
-        ], any_order=False) # Order should be preserved
+        job = jobs.manager.get(json_data['job_id'])
+        self.assertTrue(job.wait(5))
+        status = self.client.get(json_data['status_url'])
+        self.assertEqual(status.status_code, 200)
+        self.assertEqual(status.get_json()['status'], 'succeeded')
+        self.assertEqual((status.get_json()['processed'], status.get_json()['failed_items']), (2, 0))
+
+        # One batched append for the whole upload, in file order
+        self.mocks['append_qa_pairs'].assert_called_once()
+        args, _ = self.mocks['append_qa_pairs'].call_args
+        self.assertEqual(args, (company_name, [("Q1 up", "A1 up"), ("Q2 up", "A2 up")]))
+        self.mocks['append_qa_pair'].assert_not_called()
 
     def test_api_upload_qa_invalid_company(self):
         self._login_admin()
         file_content = json.dumps([{"question": "Q", "answer": "A"}]).encode('utf-8')
         mock_file = (io.BytesIO(file_content), 'test.json')
         response = self.client.post(
-            url_for('upload_qa_file', company_name="FakeCompany"),
+            url_for('main.upload_qa_file', company_name="FakeCompany"),
             data={'file': mock_file}, content_type='multipart/form-data'
         )
         self.assertEqual(response.status_code, 400)
         self.assertEqual(response.get_json()['message'], 'Invalid or unsupported company name')
-        self.mocks['append_qa_pair'].assert_not_called()
+        self.mocks['append_qa_pairs'].assert_not_called()
 
     def test_api_upload_qa_no_file(self):
         self._login_admin()
         response = self.client.post(
-            url_for('upload_qa_file', company_name="Tallman"),
+            url_for('main.upload_qa_file', company_name="Tallman"),
             content_type='multipart/form-data' # No file in data
         )
         self.assertEqual(response.status_code, 400)
@@ -338,7 +350,7 @@ class AdminRoutesTests(unittest.TestCase):
         self._login_admin()
         mock_file = (io.BytesIO(b"some text data"), 'test.txt') # Not a .json
         response = self.client.post(
-            url_for('upload_qa_file', company_name="Tallman"),
+            url_for('main.upload_qa_file', company_name="Tallman"),
             data={'file': mock_file}, content_type='multipart/form-data'
         )
         self.assertEqual(response.status_code, 400)
@@ -348,7 +360,7 @@ class AdminRoutesTests(unittest.TestCase):
         self._login_admin()
         mock_file = (io.BytesIO(b"[{'question': 'Q1', 'answer': 'A1'"), 'test.json') # Malformed
         response = self.client.post(
-            url_for('upload_qa_file', company_name="Tallman"),
+            url_for('main.upload_qa_file', company_name="Tallman"),
             data={'file': mock_file}, content_type='multipart/form-data'
         )
         self.assertEqual(response.status_code, 400)
@@ -359,7 +371,7 @@ class AdminRoutesTests(unittest.TestCase):
         file_content = json.dumps({"question": "Q", "answer": "A"}).encode('utf-8') # Dict, not list
         mock_file = (io.BytesIO(file_content), 'test.json')
         response = self.client.post(
-            url_for('upload_qa_file', company_name="Tallman"),
+            url_for('main.upload_qa_file', company_name="Tallman"),
             data={'file': mock_file}, content_type='multipart/form-data'
         )
         self.assertEqual(response.status_code, 400)
@@ -380,21 +392,20 @@ class AdminRoutesTests(unittest.TestCase):
         mock_file = (io.BytesIO(file_content), 'test_mixed.json')
 
         response = self.client.post(
-            url_for('upload_qa_file', company_name=company_name),
+            url_for('main.upload_qa_file', company_name=company_name),
             data={'file': mock_file}, content_type='multipart/form-data'
         )
-        self.assertEqual(response.status_code, 207) # Multi-Status for partial success
+        self.assertEqual(response.status_code, 202) # Valid items are queued, invalid ones reported
         json_data = response.get_json()
-        self.assertEqual(json_data['status'], 'partial_success')
-        self.assertEqual(json_data['processed_count'], 2) # Only two are valid
+        self.assertEqual(json_data['status'], 'accepted')
+        self.assertEqual(json_data['queued_count'], 2) # Only two are valid
         self.assertEqual(json_data['error_count'], 4)
         self.assertEqual(len(json_data['errors']), 4)
-        # Check that append_qa_pair was called for valid items only
-        self.mocks['append_qa_pair'].assert_has_calls([
-            call(company_name, "Valid Q1", "Valid A1"),
-            call(company_name, "Valid Q2", "Valid A2")
-        ], any_order=False)
-        self.assertEqual(self.mocks['append_qa_pair'].call_count, 2)
+        jobs.manager.get(json_data['job_id']).wait(5)
+        # Check that only the valid items were appended, in one batch
+        args, _ = self.mocks['append_qa_pairs'].call_args
+        self.assertEqual(args, (company_name, [("Valid Q1", "Valid A1"), ("Valid Q2", "Valid A2")]))
+        self.assertEqual(self.mocks['append_qa_pairs'].call_count, 1)
 
     def test_api_upload_qa_all_items_fail(self):
         self._login_admin()
@@ -407,7 +418,7 @@ class AdminRoutesTests(unittest.TestCase):
         mock_file = (io.BytesIO(file_content), 'test_all_invalid.json')
 
         response = self.client.post(
-            url_for('upload_qa_file', company_name=company_name),
+            url_for('main.upload_qa_file', company_name=company_name),
             data={'file': mock_file}, content_type='multipart/form-data'
         )
         self.assertEqual(response.status_code, 400) # All failed
@@ -415,7 +426,7 @@ class AdminRoutesTests(unittest.TestCase):
         self.assertEqual(json_data['status'], 'error')
         self.assertEqual(json_data['processed_count'], 0)
         self.assertEqual(json_data['error_count'], 2)
-        self.mocks['append_qa_pair'].assert_not_called()
+        self.mocks['append_qa_pairs'].assert_not_called()
 
     def test_api_upload_qa_empty_json_array(self):
         self._login_admin()
@@ -425,7 +436,7 @@ class AdminRoutesTests(unittest.TestCase):
         mock_file = (io.BytesIO(file_content), 'test_empty.json')
 
         response = self.client.post(
-            url_for('upload_qa_file', company_name=company_name),
+            url_for('main.upload_qa_file', company_name=company_name),
             data={'file': mock_file},
             content_type='multipart/form-data'
         )
@@ -435,21 +446,21 @@ class AdminRoutesTests(unittest.TestCase):
         self.assertEqual(json_data['processed_count'], 0)
         self.assertEqual(json_data['error_count'], 0)
         self.assertIn(f'No Q&A pairs found in the uploaded file to process for {company_name}', json_data['message'])
-        self.mocks['append_qa_pair'].assert_not_called()
+        self.mocks['append_qa_pairs'].assert_not_called()
 
 
     def test_api_admin_routes_non_admin_access(self):
         # Login as non-admin
         self.mocks['load_users'].return_value = [self.test_user]
         self.mocks['app_load_users'].return_value = [self.test_user]
-        login_response = self.client.post(url_for('login'), data=json.dumps({
+        login_response = self.client.post(url_for('main.login'), data={
              'email': self.test_user.email, 'password': self.user_password
-        }), content_type='application/json')
+        })
         self.assertEqual(login_response.status_code, 200)
 
         common_headers = {'X-Requested-With': 'XMLHttpRequest'}
         admin_routes_params = [
-            ('api_add_user', 'POST', {}),
+            ('api_add_user', 'POST', {}, {}),
             ('api_manage_user', 'PUT', {'user_id': 'user1'}, {}),
             ('api_manage_user', 'DELETE', {'user_id': 'user1'}, None),
             ('download_qa_file', 'GET', {'company_name': 'Tallman'}, None),
@@ -458,7 +469,7 @@ class AdminRoutesTests(unittest.TestCase):
 
         for route_name, method, params, json_data in admin_routes_params:
             with self.subTest(route=route_name, method=method):
-                url = url_for(route_name, **params)
+                url = url_for(f'main.{route_name}', **params)
                 if method == 'POST':
                     if route_name == 'upload_qa_file': # File upload needs different handling
                          # For now, just check endpoint protection without actual file data
@@ -0,0 +1,60 @@
+import subprocess
+import sys
+import unittest
+from unittest.mock import patch
+from app import create_app, startup
+
+
+class TestCreateApp(unittest.TestCase):
+
+    def test_create_app_applies_config(self):
+        app = create_app({'TESTING': True, 'SECRET_KEY': 'factory-secret'})
+        self.assertTrue(app.config['TESTING'])
+        self.assertEqual(app.config['SECRET_KEY'], 'factory-secret')
+        self.assertIn('main', app.blueprints)
+
+    def test_create_app_returns_independent_apps(self):
+        first = create_app({'TESTING': True})
+        second = create_app({'TESTING': False})
+        self.assertIsNot(first, second)
+        self.assertFalse(second.config['TESTING'])
+
+    def test_factory_app_serves_routes(self):
+        app = create_app({'TESTING': True})
+        response = app.test_client().get('/healthz')
+        self.assertEqual(response.status_code, 200)
+
+    @patch('app.warmup.start_warmup')
+    def test_warmup_can_be_disabled(self, mock_start_warmup):
+        app = create_app({'WARMUP_ON_FIRST_REQUEST': False})
+        app.test_client().get('/healthz')
+        mock_start_warmup.assert_not_called()
+
+    @patch('app.warmup.start_warmup')
+    def test_warmup_starts_on_first_request(self, mock_start_warmup):
+        app = create_app()
+        app.test_client().get('/healthz')
+        mock_start_warmup.assert_called_once()
+
+    def test_import_does_not_load_heavy_dependencies(self):
+        code = (
+            "import sys, app; "
+            "print(','.join(m for m in ('chromadb', 'openai', 'sentence_transformers', 'torch') if m in sys.modules))"
+        )
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "")
+
+
+class TestStartupTimings(unittest.TestCase):
+
+    def test_timed_accumulates(self):
+        with startup.timed("test step"):
+            pass
+        with startup.timed("test step"):
+            pass
+        self.assertIn("test step", startup.report())
+        self.assertIn("create_app", startup.report())
+
+
+if __name__ == '__main__':
+    unittest.main()
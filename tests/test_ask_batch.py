@@ -0,0 +1,125 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+from app import app as flask_app
+from app import semantic_cache, utils
+
+VECTORS = {"When do you open?": [1.0, 0.0], "Do you ship abroad?": [0.0, 1.0], "Which hose fits TM-4500?": [0.7, 0.7]}
+
+
+class TestAskBatch(unittest.TestCase):
+
+    def setUp(self):
+        semantic_cache.cache.invalidate()
+        self.addCleanup(semantic_cache.cache.invalidate)
+        flask_app.config['TESTING'] = True
+        flask_app.config['SECRET_KEY'] = 'test_secret_key'
+        self.client = flask_app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = "user1"
+            sess['status'] = "user"
+
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, "Tallman_QA.txt")
+        with open(path, 'w') as f:
+            f.write("What are your opening hours?\n9 to 5.\n\n")
+        patcher = patch('app.utils.TALLMAN_QA_FILE', path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(utils.invalidate_qa_index, "Tallman")
+        utils.invalidate_qa_index("Tallman")
+
+        self.mocks = {}
+        for name in ('embed_queries', 'get_or_create_collection', 'query_collection_many', 'get_llm_answer'):
+            patcher = patch(f'app.routes.{name}')
+            self.mocks[name] = patcher.start()
+            self.addCleanup(patcher.stop)
+        self.mocks['embed_queries'].side_effect = lambda texts: [VECTORS[text] for text in texts]
+        self.mocks['get_or_create_collection'].side_effect = lambda company: MagicMock(name=company)
+        self.mocks['query_collection_many'].side_effect = lambda collection, texts, embeddings, n_results, company: [
+            [{'id': f"{company}-{text}", 'question': text, 'answer': "stored"}] for text in texts
+        ]
+        self.mocks['get_llm_answer'].side_effect = lambda question, company, question_type, snippets, **kwargs: f"Answer to {question}"
+
+    def ask_batch(self, payload):
+        response = self.client.post('/api/ask_batch', json=payload)
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        return response, sorted(lines, key=lambda line: line['index'])
+
+    def test_streams_one_line_per_item(self):
+        response, lines = self.ask_batch({'items': [
+            {'question': "When do you open?", 'company': "Tallman", 'question_type': "General Help"},
+            {'question': "What are your opening hours", 'company': "Tallman", 'question_type': "General Help"},
+            {'question': "Do you ship abroad?", 'company': "MCR", 'question_type': "Sales"},
+            {'question': "Which hose fits TM-4500?", 'company': "Tallman", 'question_type': "Product"},
+            {'question': "Hi", 'company': "Nobody", 'question_type': "Sales"},
+            {'company': "MCR"},
+        ]})
+
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual([line['index'] for line in lines], [0, 1, 2, 3, 4, 5])
+        self.assertEqual(lines[0]['answer'], "Answer to When do you open?")
+        self.assertEqual((lines[1]['source'], lines[1]['answer']), ('exact_match', "9 to 5."))
+        self.assertEqual(lines[2]['raw_snippets'][0]['id'], "MCR-Do you ship abroad?")
+        self.assertEqual([line['status'] for line in lines[4:]], ['error', 'error'])
+
+        # One embedding pass for everything that needed retrieval, one vector search per company.
+        self.mocks['embed_queries'].assert_called_once_with(
+            ["When do you open?", "Do you ship abroad?", "Which hose fits TM-4500?"])
+        searched = {call.kwargs['company']: call.args[1] for call in self.mocks['query_collection_many'].call_args_list}
+        self.assertEqual(searched, {'Tallman': ["When do you open?", "Which hose fits TM-4500?"],
+                                    'MCR': ["Do you ship abroad?"]})
+
+    def test_llm_concurrency_is_bounded(self):
+        in_flight, peak, lock = [0], [0], threading.Lock()
+        release = threading.Event()
+
+        def slow_answer(question, company, question_type, snippets, **kwargs):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+                if in_flight[0] == 2:
+                    release.set()
+            release.wait(5)
+            with lock:
+                in_flight[0] -= 1
+            return "ok"
+        self.mocks['get_llm_answer'].side_effect = slow_answer
+
+        items = [{'question': question, 'company': "Tallman", 'question_type': "Sales"}
+                 for question in ("When do you open?", "Do you ship abroad?", "Which hose fits TM-4500?")]
+        with patch('app.utils.ASK_BATCH_LLM_CONCURRENCY', 2):
+            _, lines = self.ask_batch(items)
+
+        self.assertEqual([line['status'] for line in lines], ['success'] * 3)
+        self.assertEqual(peak[0], 2)
+
+    def test_llm_errors_are_reported_per_item(self):
+        self.mocks['get_llm_answer'].side_effect = lambda *args, **kwargs: "Error generating answer from LLM."
+        _, lines = self.ask_batch([{'question': "When do you open?", 'company': "Tallman", 'question_type': "Sales"}])
+        self.assertEqual((lines[0]['status'], lines[0]['message']), ('error', "Error generating answer from LLM."))
+
+    def test_rejects_bad_payloads(self):
+        self.assertEqual(self.client.post('/api/ask_batch', json={'items': []}).status_code, 400)
+        with patch('app.routes.ASK_BATCH_MAX_ITEMS', 1):
+            response = self.client.post('/api/ask_batch', json=[{}, {}])
+        self.assertEqual(response.status_code, 400)
+
+
+class TestQueryCollectionMany(unittest.TestCase):
+
+    def test_one_search_call_for_all_questions(self):
+        collection = MagicMock()
+        collection.query.return_value = {'metadatas': [[{'id': 'a'}], [{'id': 'b'}]]}
+        hits = utils.query_collection_many(collection, ["q1", "q2"], [[1.0], [2.0]], n_results=1)
+        collection.query.assert_called_once_with(query_embeddings=[[1.0], [2.0]], n_results=1)
+        self.assertEqual(hits, [[{'id': 'a'}], [{'id': 'b'}]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+
+from app import app as flask_app
+from app import semantic_cache
+from app.utils import stream_llm_answer
+
+
+def parse_events(body: str) -> list:
+    events = []
+    for message in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in message.split("\n"))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+@patch('app.utils.COMPLETION_CACHE_TTL', 0)
+@patch('app.utils.llm_client')
+class TestStreamLLMAnswer(unittest.TestCase):
+
+    def test_yields_content_deltas(self, mock_llm_client):
+        mock_llm_client.api_key = "fake_key"
+        mock_llm_client.stream_chat.return_value = iter([" \n", " We open", " at 9."])
+        parts = list(stream_llm_answer("When do you open?", "Tallman", "General Help", []))
+        self.assertEqual(parts, ["We open", " at 9."])
+        self.assertIn("Tallman", mock_llm_client.stream_chat.call_args.args[0][0]['content'])
+
+    @patch('builtins.print')
+    def test_errors_raise_the_llm_error_message(self, _, mock_llm_client):
+        mock_llm_client.api_key = None
+        with self.assertRaisesRegex(RuntimeError, "OpenAI API key not configured"):
+            list(stream_llm_answer("q", "Tallman", "Default", []))
+        mock_llm_client.api_key = "fake_key"
+        mock_llm_client.stream_chat.side_effect = Exception("timeout")
+        with self.assertRaisesRegex(RuntimeError, "Error generating answer from LLM"):
+            list(stream_llm_answer("q", "Tallman", "Default", []))
+
+
+class TestAskStream(unittest.TestCase):
+
+    def setUp(self):
+        semantic_cache.cache.invalidate()
+        self.addCleanup(semantic_cache.cache.invalidate)
+        flask_app.config['TESTING'] = True
+        flask_app.config['SECRET_KEY'] = 'test_secret_key'
+        self.client = flask_app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = "user1"
+            sess['status'] = "user"
+        self.mocks = {}
+        for name in ('get_or_create_collection', 'query_collection', 'stream_llm_answer', 'embed_query', 'find_exact_match'):
+            patcher = patch(f'app.routes.{name}')
+            self.mocks[name] = patcher.start()
+            self.addCleanup(patcher.stop)
+        self.mocks['find_exact_match'].return_value = None
+        self.mocks['embed_query'].return_value = [1.0, 0.0]
+        self.mocks['query_collection'].return_value = [{'question': "Hours?", 'answer': "9 to 5.", 'company': "Tallman"}]
+
+    def ask(self, question="When do you open?", **extra):
+        payload = {'user_question': question, 'company': "Tallman", 'question_type': "General Help", **extra}
+        return self.client.post('/api/ask/stream', json=payload)
+
+    def test_snippets_then_tokens_then_summary(self):
+        self.mocks['stream_llm_answer'].return_value = iter(["We open", " at 9."])
+        response = self.ask()
+
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        events = parse_events(response.get_data(as_text=True))
+        self.assertEqual([name for name, _ in events], ['snippets', 'token', 'token', 'done'])
+        self.assertEqual(events[0][1]['raw_snippets'][0]['answer'], "9 to 5.")
+        self.assertIsNone(events[0][1]['answer'])
+        self.assertEqual([data['text'] for name, data in events if name == 'token'], ["We open", " at 9."])
+        self.assertEqual((events[-1][1]['answer'], events[-1][1]['source']), ("We open at 9.", 'retrieval'))
+        # The streamed answer is cached like a regular /api/ask answer.
+        self.assertEqual(semantic_cache.cache.get("Tallman", "General Help", [1.0, 0.0])['answer'], "We open at 9.")
+
+    def test_llm_failure_is_an_error_event(self):
+        def failing(*args):
+            yield "We"
+            raise RuntimeError("Error generating answer from LLM.")
+        self.mocks['stream_llm_answer'].side_effect = failing
+        events = parse_events(self.ask().get_data(as_text=True))
+        self.assertEqual([name for name, _ in events], ['snippets', 'token', 'error'])
+        self.assertEqual(events[-1][1]['message'], "Error generating answer from LLM.")
+        self.assertEqual(semantic_cache.cache.stats()['entries'], 0)
+
+    def test_known_answer_is_sent_whole(self):
+        self.mocks['find_exact_match'].return_value = MagicMock(company="Tallman", answer="9 to 5.",
+                                                                to_dict=lambda: {'question': "Hours?", 'answer': "9 to 5."})
+        events = parse_events(self.ask("Hours?").get_data(as_text=True))
+        self.assertEqual(events[1], ('token', {'text': "9 to 5."}))
+        self.assertEqual(events[2][1]['source'], 'exact_match')
+        self.mocks['stream_llm_answer'].assert_not_called()
+
+    def test_errors_before_streaming_are_json(self):
+        self.assertEqual(self.ask(question_type="Nope").status_code, 400)
+        self.mocks['get_or_create_collection'].side_effect = RuntimeError("model not loaded")
+        response = self.ask()
+        self.assertEqual((response.status_code, response.get_json()['message']), (500, "model not loaded"))
+
+
+if __name__ == '__main__':
+    unittest.main()
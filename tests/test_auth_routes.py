@@ -52,14 +52,14 @@ class AuthRoutesTests(unittest.TestCase):
 
     def test_login_page_get(self):
         with self.app.app_context(): # Ensure app context for url_for
-            response = self.client.get(url_for('login'))
+            response = self.client.get(url_for('main.login'))
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'Login', response.data) # Check for common login page text
 
     def test_login_success(self):
         with self.app.app_context():
-            login_url = url_for('login')
-            ask_ai_url = url_for('ask_ai_get') # Expected redirect URL
+            login_url = url_for('main.login')
+            ask_ai_url = url_for('main.ask_ai_get') # Expected redirect URL
 
         response = self.client.post(login_url, data={
             'email': 'test@example.com',
@@ -78,7 +78,7 @@ class AuthRoutesTests(unittest.TestCase):
 
     def test_login_invalid_credentials(self):
         with self.app.app_context():
-            login_url = url_for('login')
+            login_url = url_for('main.login')
         response = self.client.post(login_url, data={
             'email': 'test@example.com',
             'password': 'wrongpassword'
@@ -92,7 +92,7 @@ class AuthRoutesTests(unittest.TestCase):
 
     def test_login_missing_fields(self):
         with self.app.app_context():
-            login_url = url_for('login')
+            login_url = url_for('main.login')
         response = self.client.post(login_url, data={'email': 'test@example.com'}) # Missing password
         self.assertEqual(response.status_code, 400) # Bad request
         json_response = response.get_json()
@@ -102,8 +102,8 @@ class AuthRoutesTests(unittest.TestCase):
 
     def test_logout(self):
         with self.app.app_context():
-            login_url = url_for('login')
-            logout_url = url_for('logout')
+            login_url = url_for('main.login')
+            logout_url = url_for('main.logout')
 
         # First, log in a user
         self.client.post(login_url, data={
@@ -128,8 +128,8 @@ class AuthRoutesTests(unittest.TestCase):
     def test_login_required_decorator_redirect(self):
         # Access a login-required page without being logged in
         with self.app.app_context():
-            ask_url = url_for('ask_ai_get')
-            login_url_with_next = url_for('login', next=ask_url)
+            ask_url = url_for('main.ask_ai_get')
+            login_url_with_next = url_for('main.login', next=ask_url)
 
         response = self.client.get(ask_url, follow_redirects=False)
         self.assertEqual(response.status_code, 302) # Redirect to login
@@ -137,8 +137,8 @@ class AuthRoutesTests(unittest.TestCase):
 
     def test_login_required_decorator_ajax_json_response(self):
         with self.app.app_context():
-            ask_api_url = url_for('ask_ai_post') # An AJAX-expected endpoint
-            login_url = url_for('login')
+            ask_api_url = url_for('main.ask_ai_post') # An AJAX-expected endpoint
+            login_url = url_for('main.login')
 
         response = self.client.post(ask_api_url, json={}, headers={'X-Requested-With': 'XMLHttpRequest'})
         self.assertEqual(response.status_code, 401) # Unauthorized
@@ -151,9 +151,9 @@ class AuthRoutesTests(unittest.TestCase):
     def test_admin_required_decorator_redirect(self):
         # Log in as a non-admin user
         with self.app.app_context():
-            login_url = url_for('login')
-            manage_users_url = url_for('manage_users')
-            index_url = url_for('index') # Admin required redirects to index if permission denied
+            login_url = url_for('main.login')
+            manage_users_url = url_for('main.manage_users')
+            index_url = url_for('main.index') # Admin required redirects to index if permission denied
 
         self.client.post(login_url, data={
             'email': 'test@example.com', # Non-admin
@@ -167,8 +167,8 @@ class AuthRoutesTests(unittest.TestCase):
     def test_admin_required_decorator_ajax_json_response(self):
         # Log in as non-admin
         with self.app.app_context():
-            login_url = url_for('login')
-            api_add_user_url = url_for('api_add_user') # An admin API endpoint
+            login_url = url_for('main.login')
+            api_add_user_url = url_for('main.api_add_user') # An admin API endpoint
 
         self.client.post(login_url, data={'email': 'test@example.com', 'password': 'password123'})
 
@@ -182,8 +182,8 @@ class AuthRoutesTests(unittest.TestCase):
     def test_admin_can_access_admin_page(self):
         # Log in as admin
         with self.app.app_context():
-            login_url = url_for('login')
-            manage_users_url = url_for('manage_users')
+            login_url = url_for('main.login')
+            manage_users_url = url_for('main.manage_users')
 
         self.client.post(login_url, data={
             'email': 'admin@example.com',
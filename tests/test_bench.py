@@ -0,0 +1,20 @@
+import unittest
+from app import bench
+
+
+class TestBench(unittest.TestCase):
+
+    def test_numpy_backend_benchmark_reports_exact_recall(self):
+        embeddings = bench.synthetic_embeddings(200, 16)
+        queries = bench.make_queries(embeddings, 20)
+        results = bench.bench_backends(embeddings, queries, k=3, backends=('numpy',))
+        self.assertEqual(results['items'], 200)
+        self.assertEqual(results['numpy']['recall@3'], 1.0)
+        self.assertGreater(results['numpy']['p50_ms'], 0)
+
+    def test_recall_at_k(self):
+        self.assertEqual(bench.recall_at_k([[1, 2, 3], [4, 5, 6]], [{1, 2, 3}, {4, 5, 9}], 3), (1 + 2 / 3) / 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+
+from app import app as flask_app
+from app import metrics, semantic_cache, utils
+from app.circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, HALF_OPEN, OPEN
+
+SNIPPETS = [{'question': "What are your opening hours?", 'answer': "9 to 5.", 'company': "Tallman"},
+            {'question': "Do you ship?", 'answer': "Yes.", 'company': "Tallman"}]
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.now = 100.0
+        patcher = patch('app.circuit_breaker.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success(0.5) # resets the count
+        for _ in range(3):
+            breaker.before_call()
+            breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertTrue(breaker.is_open())
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        self.assertEqual((metrics.get("llm.circuit_opened"), metrics.get("llm.circuit_rejected")), (1, 1))
+
+    def test_slow_calls_count_as_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, slow_call_seconds=10)
+        breaker.record_success(12)
+        breaker.record_success(15)
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_half_open_probe_closes_or_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        self.now += 30
+        breaker.before_call() # the probe
+        self.assertEqual(breaker.state, HALF_OPEN)
+        with self.assertRaises(CircuitOpenError): # only one probe at a time
+            breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+
+        self.now += 30
+        breaker.before_call()
+        breaker.record_success(1.0)
+        self.assertEqual(breaker.stats(), {'state': CLOSED, 'consecutive_failures': 0})
+        breaker.before_call()
+
+    def test_lost_probe_is_replaced(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        self.now += 30
+        breaker.before_call()
+        self.now += 30
+        breaker.before_call()
+
+
+class TestExtractiveFallback(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        semantic_cache.cache.invalidate()
+        self.addCleanup(semantic_cache.cache.invalidate)
+        flask_app.config['TESTING'] = True
+        flask_app.config['SECRET_KEY'] = 'test_secret_key'
+        self.client = flask_app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = "user1"
+            sess['status'] = "user"
+        self.mocks = {}
+        for name in ('get_or_create_collection', 'query_collection', 'get_llm_answer', 'stream_llm_answer',
+                     'embed_query', 'find_exact_match'):
+            patcher = patch(f'app.routes.{name}')
+            self.mocks[name] = patcher.start()
+            self.addCleanup(patcher.stop)
+        self.mocks['find_exact_match'].return_value = None
+        self.mocks['embed_query'].return_value = [1.0, 0.0]
+        self.mocks['query_collection'].return_value = SNIPPETS
+        self.mocks['get_llm_answer'].return_value = utils.LLM_UNAVAILABLE_MESSAGE
+        self.mocks['stream_llm_answer'].side_effect = CircuitOpenError(utils.LLM_UNAVAILABLE_MESSAGE)
+
+    def ask(self, path='/api/ask'):
+        return self.client.post(path, json={'user_question': "When do you open?", 'company': "Tallman",
+                                            'question_type': "General Help"})
+
+    def test_ask_returns_the_best_snippet_flagged_as_extractive(self):
+        response = self.ask()
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual((data['answer'], data['source'], data['extractive']), ("9 to 5.", 'extractive_fallback', True))
+        self.assertEqual(data['matched_question'], "What are your opening hours?")
+        self.assertEqual(metrics.get("ask.extractive_fallbacks"), 1)
+        # Not an LLM answer, so it is not reused for paraphrases.
+        self.assertEqual(semantic_cache.cache.stats()['entries'], 0)
+
+    def test_ask_without_snippets_is_503(self):
+        self.mocks['query_collection'].return_value = []
+        response = self.ask()
+        self.assertEqual((response.status_code, response.get_json()['message']), (503, utils.LLM_UNAVAILABLE_MESSAGE))
+
+    def test_stream_sends_the_extractive_answer(self):
+        body = self.ask('/api/ask/stream').get_data(as_text=True)
+        events = [(message.split("\n")[0][len("event: "):], json.loads(message.split("\n")[1][len("data: "):]))
+                  for message in body.strip().split("\n\n")]
+        self.assertEqual([name for name, _ in events], ['snippets', 'token', 'done'])
+        self.assertEqual(events[1][1]['text'], "9 to 5.")
+        self.assertTrue(events[2][1]['extractive'])
+
+
+@patch('app.utils.COMPLETION_CACHE_TTL', 0)
+@patch('app.utils.llm_client')
+class TestLLMAnswerWhileOpen(unittest.TestCase):
+
+    @patch('builtins.print')
+    def test_open_circuit_is_reported_as_unavailable(self, _, mock_llm_client):
+        mock_llm_client.api_key = "fake_key"
+        mock_llm_client.chat.side_effect = CircuitOpenError("open")
+        self.assertEqual(utils.get_llm_answer("q", "Tallman", "Default", []), utils.LLM_UNAVAILABLE_MESSAGE)
+        mock_llm_client.stream_chat.side_effect = CircuitOpenError("open")
+        with self.assertRaises(CircuitOpenError):
+            list(utils.stream_llm_answer("q", "Tallman", "Default", []))
+
+
+if __name__ == '__main__':
+    unittest.main()
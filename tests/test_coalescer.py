@@ -0,0 +1,83 @@
+import threading
+import time
+import unittest
+
+from app import bench, metrics
+from app.coalescer import CoalescingEmbeddingFunction, EmbeddingCoalescer
+
+
+class RecordingModel:
+    def __init__(self):
+        self.calls = []
+        self.entered = threading.Event()
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def __call__(self, input):
+        self.entered.set()
+        self.gate.wait(5)
+        self.calls.append(list(input))
+        return [[float(len(text))] for text in input]
+
+
+class TestEmbeddingCoalescer(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_calls_arriving_during_a_pass_share_the_next_batch(self):
+        model = RecordingModel()
+        model.gate.clear()
+        coalescer = EmbeddingCoalescer(model, window=30, max_batch=8)
+        results = {}
+
+        def ask(text):
+            results[text] = coalescer.embed([text])
+
+        threads = [threading.Thread(target=ask, args=("a",))]
+        threads[0].start()
+        self.assertTrue(model.entered.wait(5)) # "a" runs on its own and blocks in the model
+        threads += [threading.Thread(target=ask, args=(text,)) for text in ("bb", "ccc", "bb")]
+        for thread in threads[1:]:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while len(coalescer._pending) < 3 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        model.gate.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(results, {"a": [[1.0]], "bb": [[2.0]], "ccc": [[3.0]]})
+        self.assertEqual(model.calls[0], ["a"])
+        self.assertEqual(sorted(model.calls[1]), ["bb", "ccc"]) # one pass, duplicates embedded once
+        self.assertEqual(metrics.get("embedding_coalescer.batches"), 2)
+
+    def test_lone_caller_does_not_wait_for_the_window(self):
+        coalescer = EmbeddingCoalescer(RecordingModel(), window=30, max_batch=8)
+        done = threading.Event()
+        threading.Thread(target=lambda: (coalescer.embed(["x"]), done.set()), daemon=True).start()
+        self.assertTrue(done.wait(5))
+
+    def test_large_calls_bypass_the_queue(self):
+        model = RecordingModel()
+        function = CoalescingEmbeddingFunction(model, window=30, max_batch=2)
+        self.assertEqual(function(["a", "bb"]), [[1.0], [2.0]])
+        self.assertEqual(model.calls, [["a", "bb"]])
+
+    def test_errors_reach_every_waiter(self):
+        def failing(input):
+            raise ValueError("model failed")
+        coalescer = EmbeddingCoalescer(failing, window=0.01, max_batch=8)
+        with self.assertRaises(ValueError):
+            coalescer.embed(["x"])
+
+    def test_bench_coalescing(self):
+        model = bench.SimulatedModel(overhead_ms=2, per_item_ms=0.1, dim=4)
+        results = bench.bench_coalescing(model, concurrency=(1, 8), requests_per_asker=3, window_ms=2)
+        self.assertEqual(set(results['8_askers']), {'direct', 'coalesced'})
+        self.assertGreater(results['8_askers']['coalesced']['queries_per_second'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
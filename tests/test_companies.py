@@ -0,0 +1,143 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from app import app as flask_app
+from app import metrics, utils
+from app.companies import CollectionCache, CompanyRegistry
+
+
+class RegistryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.dir = tmpdir.name
+        self.path = os.path.join(self.dir, "companies.json")
+        self.registry = CompanyRegistry(self.path, lambda: ["Tallman", "MCR"], check_interval=0)
+
+    def write(self, companies):
+        with open(self.path, 'w') as f:
+            json.dump(companies, f)
+        self.registry.reload()
+
+
+class TestCompanyRegistry(RegistryTestCase):
+
+    def test_defaults_without_file(self):
+        self.assertEqual(self.registry.names(), ["Tallman", "MCR"])
+        self.assertEqual(self.registry.get("MCR").collection_name, "mcr_qa")
+        self.assertIsNone(self.registry.get("Acme"))
+
+    def test_file_entries_and_onboarding(self):
+        self.write([{'name': "Tallman"}, {'name': "Acme", 'qa_file': "/srv/Acme.txt", 'collection': "acme_v2"}])
+        self.assertEqual(self.registry.names(), ["Tallman", "Acme"])
+        self.assertEqual((self.registry.get("Acme").qa_file, self.registry.get("Acme").collection_name),
+                         ("/srv/Acme.txt", "acme_v2"))
+        self.assertIsNone(self.registry.get("MCR"))
+
+        self.write([{'name': "Tallman"}, {'name': "Acme"}, "Globex"])
+        self.assertEqual(self.registry.names(), ["Tallman", "Acme", "Globex"])
+
+    @patch('builtins.print')
+    def test_invalid_file_keeps_last_good_list(self, _):
+        self.write([{'name': "Acme"}])
+        self.assertEqual(self.registry.names(), ["Acme"])
+        self.write([{'name': "Acme"}, {'name': "Acme"}])
+        self.assertEqual(self.registry.names(), ["Acme"])
+        with open(self.path, 'w') as f:
+            f.write("{not json")
+        self.registry.reload()
+        self.assertEqual(self.registry.names(), ["Acme"])
+
+
+class TestCollectionCache(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_lru_eviction(self):
+        evicted = []
+        cache = CollectionCache(2, on_evict=lambda key, collection: evicted.append(key))
+        owner = (object(),)
+        opened = []
+
+        def opener(key):
+            return lambda: opened.append(key) or f"handle-{key}"
+
+        cache.get("a", owner, opener("a"))
+        cache.get("b", owner, opener("b"))
+        self.assertEqual(cache.get("a", owner, opener("a")), "handle-a") # "b" is now the least recently used
+        cache.get("c", owner, opener("c"))
+        cache.get("b", owner, opener("b"))
+
+        self.assertEqual(opened, ["a", "b", "c", "b"])
+        self.assertEqual(evicted, ["b", "a"])
+        self.assertEqual(cache.stats(), {'open': 2, 'capacity': 2})
+        self.assertEqual(metrics.report()['ratios']['collection_cache.hit_ratio'], 0.2)
+        self.assertEqual(metrics.get("collection_cache.evictions"), 2)
+
+    def test_new_owner_reopens(self):
+        cache = CollectionCache(2)
+        cache.get("a", (1,), lambda: "old")
+        self.assertEqual(cache.get("a", (object(),), lambda: "new"), "new")
+
+
+class TestUtilsUseRegistry(RegistryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch('app.utils.company_registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        utils.collection_cache.invalidate()
+        self.addCleanup(utils.collection_cache.invalidate)
+
+    def test_builtin_companies_carry_their_qa_files(self):
+        with patch('app.utils.TALLMAN_QA_FILE', "/srv/tallman.txt"):
+            self.assertEqual(utils._builtin_companies()[0].qa_file, "/srv/tallman.txt")
+            registry = CompanyRegistry(self.path, utils._builtin_companies, check_interval=0)
+            self.assertEqual(registry.get("Tallman").qa_file, "/srv/tallman.txt")
+        self.assertIsNone(registry.get("Acme"))
+
+    def test_builtin_paths_and_configured_ones(self):
+        self.assertEqual(utils.get_qa_filepath("Tallman"), utils.TALLMAN_QA_FILE)
+        self.write([{'name': "Acme"}, {'name': "Globex", 'qa_file': "/srv/globex.txt"}])
+        self.assertEqual(utils.get_qa_filepath("Acme"), os.path.join("app/data", "Acme_QA.txt"))
+        self.assertEqual(utils.get_qa_filepath("Globex"), "/srv/globex.txt")
+        with self.assertRaisesRegex(ValueError, "Invalid company name"):
+            utils.get_qa_filepath("Tallman")
+
+    @patch('app.utils.client')
+    @patch('app.utils.sentence_transformer_ef')
+    def test_collection_opened_once(self, mock_ef, mock_client):
+        self.write([{'name': "Acme", 'collection': "acme_v2"}])
+        first = utils.get_or_create_collection("Acme")
+        second = utils.get_or_create_collection("Acme")
+        self.assertIs(first, second)
+        mock_client.get_or_create_collection.assert_called_once_with(name="acme_v2", embedding_function=mock_ef)
+
+    def test_routes_accept_onboarded_company(self):
+        self.write([{'name': "Acme", 'qa_file': os.path.join(self.dir, "Acme_QA.txt")}])
+        with open(os.path.join(self.dir, "Acme_QA.txt"), 'w') as f:
+            f.write("Do you sell anvils?\nYes.\n\n")
+        self.addCleanup(utils.invalidate_qa_index, "Acme")
+        flask_app.config['TESTING'] = True
+        flask_app.config['SECRET_KEY'] = 'test_secret_key'
+        client = flask_app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = "admin1"
+            sess['status'] = "admin"
+
+        response = client.get('/admin/download_qa/Acme')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()[0]['answer'], "Yes.")
+        self.assertEqual(client.get('/admin/download_qa/Tallman').status_code, 400)
+        self.assertIn(b'<option value="Acme">Acme</option>', client.get('/ask').data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+from app import metrics, utils
+from app.completion_cache import CompletionCache, fingerprint
+
+MESSAGES = [{'role': "system", 'content': "You answer for Tallman."}, {'role': "user", 'content': "When do you open?"}]
+
+
+class TestCompletionCache(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, "completions.sqlite3")
+
+    def test_fingerprint_covers_model_and_messages(self):
+        key = fingerprint("gpt-3.5-turbo", MESSAGES)
+        self.assertEqual(key, fingerprint("gpt-3.5-turbo", [dict(message) for message in MESSAGES]))
+        self.assertNotEqual(key, fingerprint("gpt-4o", MESSAGES))
+        self.assertNotEqual(key, fingerprint("gpt-3.5-turbo", MESSAGES[:1] + [{'role': "user", 'content': "Hours?"}]))
+
+    def test_memory_then_disk_hits(self):
+        cache = CompletionCache(self.path)
+        self.assertIsNone(cache.get("k", "v1"))
+        cache.put("k", "Tallman", "v1", "At 9.")
+        self.assertEqual(cache.get("k", "v1"), "At 9.")
+        # Another worker shares the SQLite file.
+        self.assertEqual(CompletionCache(self.path).get("k", "v1"), "At 9.")
+        self.assertEqual((metrics.get("completion_cache.hits"), metrics.get("completion_cache.disk_hits"),
+                          metrics.get("completion_cache.misses")), (2, 1, 1))
+
+    def test_version_change_and_ttl_make_entries_stale(self):
+        cache = CompletionCache(self.path, ttl=60)
+        cache.put("k", "Tallman", "v1", "At 9.")
+        self.assertIsNone(cache.get("k", "v2"))
+        self.assertEqual(cache.stats()['disk_entries'], 0)
+
+        cache.put("k", "Tallman", "v2", "At 8.")
+        with patch('app.completion_cache.time.time', return_value=time.time() + 61):
+            self.assertIsNone(CompletionCache(self.path, ttl=60).get("k", "v2"))
+
+    def test_stale_lookup_keeps_other_versions_of_the_company(self):
+        cache = CompletionCache(self.path)
+        cache.put("single", "Tallman", "v-tallman", "At 9.")
+        cache.put("federated", "Tallman", "v-tallman+mcr", "At 9, MCR at 8.")
+        cache.put("old", "Tallman", "v-old", "At 10.")
+        self.assertIsNone(cache.get("old", "v-new"))
+        fresh = CompletionCache(self.path) # no memory tier
+        self.assertEqual(fresh.get("single", "v-tallman"), "At 9.")
+        self.assertEqual(fresh.get("federated", "v-tallman+mcr"), "At 9, MCR at 8.")
+        self.assertEqual(fresh.stats()['disk_entries'], 2)
+
+    def test_memory_tier_is_bounded(self):
+        cache = CompletionCache(self.path, memory_entries=2)
+        for key in ("a", "b", "c"):
+            cache.put(key, "Tallman", "v1", key.upper())
+        self.assertEqual(cache.stats()['memory_entries'], 2)
+        self.assertEqual(cache.get("a", "v1"), "A")
+        self.assertEqual(metrics.get("completion_cache.disk_hits"), 1)
+
+
+class TestLLMAnswerCaching(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        qa_path = os.path.join(tmpdir.name, "Tallman_QA.txt")
+        with open(qa_path, 'w') as f:
+            f.write("What are your opening hours?\n9 to 5.\n\n")
+        self.llm = MagicMock(api_key="fake_key", model="fake-model")
+        self.llm.chat.return_value = " We open at 9. "
+        cache = CompletionCache(os.path.join(tmpdir.name, "completions.sqlite3"))
+        for target, value in (('TALLMAN_QA_FILE', qa_path), ('get_embedding_function', lambda: None),
+                              ('llm_client', self.llm), ('completion_cache', cache)):
+            patcher = patch(f'app.utils.{target}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(utils.invalidate_qa_index, "Tallman")
+        utils.invalidate_qa_index("Tallman")
+        self.snippets = [{'question': "What are your opening hours?", 'answer': "9 to 5.", 'company': "Tallman"}]
+
+    def ask(self):
+        return utils.get_llm_answer("When do you open?", "Tallman", "General Help", self.snippets)
+
+    def test_repeated_prompt_is_served_from_cache_until_the_kb_changes(self):
+        self.assertEqual(self.ask(), "We open at 9.")
+        self.assertEqual(self.ask(), "We open at 9.")
+        self.assertEqual(self.llm.chat.call_count, 1)
+
+        time.sleep(0.01) # the file signature includes the mtime
+        utils.append_qa_pair("Tallman", "Do you ship?", "Yes.", dedup='off')
+        self.ask()
+        self.assertEqual(self.llm.chat.call_count, 2)
+
+    def test_streamed_answer_is_cached_too(self):
+        self.llm.stream_chat.return_value = iter([" We open", " at 9."])
+        parts = list(utils.stream_llm_answer("When do you open?", "Tallman", "General Help", self.snippets))
+        self.assertEqual(parts, ["We open", " at 9."])
+        self.assertEqual(self.ask(), "We open at 9.")
+        self.llm.chat.assert_not_called()
+
+    def test_errors_are_not_cached(self):
+        self.llm.chat.side_effect = [Exception("timeout"), " We open at 9. "]
+        with patch('builtins.print'):
+            self.assertEqual(self.ask(), "Error generating answer from LLM.")
+        self.assertEqual(self.ask(), "We open at 9.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+
+from app import dedup, utils
+from app.utils import append_qa_pairs, load_qa_data, make_qa_id
+
+# Questions embed to fixed directions: "paraphrase" variants share one.
+VECTORS = {
+    "How do I reset my password?": [1.0, 0.0, 0.0],
+    "How can I reset my password": [0.99, 0.05, 0.0],
+    "What are your opening hours?": [0.0, 1.0, 0.0],
+    "Where is the office?": [0.0, 0.0, 1.0],
+}
+
+
+def fake_embedding_function(texts):
+    return [np.array(VECTORS[text], dtype=np.float32) for text in texts]
+
+
+class TestSimilarity(unittest.TestCase):
+
+    def test_blocked_pairs_match_brute_force(self):
+        rng = np.random.default_rng(0)
+        base = rng.normal(size=(10, 8))
+        embeddings = np.vstack([base, base[:4] + rng.normal(scale=0.01, size=(4, 8))])
+        normalized = dedup.normalize_rows(embeddings)
+        similarities = normalized @ normalized.T
+        expected = {(i, j) for i in range(14) for j in range(i + 1, 14) if similarities[i, j] >= 0.95}
+
+        found = {(i, j) for i, j, _ in dedup.iter_similar_pairs(embeddings, 0.95, block_size=3)}
+
+        self.assertEqual(found, expected)
+        self.assertEqual(found, {(0, 10), (1, 11), (2, 12), (3, 13)})
+
+    def test_cluster_pairs(self):
+        clusters = dedup.cluster_pairs(6, [(0, 2), (2, 5), (3, 4)])
+        self.assertEqual(sorted(clusters), [[0, 2, 5], [3, 4]])
+
+    def test_find_batch_duplicates_points_at_earliest(self):
+        matches = dedup.find_batch_duplicates([[1, 0], [0, 1], [1, 0.01], [1, 0]], 0.99)
+        self.assertIsNone(matches[0])
+        self.assertIsNone(matches[1])
+        self.assertEqual([match[0] for match in matches[2:]], [0, 0])
+
+    def test_dedup_report(self):
+        collection = MagicMock()
+        collection.get.return_value = {
+            'ids': ['a', 'b', 'c'],
+            'documents': ["How do I reset my password?", "How can I reset my password", "Where is the office?"],
+            'embeddings': [VECTORS["How do I reset my password?"], VECTORS["How can I reset my password"],
+                           VECTORS["Where is the office?"]],
+        }
+        with patch('app.utils.get_or_create_collection', return_value=collection):
+            report = dedup.dedup_report("Tallman", threshold=0.9)
+        self.assertEqual((report['items'], report['clusters'], report['redundant_items']), (3, 1, 1))
+        self.assertEqual([item['id'] for item in report['cluster_details'][0]['items']], ['a', 'b'])
+
+
+class TestDedupOnAppend(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, "Tallman_QA.txt")
+        with open(self.path, 'w') as f:
+            f.write("How do I reset my password?\nUse the reset link.\n\n")
+        self.stored_id = make_qa_id("Tallman", "How do I reset my password?", "Use the reset link.")
+        self.collection = MagicMock()
+        self.collection.count.return_value = 1
+
+        def query(query_embeddings, n_results, include):
+            results = {'ids': [], 'documents': [], 'embeddings': []}
+            for _ in query_embeddings:
+                results['ids'].append([self.stored_id])
+                results['documents'].append(["How do I reset my password?"])
+                results['embeddings'].append([VECTORS["How do I reset my password?"]])
+            return results
+        self.collection.query.side_effect = query
+
+        for target, value in (('TALLMAN_QA_FILE', self.path), ('sentence_transformer_ef', fake_embedding_function)):
+            patcher = patch(f'app.utils.{target}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch('app.utils.get_or_create_collection', return_value=self.collection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_skip_drops_duplicates_of_stored_and_batch_questions(self):
+        duplicates = []
+        new_items = append_qa_pairs("Tallman", [
+            ("How can I reset my password", "Click forgot password."),
+            ("What are your opening hours?", "9 to 5."),
+            ("What are your opening hours?", "Nine to five."),
+        ], dedup='skip', duplicates=duplicates)
+
+        self.assertEqual([qa.question for qa in new_items], ["What are your opening hours?"])
+        self.assertEqual([d['duplicate_of'] for d in duplicates], ["How do I reset my password?", "What are your opening hours?"])
+        self.assertEqual(duplicates[0]['duplicate_of_id'], self.stored_id)
+        self.assertEqual(len(load_qa_data("Tallman")), 2)
+
+    def test_merge_keeps_existing_answer_and_adds_the_new_one(self):
+        new_items = append_qa_pairs("Tallman", [("How can I reset my password", "Click forgot password.")], dedup='merge')
+
+        merged = "Use the reset link. Click forgot password."
+        live = load_qa_data("Tallman")
+        self.assertEqual([(qa.question, qa.answer) for qa in live], [("How do I reset my password?", merged)])
+        self.assertEqual(new_items[0].id, live[0].id)
+        self.collection.delete.assert_called_once_with(ids=[self.stored_id])
+        with open(self.path) as f:
+            self.assertIn(f"##Update##\nHow do I reset my password?\n{merged}\n", f.read())
+
+    def test_merge_keeps_answers_of_every_pair_with_that_question(self):
+        with open(self.path, 'a') as f:
+            f.write("How do I reset my password?\nAsk IT.\n\n")
+        utils.invalidate_qa_index("Tallman")
+
+        append_qa_pairs("Tallman", [("How can I reset my password", "Click forgot password.")], dedup='merge')
+
+        live = load_qa_data("Tallman")
+        self.assertEqual([qa.answer for qa in live], ["Use the reset link. Ask IT. Click forgot password."])
+        deleted = self.collection.delete.call_args.kwargs['ids']
+        self.assertEqual(set(deleted), {self.stored_id, make_qa_id("Tallman", "How do I reset my password?", "Ask IT.")})
+
+    def test_merge_combines_batch_duplicates_into_one_pair(self):
+        new_items = append_qa_pairs("Tallman", [
+            ("What are your opening hours?", "9 to 5."),
+            ("What are your opening hours?", "Closed on Sundays."),
+            ("What are your opening hours?", "9 to 5"),
+        ], dedup='merge')
+
+        self.assertEqual([(qa.question, qa.answer) for qa in new_items],
+                         [("What are your opening hours?", "9 to 5. Closed on Sundays.")])
+
+    def test_merge_of_an_answer_already_stored_writes_nothing(self):
+        duplicates = []
+        new_items = append_qa_pairs("Tallman", [("How can I reset my password", "use the reset link")],
+                                    dedup='merge', duplicates=duplicates)
+
+        self.assertEqual(new_items, [])
+        self.assertEqual(len(duplicates), 1)
+        self.collection.delete.assert_not_called()
+        self.assertEqual(len(load_qa_data("Tallman")), 1)
+
+    def test_off_appends_everything(self):
+        new_items = append_qa_pairs("Tallman", [("How can I reset my password", "Click forgot password.")], dedup='off')
+        self.assertEqual(len(new_items), 1)
+        self.collection.query.assert_not_called()
+
+    def test_append_qa_pair_returns_none_when_skipped(self):
+        self.assertIsNone(utils.append_qa_pair("Tallman", "How can I reset my password", "Hi.", dedup='skip'))
+
+
+if __name__ == '__main__':
+    unittest.main()
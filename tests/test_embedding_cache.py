@@ -0,0 +1,130 @@
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+
+from app import utils
+from app.embedding_cache import CachedEmbeddingFunction, EmbeddingCache
+
+
+class FakeEmbeddingFunction:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, input):
+        self.calls.append(list(input))
+        return [np.array([len(text), 1.0, 0.0], dtype=np.float32) for text in input]
+
+    def name(self):
+        return "fake"
+
+
+class TestEmbeddingCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_only_misses_reach_the_model(self):
+        inner = FakeEmbeddingFunction()
+        ef = CachedEmbeddingFunction(inner, EmbeddingCache(self.cache_dir, "model-a", capacity=10))
+
+        first = ef(["alpha", "beta"])
+        second = ef(["beta", "gamma", "gamma"])
+
+        self.assertEqual(inner.calls, [["alpha", "beta"], ["gamma"]])
+        np.testing.assert_array_equal(first[1], second[0])
+        np.testing.assert_array_equal(second[1], [5.0, 1.0, 0.0])
+        stats = ef.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (1, 4, 3))
+
+    def test_persists_across_instances(self):
+        EmbeddingCache(self.cache_dir, "model-a", capacity=10).put_many(["alpha"], [[1.0, 2.0, 3.0]])
+
+        reopened = EmbeddingCache(self.cache_dir, "model-a", capacity=10)
+        vectors = reopened.get_many(["alpha", "beta"])
+
+        np.testing.assert_array_equal(vectors[0], [1.0, 2.0, 3.0])
+        self.assertIsNone(vectors[1])
+
+    def test_keyed_by_model_name(self):
+        EmbeddingCache(self.cache_dir, "model-a", capacity=10).put_many(["alpha"], [[1.0, 2.0, 3.0]])
+        self.assertEqual(EmbeddingCache(self.cache_dir, "model-b", capacity=10).get_many(["alpha"]), [None])
+
+    def test_evicts_least_recently_used(self):
+        cache = EmbeddingCache(self.cache_dir, "model-a", capacity=2)
+        cache.put_many(["a", "b"], [[1.0], [2.0]])
+        cache.get_many(["a"]) # "b" is now the least recently used
+        cache.put_many(["c"], [[3.0]])
+
+        a, b, c = cache.get_many(["a", "b", "c"])
+        self.assertIsNotNone(a)
+        self.assertIsNone(b)
+        np.testing.assert_array_equal(c, [3.0])
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_row_overwritten_by_another_process_is_a_miss(self):
+        ours = EmbeddingCache(self.cache_dir, "model-a", capacity=1)
+        ours.put_many(["a"], [[1.0]])
+        EmbeddingCache(self.cache_dir, "model-a", capacity=1).put_many(["b"], [[2.0]])
+
+        self.assertEqual(ours.get_many(["a"]), [None])
+
+    def test_row_rewritten_while_copying_is_a_miss(self):
+        cache = EmbeddingCache(self.cache_dir, "model-a", capacity=1)
+        cache.put_many(["a"], [[1.0]])
+        vectors = cache._vectors
+
+        class RewrittenDuringRead:
+            def __getitem__(self, row):
+                vector = vectors[row]
+                cache._keys[row] = np.frombuffer(cache.key("b"), dtype=np.uint8)
+                return vector
+        cache._vectors = RewrittenDuringRead()
+
+        self.assertEqual(cache.get_many(["a"]), [None])
+        self.assertEqual(cache.stats()['hits'], 0)
+
+    def test_layout_comes_from_meta_written_by_another_process(self):
+        ours = EmbeddingCache(self.cache_dir, "model-a", capacity=8, dtype="float16")
+        EmbeddingCache(self.cache_dir, "model-a", capacity=2).put_many(["a"], [[0.1, 0.2]])
+
+        ours.put_many(["b"], [[0.3, 0.4]])
+
+        self.assertEqual((ours.capacity, ours.dtype), (2, np.dtype('float32')))
+        vectors = EmbeddingCache(self.cache_dir, "model-a").get_many(["a", "b"])
+        np.testing.assert_array_equal(vectors[0], np.float32([0.1, 0.2]))
+        np.testing.assert_array_equal(vectors[1], np.float32([0.3, 0.4]))
+        with self.assertRaises(ValueError):
+            EmbeddingCache(self.cache_dir, "model-a", capacity=2).put_many(["c"], [[1.0, 2.0, 3.0]])
+
+    def test_float16_storage(self):
+        cache = EmbeddingCache(self.cache_dir, "model-a", capacity=4, dtype="float16")
+        cache.put_many(["a"], [[0.5, 0.25]])
+        vector = EmbeddingCache(self.cache_dir, "model-a").get_many(["a"])[0]
+        self.assertEqual(vector.dtype, np.float32)
+        np.testing.assert_array_equal(vector, [0.5, 0.25])
+
+    def test_delegates_name_to_wrapped_function(self):
+        ef = CachedEmbeddingFunction(FakeEmbeddingFunction(), EmbeddingCache(self.cache_dir, "model-a"))
+        self.assertEqual(ef.name(), "fake")
+
+
+class TestCachedEmbeddingFunctionWiring(unittest.TestCase):
+
+    @patch('app.utils.EMBEDDING_CACHE_CAPACITY', 0)
+    def test_disabled_cache_returns_function_unchanged(self):
+        inner = MagicMock()
+        self.assertIs(utils.cached_embedding_function(inner), inner)
+
+    def test_stats_none_without_cache(self):
+        with patch('app.utils.sentence_transformer_ef', MagicMock(spec=[])):
+            self.assertIsNone(utils.get_embedding_cache_stats())
+
+
+if __name__ == '__main__':
+    unittest.main()
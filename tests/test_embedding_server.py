@@ -0,0 +1,136 @@
+import hashlib
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from app import utils
+from app.embedding_server import EmbeddingServer, EmbeddingServerClient, decode_texts, encode_texts
+
+DIM = 8
+
+
+class FakeModel:
+    """Deterministic stand-in for the sentence-transformer: a vector derived from the text's hash."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, input):
+        self.calls.append(list(input))
+        if "boom" in input:
+            raise ValueError("model exploded")
+        return [np.frombuffer(hashlib.sha256(text.encode('utf-8')).digest()[:DIM], dtype=np.uint8).astype(np.float32)
+                for text in input]
+
+    @staticmethod
+    def name():
+        return "sentence_transformer"
+
+    def get_config(self):
+        return {'model_name': "fake-mini", 'device': "cpu", 'normalize_embeddings': False, 'kwargs': {}}
+
+    def default_space(self):
+        return "cosine"
+
+
+class EmbeddingServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.socket_path = os.path.join(tmpdir.name, "embed.sock")
+        self.model = FakeModel()
+        self.start_server()
+
+    def start_server(self):
+        self.server = EmbeddingServer(self.socket_path, self.model, "fake-mini")
+        thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+        thread.start()
+
+        def stop():
+            self.server.shutdown()
+            self.server.server_close()
+            thread.join()
+        self.stop_server = stop
+        self.addCleanup(lambda: stop() if os.path.exists(self.socket_path) else None)
+
+
+class TestEmbeddingServer(EmbeddingServerTestCase):
+
+    def test_text_encoding_round_trip(self):
+        texts = ["", "pump", "Ölfilter für TM-4500 ✓"]
+        self.assertEqual(decode_texts(encode_texts(texts)), texts)
+
+    def test_embeds_through_the_server(self):
+        client = EmbeddingServerClient(self.socket_path, batch_size=2)
+        texts = ["What are your hours?", "", "Ölfilter ✓"]
+        vectors = client(texts)
+        for vector, expected in zip(vectors, FakeModel()(texts)):
+            np.testing.assert_array_equal(vector, expected)
+        self.assertEqual(self.model.calls, [texts[:2], texts[2:]])
+        self.assertEqual(client([]), [])
+
+    def test_reports_the_server_model_to_chroma(self):
+        client = EmbeddingServerClient(self.socket_path)
+        self.assertEqual(client.name(), "sentence_transformer")
+        self.assertEqual(client.get_config()['model_name'], "fake-mini")
+        self.assertEqual((client.model_name, client.default_space()), ("fake-mini", "cosine"))
+
+    def test_model_errors_reach_the_caller(self):
+        client = EmbeddingServerClient(self.socket_path)
+        with self.assertRaisesRegex(RuntimeError, "ValueError: model exploded"):
+            client(["boom"])
+        self.assertEqual(len(client(["fine"])), 1) # the connection is still usable
+
+    def test_concurrent_threads(self):
+        client = EmbeddingServerClient(self.socket_path)
+        results = {}
+
+        def ask(i):
+            results[i] = client([f"question {i}"])[0]
+
+        threads = [threading.Thread(target=ask, args=(i,)) for i in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i in range(16):
+            np.testing.assert_array_equal(results[i], FakeModel()([f"question {i}"])[0])
+
+    def test_reconnects_after_server_restart(self):
+        client = EmbeddingServerClient(self.socket_path)
+        client(["before"])
+        self.stop_server()
+        with self.assertRaises(OSError):
+            client(["while down"])
+        self.start_server()
+        self.assertEqual(len(client(["after"])), 1)
+
+
+class TestUtilsUseEmbeddingServer(EmbeddingServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for target, value in (('EMBEDDING_SERVER_SOCKET', self.socket_path), ('EMBEDDING_SERVER_TIMEOUT', 0.2),
+                              ('EMBEDDING_CACHE_CAPACITY', 0), ('sentence_transformer_ef', utils._NOT_LOADED)):
+            patcher = patch(f'app.utils.{target}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_embedding_function_is_a_server_client(self):
+        embedding_function = utils.get_embedding_function()
+        self.assertIsInstance(embedding_function, EmbeddingServerClient)
+        np.testing.assert_array_equal(utils.embed_query("hours?"), FakeModel()(["hours?"])[0])
+
+    @patch('builtins.print')
+    def test_no_server(self, _):
+        self.stop_server()
+        self.assertIsNone(utils.get_embedding_function())
+
+
+if __name__ == '__main__':
+    unittest.main()
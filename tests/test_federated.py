@@ -0,0 +1,107 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+from app import app as flask_app
+from app import utils
+
+
+def make_collection(hits):
+    """A collection whose query returns the given (question, company, embedding) hits."""
+    collection = MagicMock()
+    collection.query.return_value = {
+        'metadatas': [[{'question': question, 'answer': "A", 'company': company} for question, company, _ in hits]],
+        'embeddings': [[embedding for _, _, embedding in hits]],
+    }
+    return collection
+
+
+class TestQueryCompanies(unittest.TestCase):
+
+    def setUp(self):
+        self.collections = {
+            "Tallman": make_collection([("t1", "Tallman", [1.0, 0.0]), ("t2", "Tallman", [0.0, 1.0])]),
+            "MCR": make_collection([("m1", "MCR", [0.9, 0.1])]),
+            # Unnormalized stored vectors (e.g. a Chroma collection in l2 space) compare by cosine all the same.
+            "Bradley": make_collection([("b1", "Bradley", [10.0, 9.0])]),
+        }
+        for target, value in (('get_or_create_collection', self.collections.__getitem__),
+                              ('embed_query', MagicMock(return_value=[2.0, 0.0]))):
+            patcher = patch(f'app.utils.{target}', value)
+            self.mocks = patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_merges_by_cosine_distance_with_one_embedding(self):
+        hits = utils.query_companies(["Tallman", "MCR", "Bradley"], "hose?", n_results=3)
+
+        self.assertEqual([hit['question'] for hit in hits], ["t1", "m1", "b1"])
+        self.assertEqual(hits[0]['distance'], 0.0)
+        utils.embed_query.assert_called_once_with("hose?")
+        for collection in self.collections.values():
+            self.assertEqual(collection.query.call_args.kwargs['query_embeddings'], [[2.0, 0.0]])
+
+    def test_failing_company_is_skipped(self):
+        self.collections["MCR"].query.side_effect = ValueError("down")
+        hits = utils.query_companies(["Tallman", "MCR"], "hose?", n_results=2)
+        self.assertEqual([hit['question'] for hit in hits], ["t1", "t2"])
+
+    def test_fan_out_is_bounded(self):
+        with patch('app.utils.COLLECTION_CACHE_SIZE', 2):
+            with self.assertRaises(ValueError):
+                utils.query_companies(["Tallman", "MCR", "Bradley"], "hose?")
+        with patch('app.utils.ASK_FEDERATED_CONCURRENCY', 1), patch('app.utils._federated_executor', None):
+            hits = utils.query_companies(["Tallman", "MCR", "Bradley"], "hose?", n_results=3)
+            self.assertEqual(utils._get_federated_executor()._max_workers, 1)
+        self.assertEqual(len(hits), 3)
+
+    def test_snippets_name_their_company(self):
+        formatted = utils.format_snippets_for_llm([{'question': "q", 'answer': "a", 'company': "MCR"},
+                                                   {'question': "r", 'answer': "b", 'company': "Tallman"}])
+        self.assertEqual(formatted, "Snippet 1: [MCR] Q: q A: a\nSnippet 2: [Tallman] Q: r A: b")
+
+
+class TestAskAllCompanies(unittest.TestCase):
+
+    def setUp(self):
+        flask_app.config['TESTING'] = True
+        flask_app.config['SECRET_KEY'] = 'test_secret_key'
+        self.client = flask_app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = "user1"
+            sess['status'] = "user"
+        self.mocks = {}
+        for name in ('query_companies', 'get_llm_answer', 'find_exact_match', 'get_or_create_collection'):
+            patcher = patch(f'app.routes.{name}')
+            self.mocks[name] = patcher.start()
+            self.addCleanup(patcher.stop)
+        self.mocks['find_exact_match'].return_value = None
+        self.mocks['query_companies'].return_value = [{'question': "m1", 'answer': "A", 'company': "MCR", 'distance': 0.1}]
+        self.mocks['get_llm_answer'].return_value = "It is an MCR product."
+
+    def ask(self, company):
+        payload = {'user_question': "Who sells hose H-77?", 'company': company, 'question_type': "Product"}
+        return self.client.post('/api/ask', json=payload)
+
+    def test_all_companies_single_llm_call(self):
+        data = self.ask("all").get_json()
+
+        self.assertEqual((data['answer'], data['company']), ("It is an MCR product.", "MCR"))
+        self.assertEqual(data['companies'], ["Tallman", "MCR", "Bradley"])
+        self.mocks['query_companies'].assert_called_once_with(["Tallman", "MCR", "Bradley"], "Who sells hose H-77?", n_results=3)
+        self.mocks['get_llm_answer'].assert_called_once()
+        self.mocks['get_or_create_collection'].assert_not_called()
+
+    def test_company_list(self):
+        data = self.ask(["MCR", "Bradley"]).get_json()
+        self.assertEqual(data['companies'], ["MCR", "Bradley"])
+        self.assertEqual(self.ask(["MCR", "Nobody"]).status_code, 400)
+
+    def test_too_many_companies_is_refused(self):
+        with patch('app.utils.COLLECTION_CACHE_SIZE', 2):
+            response = self.ask("all")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("at most 2 companies", response.get_json()['message'])
+        self.mocks['query_companies'].assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,205 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+from app import ingest, utils
+from app.utils import make_qa_id
+
+
+def fake_embedding_function(texts):
+    return [[float(len(text)), 1.0] for text in texts]
+
+
+class TestIngestSources(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_iter_source_txt(self):
+        path = self.write("kb.txt", "Q1\nA1\n\n##Update##\nQ2\nA2\n\n")
+        items = [qa for qa, _ in ingest.iter_source(path, "Tallman")]
+        self.assertEqual([(qa.question, qa.answer) for qa in items], [("Q1", "A1"), ("Q2", "A2")])
+        self.assertEqual(items[0].id, make_qa_id("Tallman", "Q1", "A1"))
+        self.assertEqual([qa.is_update for qa in items], [False, True])
+
+    def test_iter_source_ndjson(self):
+        first_line = '{"question": "Q1", "answer": "A1"}\n'
+        second_line = '{"question": "Q2", "answer": "A2"}\n'
+        path = self.write("kb.ndjson", first_line + "\n" + second_line)
+        items = list(ingest.iter_source(path, "MCR"))
+        self.assertEqual([qa.question for qa, _ in items], ["Q1", "Q2"])
+        self.assertEqual([offset for _, offset in items], [len(first_line), len(first_line) + 1 + len(second_line)])
+
+    def test_iter_source_json(self):
+        path = self.write("kb.json", json.dumps([{"question": "Q1", "answer": "A1"}]))
+        items = list(ingest.iter_source(path, "MCR"))
+        self.assertEqual(items[0][0].answer, "A1")
+
+    def test_iter_source_rejects_bad_record(self):
+        path = self.write("kb.ndjson", '{"question": "Q1"}\n')
+        with self.assertRaises(ValueError):
+            list(ingest.iter_source(path, "MCR"))
+
+
+class TestIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.kb_path = os.path.join(self.tmpdir.name, "Tallman_QA.txt")
+        with open(self.kb_path, 'w') as f:
+            f.write("".join(f"Q{n}\nA{n}\n\n" for n in range(10)))
+        self.checkpoint_path = os.path.join(self.tmpdir.name, "checkpoint.json")
+        self.collection = MagicMock()
+        self.collection.get.return_value = {'ids': []}
+        self.patchers = [
+            patch('app.ingest.utils.get_qa_filepath', return_value=self.kb_path),
+            patch('app.ingest.utils.get_embedding_function', return_value=fake_embedding_function),
+            patch('app.ingest.utils.get_or_create_collection', return_value=self.collection),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        utils.invalidate_qa_index("Tallman")
+
+    def tearDown(self):
+        utils.invalidate_qa_index("Tallman")
+        for patcher in self.patchers:
+            patcher.stop()
+        self.tmpdir.cleanup()
+
+    def upserted_ids(self):
+        return [id_ for c in self.collection.upsert.call_args_list for id_ in c.kwargs['ids']]
+
+    def test_ingest_upserts_in_bounded_chunks(self):
+        stats = ingest.ingest("Tallman", batch_size=3, upsert_size=4, checkpoint_path=self.checkpoint_path, progress=lambda msg: None)
+
+        self.assertEqual(stats['embedded'], 10)
+        self.assertEqual(stats['records_done'], 10)
+        self.assertIn('pairs_per_second', stats)
+        for c in self.collection.upsert.call_args_list:
+            self.assertLessEqual(len(c.kwargs['ids']), 4)
+            self.assertEqual(len(c.kwargs['embeddings']), len(c.kwargs['ids']))
+        self.assertEqual(len(self.upserted_ids()), 10)
+        self.assertFalse(os.path.exists(self.checkpoint_path))
+
+    def test_ingest_resumes_from_checkpoint(self):
+        calls = {'count': 0}
+        def flaky_embedding_function(texts):
+            calls['count'] += 1
+            if calls['count'] == 3:
+                raise RuntimeError("interrupted")
+            return fake_embedding_function(texts)
+
+        with patch('app.ingest.utils.get_embedding_function', return_value=flaky_embedding_function):
+            with self.assertRaises(RuntimeError):
+                ingest.ingest("Tallman", batch_size=2, upsert_size=2, checkpoint_path=self.checkpoint_path, progress=lambda msg: None)
+
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+        # Only the first batch was committed; the second was still in flight
+        self.assertEqual(checkpoint['records_done'], 2)
+        self.assertEqual(checkpoint['offset'], len("Q0\nA0\n\nQ1\nA1\n"))
+        self.collection.upsert.reset_mock()
+
+        stats = ingest.ingest("Tallman", batch_size=2, upsert_size=2, checkpoint_path=self.checkpoint_path, progress=lambda msg: None)
+
+        self.assertEqual(stats['resumed_from'], 2)
+        self.assertEqual(stats['embedded'], 8)
+        self.assertEqual(self.upserted_ids(), [make_qa_id("Tallman", f"Q{n}", f"A{n}") for n in range(2, 10)])
+
+    def test_ingest_refuses_stale_checkpoint(self):
+        with open(self.checkpoint_path, 'w') as f:
+            json.dump({'source': os.path.abspath(self.kb_path), 'company': "Tallman", 'records_done': 2, 'offset': 5}, f)
+        with self.assertRaises(ValueError):
+            ingest.ingest("Tallman", checkpoint_path=self.checkpoint_path, progress=lambda msg: None)
+
+    def test_ingest_skip_existing(self):
+        self.collection.get.return_value = {'ids': [make_qa_id("Tallman", "Q0", "A0")]}
+        stats = ingest.ingest("Tallman", skip_existing=True, checkpoint_path=self.checkpoint_path, progress=lambda msg: None)
+        self.assertEqual(stats['embedded'], 9)
+        self.assertEqual(stats['skipped_existing'], 1)
+
+    def test_ingest_other_source_appends_to_kb_file(self):
+        source = os.path.join(self.tmpdir.name, "extra.ndjson")
+        with open(source, 'w') as f:
+            f.write('{"question": "New Q", "answer": "New A"}\n')
+
+        ingest.ingest("Tallman", source=source, checkpoint_path=self.checkpoint_path, progress=lambda msg: None)
+
+        with open(self.kb_path) as f:
+            self.assertTrue(f.read().endswith("New Q\nNew A\n\n"))
+
+    def test_resume_after_crash_between_append_and_checkpoint_does_not_append_again(self):
+        source = os.path.join(self.tmpdir.name, "extra.ndjson")
+        with open(source, 'w') as f:
+            f.write("".join(f'{{"question": "New Q{n}", "answer": "New A{n}"}}\n' for n in range(4)))
+        self.collection.upsert.side_effect = RuntimeError("crashed after the append")
+        with self.assertRaises(RuntimeError):
+            ingest.ingest("Tallman", source=source, batch_size=2, upsert_size=2, checkpoint_path=self.checkpoint_path,
+                          progress=lambda msg: None)
+        with open(self.checkpoint_path) as f:
+            self.assertEqual(json.load(f)['appending_until'], 2)
+        self.collection.upsert.side_effect = None
+        self.collection.upsert.reset_mock()
+
+        stats = ingest.ingest("Tallman", source=source, batch_size=2, upsert_size=2, checkpoint_path=self.checkpoint_path,
+                              progress=lambda msg: None)
+
+        with open(self.kb_path) as f:
+            content = f.read()
+        self.assertEqual([content.count(f"New Q{n}\nNew A{n}\n") for n in range(4)], [1, 1, 1, 1])
+        self.assertEqual(stats['recovered'], 2)
+        self.assertEqual(self.upserted_ids(), [make_qa_id("Tallman", f"New Q{n}", f"New A{n}") for n in range(4)])
+
+    def deleted_ids(self):
+        return [id_ for c in self.collection.delete.call_args_list for id_ in c.kwargs['ids']]
+
+    def test_ingest_kb_file_embeds_only_live_pairs(self):
+        with open(self.kb_path, 'w') as f:
+            f.write("What is X?\nOld X\n\nQ1\nA1\n\n##Update##\nWhat is X?\nNew X\n\n")
+
+        stats = ingest.ingest("Tallman", checkpoint_path=self.checkpoint_path, progress=lambda msg: None)
+
+        old_id = make_qa_id("Tallman", "What is X?", "Old X")
+        self.assertEqual(self.upserted_ids(), [make_qa_id("Tallman", "Q1", "A1"), make_qa_id("Tallman", "What is X?", "New X")])
+        self.assertEqual(self.deleted_ids(), [old_id])
+        self.assertEqual((stats['embedded'], stats['superseded']), (2, 1))
+
+    def test_ingest_other_source_keeps_update_markers(self):
+        first = os.path.join(self.tmpdir.name, "first.txt")
+        with open(first, 'w') as f:
+            f.write("What is X?\nOld X\n\n")
+        second = os.path.join(self.tmpdir.name, "second.txt")
+        with open(second, 'w') as f:
+            f.write("##Update##\nWhat is X?\nNew X\n\n")
+
+        ingest.ingest("Tallman", source=first, checkpoint_path=self.checkpoint_path, progress=lambda msg: None)
+        ingest.ingest("Tallman", source=second, checkpoint_path=self.checkpoint_path, progress=lambda msg: None)
+
+        with open(self.kb_path) as f:
+            self.assertTrue(f.read().endswith("What is X?\nOld X\n\n##Update##\nWhat is X?\nNew X\n\n"))
+        live = [qa.answer for qa in utils.load_qa_data("Tallman") if qa.question == "What is X?"]
+        self.assertEqual(live, ["New X"])
+        self.assertEqual(self.deleted_ids(), [make_qa_id("Tallman", "What is X?", "Old X")])
+        self.assertEqual(self.upserted_ids()[-1], make_qa_id("Tallman", "What is X?", "New X"))
+
+    def test_ingest_other_source_skip_existing_checks_the_kb(self):
+        source = os.path.join(self.tmpdir.name, "extra.txt")
+        with open(source, 'w') as f:
+            f.write("Q0\nA0\n\nNew Q\nNew A\n\n")
+        stats = ingest.ingest("Tallman", source=source, skip_existing=True, checkpoint_path=self.checkpoint_path,
+                              progress=lambda msg: None)
+        self.assertEqual((stats['embedded'], stats['skipped_existing']), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
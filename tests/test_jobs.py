@@ -0,0 +1,164 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+from app import create_app, jobs, utils
+from app.models import QA
+
+
+class TestJobManager(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = jobs.JobManager(max_workers=1)
+
+    def test_job_reports_progress_and_result(self):
+        def task(job):
+            for _ in range(3):
+                job.advance()
+            job.add_error("item 2: bad")
+            return {'done': True}
+
+        job = self.manager.submit('test', task, total=3, company="Tallman")
+        self.assertTrue(job.wait(5))
+
+        snapshot = self.manager.get(job.id).snapshot()
+        self.assertEqual(snapshot['status'], 'succeeded')
+        self.assertEqual((snapshot['processed'], snapshot['total'], snapshot['progress']), (3, 3, 1.0))
+        self.assertEqual(snapshot['errors'], ["item 2: bad"])
+        self.assertEqual(snapshot['result'], {'done': True})
+        self.assertEqual(snapshot['company'], "Tallman")
+
+    def test_failure_is_recorded(self):
+        def task(job):
+            raise RuntimeError("disk full")
+
+        job = self.manager.submit('test', task)
+        job.wait(5)
+        self.assertEqual(job.snapshot()['status'], 'failed')
+        self.assertEqual(job.snapshot()['error'], "disk full")
+
+    def test_cancel_stops_at_next_checkpoint(self):
+        started, release = threading.Event(), threading.Event()
+
+        def task(job):
+            started.set()
+            release.wait(5)
+            job.check_cancelled()
+            job.advance()
+
+        job = self.manager.submit('test', task, total=1)
+        started.wait(5)
+        self.assertTrue(job.cancel())
+        release.set()
+        job.wait(5)
+
+        self.assertEqual(job.snapshot()['status'], 'cancelled')
+        self.assertEqual(job.processed, 0)
+        self.assertFalse(job.cancel()) # already finished
+
+
+class TestUploadJobRoutes(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app({'TESTING': True, 'SECRET_KEY': 'test'})
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = 'admin1'
+            sess['status'] = 'admin'
+        patcher = patch('app.routes.append_qa_pairs', side_effect=lambda company, pairs, **kwargs: [
+            QA(question=question, answer=answer, company=company) for question, answer in pairs
+        ])
+        self.mock_append = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, items):
+        return self.client.post(
+            '/admin/upload_qa/Tallman',
+            data={'file': (io.BytesIO(json.dumps(items).encode('utf-8')), 'qa.json')},
+            content_type='multipart/form-data'
+        )
+
+    def test_upload_returns_job_and_runs_in_chunks(self):
+        items = [{"question": f"Q{i}", "answer": f"A{i}"} for i in range(5)] + [{"question": "", "answer": "x"}]
+        with patch('app.routes.UPLOAD_JOB_CHUNK_SIZE', 2):
+            response = self.upload(items)
+            self.assertEqual(response.status_code, 202)
+            body = response.get_json()
+            self.assertEqual((body['queued_count'], body['error_count']), (5, 1))
+            jobs.manager.get(body['job_id']).wait(5)
+
+        status = self.client.get(body['status_url'])
+        self.assertEqual(status.status_code, 200)
+        snapshot = status.get_json()
+        self.assertEqual(snapshot['status'], 'succeeded')
+        self.assertEqual((snapshot['processed'], snapshot['total'], snapshot['error_count']), (5, 5, 1))
+        self.assertEqual(self.mock_append.call_count, 3)
+        args, _ = self.mock_append.call_args_list[0]
+        self.assertEqual(args, ("Tallman", [("Q0", "A0"), ("Q1", "A1")]))
+
+    def test_failed_chunk_counts_as_processed_and_ends_partial(self):
+        def append(company, pairs, **kwargs):
+            if pairs[0][0] == "Q2":
+                raise RuntimeError("embedding service down")
+            return [QA(question=question, answer=answer, company=company) for question, answer in pairs]
+        self.mock_append.side_effect = append
+        items = [{"question": f"Q{i}", "answer": f"A{i}"} for i in range(5)]
+        with patch('app.routes.UPLOAD_JOB_CHUNK_SIZE', 2):
+            body = self.upload(items).get_json()
+            jobs.manager.get(body['job_id']).wait(5)
+
+        snapshot = self.client.get(body['status_url']).get_json()
+        self.assertEqual(snapshot['status'], 'partial')
+        self.assertEqual((snapshot['processed'], snapshot['total'], snapshot['failed_items']), (5, 5, 2))
+        self.assertIn("Items 3-4", snapshot['errors'][0])
+
+    def test_every_chunk_failing_ends_failed(self):
+        self.mock_append.side_effect = RuntimeError("disk full")
+        body = self.upload([{"question": "Q", "answer": "A"}]).get_json()
+        jobs.manager.get(body['job_id']).wait(5)
+
+        snapshot = self.client.get(body['status_url']).get_json()
+        self.assertEqual(snapshot['status'], 'failed')
+        self.assertEqual((snapshot['processed'], snapshot['failed_items']), (1, 1))
+
+    def test_index_failure_in_append_fails_the_job(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, "Tallman_QA.txt")
+        open(path, 'w').close()
+        self.addCleanup(utils.invalidate_qa_index, "Tallman")
+        with patch('app.routes.append_qa_pairs', utils.append_qa_pairs), \
+             patch('app.utils.TALLMAN_QA_FILE', path), \
+             patch('app.utils.sentence_transformer_ef', MagicMock(side_effect=lambda texts: [[1.0] for _ in texts])), \
+             patch('app.utils.get_or_create_collection', return_value=MagicMock()), \
+             patch('app.utils.upsert_qa_items', side_effect=RuntimeError("collection unavailable")):
+            utils.invalidate_qa_index("Tallman")
+            body = self.upload([{"question": "Q", "answer": "A"}]).get_json()
+            jobs.manager.get(body['job_id']).wait(5)
+
+        snapshot = self.client.get(body['status_url']).get_json()
+        self.assertEqual(snapshot['status'], 'failed')
+        self.assertEqual((snapshot['processed'], snapshot['failed_items']), (1, 1))
+        self.assertIn("collection unavailable", snapshot['errors'][0])
+
+    def test_upload_with_no_valid_items_is_rejected_synchronously(self):
+        response = self.upload([{"question_typo": "Q"}])
+        self.assertEqual(response.status_code, 400)
+        self.mock_append.assert_not_called()
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get('/admin/jobs/nope').status_code, 404)
+        self.assertEqual(self.client.post('/admin/jobs/nope/cancel').status_code, 404)
+
+    def test_cancel_finished_job_conflicts(self):
+        response = self.upload([{"question": "Q", "answer": "A"}])
+        job_id = response.get_json()['job_id']
+        jobs.manager.get(job_id).wait(5)
+        self.assertEqual(self.client.post(f'/admin/jobs/{job_id}/cancel').status_code, 409)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import math
+import os
+import tempfile
+import unittest
+from collections import Counter
+from unittest.mock import patch, MagicMock
+
+from app import lexical, utils
+from app.lexical import BM25Index, reciprocal_rank_fusion, tokenize
+from app.models import QA
+from app.qa_index import QAIndex
+
+DOCS = {
+    'a': "Which hose fits the TM-4500/B pump?",
+    'b': "How do I return a pump?",
+    'c': "Opening hours of the Bradley store",
+    'd': "Pump pump pump maintenance schedule for every pump model",
+}
+
+
+def brute_force_bm25(docs: dict, query: str) -> dict:
+    tokens = {key: tokenize(text) for key, text in docs.items()}
+    average_length = sum(len(t) for t in tokens.values()) / len(tokens)
+    scores = {}
+    for term in set(tokenize(query)):
+        df = sum(term in t for t in tokens.values())
+        if not df:
+            continue
+        idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+        for key, t in tokens.items():
+            tf = Counter(t)[term]
+            if tf:
+                norm = lexical.K1 * (1 - lexical.B + lexical.B * len(t) / average_length)
+                scores[key] = scores.get(key, 0.0) + idf * tf * (lexical.K1 + 1) / (tf + norm)
+    return scores
+
+
+class TestBM25Index(unittest.TestCase):
+
+    def make(self, docs=DOCS):
+        index = BM25Index()
+        for key, text in docs.items():
+            index.add(key, text)
+        return index
+
+    def test_tokenize_keeps_compounds_and_parts(self):
+        self.assertEqual(tokenize("TM-4500/B fits"), ["tm4500b", "tm", "4500", "b", "fits"])
+
+    def test_scores_match_brute_force(self):
+        with patch('app.lexical.MAX_DF_RATIO', 1.0):
+            results = self.make().search("pump hose tm4500b", limit=4)
+        expected = brute_force_bm25(DOCS, "pump hose tm4500b")
+        self.assertEqual([key for key, _ in results], sorted(expected, key=lambda key: -expected[key]))
+        for key, score in results:
+            self.assertAlmostEqual(score, expected[key], places=4)
+
+    def test_part_number_spellings_match(self):
+        index = self.make()
+        self.assertEqual(index.search("tm4500b", limit=1)[0][0], 'a')
+        self.assertEqual(index.search("TM 4500 B", limit=1)[0][0], 'a')
+
+    def test_common_terms_are_skipped_when_rarer_ones_exist(self):
+        results = self.make().search("pump hours", limit=4)
+        self.assertEqual([key for key, _ in results], ['c'])
+
+    def test_remove_and_compact(self):
+        index = self.make()
+        index.remove('a', DOCS['a'])
+        self.assertEqual(index.search("hose", limit=3), [])
+        self.assertEqual(len(index), 3)
+
+        with patch('app.lexical.COMPACT_MIN_DEAD', 1):
+            index.remove('b', DOCS['b'])
+            index.remove('c', DOCS['c'])
+        self.assertEqual(len(index._keys), 1)
+        self.assertEqual([key for key, _ in index.search("pump", limit=3)], ['d'])
+        index.add('e', "Return a pump")
+        self.assertEqual([key for key, _ in index.search("return", limit=3)], ['e'])
+
+    def test_empty_and_unknown_queries(self):
+        self.assertEqual(BM25Index().search("pump"), [])
+        self.assertEqual(self.make().search("zebra"), [])
+
+
+class TestFusion(unittest.TestCase):
+
+    def test_reciprocal_rank_fusion(self):
+        fused = reciprocal_rank_fusion([['x', 'y', 'z'], ['z', 'w']], k=1)
+        # z: 1/4 + 1/2, x: 1/2, y: 1/3, w: 1/3
+        self.assertEqual(fused, ['z', 'x', 'y', 'w'])
+
+    def test_qa_index_tracks_supersedes(self):
+        index = QAIndex("Tallman")
+        old = QA("What fits TM-4500?", "Hose H1.", "Tallman", id="1")
+        index.add(old)
+        index.add(QA("what fits tm-4500", "Hose H2.", "Tallman", id="2"), is_update=True)
+        self.assertEqual([qa.id for qa in index.keyword_search("H1")], [])
+        self.assertEqual([qa.id for qa in index.keyword_search("tm4500")], ["2"])
+
+    def test_query_collection_fuses_keyword_hits(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, "Tallman_QA.txt")
+        with open(path, 'w') as f:
+            f.write("What are your opening hours?\n9 to 5.\n\nWhich hose fits the TM-4500 pump?\nHose H-77.\n\n")
+        collection = MagicMock()
+        collection.query.return_value = {'metadatas': [[{'id': 'v1', 'question': "Pump manuals", 'answer': "Online."}]]}
+
+        with patch('app.utils.TALLMAN_QA_FILE', path):
+            utils.invalidate_qa_index("Tallman")
+            hybrid = utils.query_collection(collection, "hose for TM4500", n_results=2, company="Tallman")
+            with patch('app.utils.HYBRID_SEARCH', 'off'):
+                vector_only = utils.query_collection(collection, "hose for TM4500", n_results=2, company="Tallman")
+        utils.invalidate_qa_index("Tallman")
+
+        self.assertEqual([hit['question'] for hit in hybrid], ["Pump manuals", "Which hose fits the TM-4500 pump?"])
+        self.assertEqual(collection.query.call_args_list[0].kwargs['n_results'], utils.HYBRID_CANDIDATES)
+        self.assertEqual([hit['question'] for hit in vector_only], ["Pump manuals"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,224 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+from app import metrics
+from app.llm_client import LLMClient, LLMError
+from app.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.rate_limiter import LLMRateLimiter
+
+
+def completion(content):
+    return {'choices': [{'message': {'role': "assistant", 'content': content}}]}
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible /chat/completions that plays back the server's scripted replies, one per request."""
+    protocol_version = "HTTP/1.1" # keep-alive, so connection reuse can be observed
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append((self.path, self.headers.get('Authorization'), body))
+        reply = self.server.replies.pop(0) if self.server.replies else {}
+        time.sleep(reply.get('delay', 0))
+        if 'stream' in reply:
+            self.send_response(200)
+            self.send_header('Content-Type', "text/event-stream")
+            self.send_header('Transfer-Encoding', "chunked")
+            self.end_headers()
+            for piece in reply['stream'] + ["[DONE]"]:
+                data = piece if piece == "[DONE]" else json.dumps({'choices': [{'delta': {'content': piece}}]})
+                event = f"data: {data}\n\n".encode()
+                self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        payload = json.dumps(reply.get('json', completion("ok"))).encode()
+        self.send_response(reply.get('status', 200))
+        for name, value in reply.get('headers', {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', "application/json")
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestLLMClient(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAIHandler)
+        self.server.daemon_threads = True
+        self.server.replies, self.server.requests, self.server.connections = [], [], 0
+        thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def make_client(self, **options):
+        options = {'backoff_base': 0.01, 'backoff_max': 0.05, **options}
+        client = LLMClient("sk-test", base_url=f"http://127.0.0.1:{self.server.server_address[1]}/v1", model="fake-model", **options)
+        self.addCleanup(client.close)
+        return client
+
+    def test_chat_uses_model_key_and_pooled_connection(self):
+        client = self.make_client()
+        self.server.replies = [{'json': completion("first")}, {'json': completion("second")}]
+        self.assertEqual(client.chat([{'role': "user", 'content': "hi"}]), "first")
+        self.assertEqual(client.chat([{'role': "user", 'content': "again"}], temperature=0), "second")
+
+        path, authorization, body = self.server.requests[1]
+        self.assertEqual((path, authorization), ("/v1/chat/completions", "Bearer sk-test"))
+        self.assertEqual((body['model'], body['temperature']), ("fake-model", 0))
+        self.assertEqual(self.server.connections, 1)
+
+    def test_retries_429_and_5xx_with_backoff(self):
+        client = self.make_client()
+        self.server.replies = [{'status': 429, 'headers': {'Retry-After': "0.02"}, 'json': {}}, {'status': 503, 'json': {}},
+                               {'json': completion("finally")}]
+        self.assertEqual(client.chat([]), "finally")
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(metrics.get("llm.retries"), 2)
+
+    def test_gives_up_after_max_retries(self):
+        client = self.make_client(max_retries=1)
+        self.server.replies = [{'status': 500, 'json': {}}] * 3
+        with self.assertRaises(LLMError) as raised:
+            client.chat([])
+        self.assertEqual(raised.exception.status, 500)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(metrics.get("llm.failures"), 1)
+
+    def test_client_errors_are_not_retried(self):
+        client = self.make_client()
+        self.server.replies = [{'status': 400, 'json': {'error': "bad request"}}]
+        with self.assertRaisesRegex(LLMError, "HTTP 400"):
+            client.chat([])
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_read_timeout_bounds_a_slow_upstream(self):
+        client = self.make_client(read_timeout=0.1, max_retries=1)
+        self.server.replies = [{'delay': 0.5}, {'json': completion("fast")}]
+        started = time.monotonic()
+        self.assertEqual(client.chat([]), "fast")
+        self.assertLess(time.monotonic() - started, 0.45)
+
+    def test_total_deadline_stops_retries(self):
+        client = self.make_client(read_timeout=0.1, total_timeout=0.25, max_retries=10)
+        self.server.replies = [{'delay': 0.3}] * 10
+        started = time.monotonic()
+        with self.assertRaises(LLMError):
+            client.chat([])
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_rate_limiter_learns_from_429_and_usage(self):
+        limiter = LLMRateLimiter(requests_per_minute=600, tokens_per_minute=100000, max_concurrency=2)
+        client = self.make_client(limiter=limiter)
+        reply = {'json': {**completion("ok"), 'usage': {'total_tokens': 20}}}
+        self.server.replies = [{'status': 429, 'headers': {'Retry-After': "0.02"}, 'json': {}}, reply]
+        self.assertEqual(client.chat([{'role': "user", 'content': "hi"}], max_tokens=50), "ok")
+        self.assertEqual(metrics.get("llm.rate_limited"), 1)
+        stats = limiter.stats()
+        self.assertEqual((stats['in_flight'], stats['rate_scale']), (0, 0.55))
+        self.assertGreater(stats['tokens_available'], 100000 - 50)
+
+    def test_rate_limit_queue_timeout_is_an_llm_error(self):
+        limiter = LLMRateLimiter(requests_per_minute=1, queue_timeout=0.05)
+        client = self.make_client(limiter=limiter)
+        self.assertEqual(client.chat([]), "ok")
+        with self.assertRaises(LLMError) as raised:
+            client.chat([])
+        self.assertEqual(raised.exception.status, 429)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_circuit_breaker_fails_fast_once_open(self):
+        client = self.make_client(max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+        self.server.replies = [{'status': 503, 'json': {}}, {'status': 503, 'json': {}}]
+        for _ in range(2):
+            with self.assertRaises(LLMError):
+                client.chat([])
+        with self.assertRaises(CircuitOpenError):
+            client.chat([])
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_client_errors_do_not_open_the_circuit(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        client = self.make_client(breaker=breaker)
+        self.server.replies = [{'status': 400, 'json': {}}]
+        with self.assertRaises(LLMError):
+            client.chat([])
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_queue_wait_does_not_count_as_a_slow_call(self):
+        breaker = CircuitBreaker(failure_threshold=1, slow_call_seconds=0.5)
+        client = self.make_client(limiter=LLMRateLimiter(max_concurrency=1), breaker=breaker)
+        self.server.replies = [{'delay': 0.3, 'json': completion("ok")} for _ in range(4)]
+        threads = [threading.Thread(target=client.chat, args=([],)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(self.server.requests), 4) # the last one queued for about 0.9 s
+        self.assertEqual(breaker.state, 'closed')
+
+    def half_open_breaker(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        breaker.record_failure()
+        breaker._opened_at -= 60 # the reset timeout has passed: the next call is the probe
+        return breaker
+
+    def test_unexpected_error_of_the_probe_reopens_the_circuit(self):
+        breaker = self.half_open_breaker()
+        client = self.make_client(breaker=breaker)
+
+        def undecodable(deadline):
+            raise httpx.DecodingError("bad gzip")
+        with self.assertRaises(httpx.DecodingError):
+            client._with_retries(undecodable)
+
+        self.assertEqual(breaker.state, 'open')
+
+    def test_probe_that_times_out_in_the_queue_is_handed_back(self):
+        breaker = self.half_open_breaker()
+        limiter = LLMRateLimiter(max_concurrency=1, queue_timeout=0.05)
+        limiter.acquire() # every slot is taken
+        client = self.make_client(breaker=breaker, limiter=limiter)
+
+        with self.assertRaises(LLMError):
+            client.chat([])
+
+        self.assertEqual(breaker.state, 'half_open')
+        breaker.before_call() # a new probe is allowed at once
+
+    def test_stream_chat(self):
+        client = self.make_client()
+        self.server.replies = [{'status': 502, 'json': {}}, {'stream': ["We ", "open ", "at 9."]}]
+        self.assertEqual(list(client.stream_chat([{'role': "user", 'content': "hours?"}])), ["We ", "open ", "at 9."])
+        self.assertTrue(self.server.requests[-1][2]['stream'])
+
+    def test_stream_holds_its_slot_until_done(self):
+        limiter = LLMRateLimiter(max_concurrency=1)
+        client = self.make_client(limiter=limiter)
+        self.server.replies = [{'stream': ["a", "b"]}]
+        stream = client.stream_chat([])
+        self.assertEqual(next(stream), "a")
+        self.assertEqual(limiter.stats()['in_flight'], 1)
+        self.assertEqual(list(stream), ["b"])
+        self.assertEqual(limiter.stats()['in_flight'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
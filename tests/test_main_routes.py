@@ -7,7 +7,7 @@ from app.models import User, QA
 # Utility to log in a user
 def login_user(client, email, password):
     with flask_app.app_context():
-        return client.post(url_for('login'), data={'email': email, 'password': password})
+        return client.post(url_for('main.login'), data={'email': email, 'password': password})
 
 class MainRoutesTests(unittest.TestCase):
 
@@ -41,6 +41,12 @@ class MainRoutesTests(unittest.TestCase):
         self.query_collection_patch = patch('app.routes.query_collection')
         self.mock_query_collection = self.query_collection_patch.start()
 
+        self.find_exact_match_patch = patch('app.routes.find_exact_match', return_value=None)
+        self.mock_find_exact_match = self.find_exact_match_patch.start()
+
+        self.embed_query_patch = patch('app.routes.embed_query', return_value=None)
+        self.mock_embed_query = self.embed_query_patch.start()
+
         self.get_llm_answer_patch = patch('app.routes.get_llm_answer')
         self.mock_get_llm_answer = self.get_llm_answer_patch.start()
 
@@ -59,6 +65,8 @@ class MainRoutesTests(unittest.TestCase):
         self.app_load_users_patch.stop()
         self.get_or_create_collection_patch.stop()
         self.query_collection_patch.stop()
+        self.find_exact_match_patch.stop()
+        self.embed_query_patch.stop()
         self.get_llm_answer_patch.stop()
         self.format_snippets_for_llm_patch.stop()
         self.get_corrected_llm_answer_patch.stop()
@@ -69,7 +77,7 @@ class MainRoutesTests(unittest.TestCase):
     def test_ask_ai_get_page_authenticated(self):
         login_user(self.client, 'test@example.com', 'password123')
         with self.app.app_context():
-            response = self.client.get(url_for('ask_ai_get'))
+            response = self.client.get(url_for('main.ask_ai_get'))
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'Ask AI', response.data) # Check for a title or specific text
 
@@ -86,7 +94,7 @@ class MainRoutesTests(unittest.TestCase):
             'question_type': 'Product'
         }
         with self.app.app_context():
-            response = self.client.post(url_for('ask_ai_post'), json=payload)
+            response = self.client.post(url_for('main.ask_ai_post'), json=payload)
 
         self.assertEqual(response.status_code, 200)
         json_data = response.get_json()
@@ -95,14 +103,14 @@ class MainRoutesTests(unittest.TestCase):
         self.assertEqual(json_data['retrieved_snippets_formatted'], 'Formatted Snippets')
 
         self.mock_get_or_create_collection.assert_called_once_with('Tallman')
-        self.mock_query_collection.assert_called_once_with(self.mock_collection_instance, 'Test question?', n_results=3)
+        self.mock_query_collection.assert_called_once_with(self.mock_collection_instance, 'Test question?', n_results=3, company='Tallman')
         self.mock_get_llm_answer.assert_called_once_with('Test question?', 'Tallman', 'Product', [{'id': 'doc1', 'question': 'Q1', 'answer': 'A1'}])
 
     def test_ask_ai_post_api_missing_fields(self):
         login_user(self.client, 'test@example.com', 'password123')
         payload = {'user_question': 'Test question?'} # Missing company and type
         with self.app.app_context():
-            response = self.client.post(url_for('ask_ai_post'), json=payload)
+            response = self.client.post(url_for('main.ask_ai_post'), json=payload)
         self.assertEqual(response.status_code, 400)
         json_data = response.get_json()
         self.assertEqual(json_data['status'], 'error')
@@ -112,14 +120,14 @@ class MainRoutesTests(unittest.TestCase):
         login_user(self.client, 'test@example.com', 'password123')
         payload = {'user_question': 'Q', 'company': 'InvalidCo', 'question_type': 'Product'}
         with self.app.app_context():
-            response = self.client.post(url_for('ask_ai_post'), json=payload)
+            response = self.client.post(url_for('main.ask_ai_post'), json=payload)
         self.assertEqual(response.status_code, 400)
         json_data = response.get_json()
         self.assertIn('Invalid company', json_data['message'])
 
         payload = {'user_question': 'Q', 'company': 'Tallman', 'question_type': 'InvalidType'}
         with self.app.app_context():
-            response = self.client.post(url_for('ask_ai_post'), json=payload)
+            response = self.client.post(url_for('main.ask_ai_post'), json=payload)
         self.assertEqual(response.status_code, 400)
         json_data = response.get_json()
         self.assertIn('Invalid question type', json_data['message'])
@@ -132,7 +140,7 @@ class MainRoutesTests(unittest.TestCase):
 
         payload = {'user_question': 'Q', 'company': 'Tallman', 'question_type': 'Product'}
         with self.app.app_context():
-            response = self.client.post(url_for('ask_ai_post'), json=payload)
+            response = self.client.post(url_for('main.ask_ai_post'), json=payload)
 
         self.assertEqual(response.status_code, 500)
         json_data = response.get_json()
@@ -142,7 +150,7 @@ class MainRoutesTests(unittest.TestCase):
     def test_correct_answer_page_get_admin(self):
         login_user(self.client, 'admin@example.com', 'adminpass') # Login as admin
         with self.app.app_context():
-            response = self.client.get(url_for('correct_answer_page_get',
+            response = self.client.get(url_for('main.correct_answer_page_get',
                                                original_question="OQ", incorrect_answer="IA", company="Tallman"))
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'Correct Answer', response.data)
@@ -163,7 +171,7 @@ class MainRoutesTests(unittest.TestCase):
             'company': 'Tallman'
         }
         with self.app.app_context():
-            response = self.client.post(url_for('correct_answer_post'), json=payload)
+            response = self.client.post(url_for('main.correct_answer_post'), json=payload)
 
         self.assertEqual(response.status_code, 200)
         json_data = response.get_json()
@@ -178,7 +186,7 @@ class MainRoutesTests(unittest.TestCase):
         login_user(self.client, 'admin@example.com', 'adminpass')
         payload = {'original_question': 'OQ'} # Missing other fields
         with self.app.app_context():
-            response = self.client.post(url_for('correct_answer_post'), json=payload)
+            response = self.client.post(url_for('main.correct_answer_post'), json=payload)
         self.assertEqual(response.status_code, 400)
         json_data = response.get_json()
         self.assertEqual(json_data['status'], 'error')
@@ -189,7 +197,7 @@ class MainRoutesTests(unittest.TestCase):
         self.mock_get_corrected_llm_answer.return_value = "Error generating corrected answer from LLM"
         payload = {'original_question': 'OQ', 'incorrect_answer': 'IA', 'user_correction_text': 'UC', 'company': 'Tallman'}
         with self.app.app_context():
-            response = self.client.post(url_for('correct_answer_post'), json=payload)
+            response = self.client.post(url_for('main.correct_answer_post'), json=payload)
         self.assertEqual(response.status_code, 500)
         json_data = response.get_json()
         self.assertEqual(json_data['status'], 'error')
@@ -199,7 +207,7 @@ class MainRoutesTests(unittest.TestCase):
         login_user(self.client, 'test@example.com', 'password123') # Login as non-admin
         payload = {'original_question': 'OQ', 'incorrect_answer': 'IA', 'user_correction_text': 'UC', 'company': 'Tallman'}
         with self.app.app_context():
-            response = self.client.post(url_for('correct_answer_post'), json=payload, headers={'X-Requested-With': 'XMLHttpRequest'})
+            response = self.client.post(url_for('main.correct_answer_post'), json=payload, headers={'X-Requested-With': 'XMLHttpRequest'})
         self.assertEqual(response.status_code, 403) # Forbidden
         json_data = response.get_json()
         self.assertEqual(json_data['message'], 'Admin access required')
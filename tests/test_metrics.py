@@ -0,0 +1,123 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from app import app as flask_app
+from app import metrics, utils
+
+
+class TestCounters(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_report_derives_hit_ratios(self):
+        metrics.increment("exact_match.hits", 3)
+        metrics.increment("exact_match.misses")
+        metrics.increment("other")
+        report = metrics.report()
+        self.assertEqual(report['counters'], {'exact_match.hits': 3, 'exact_match.misses': 1, 'other': 1})
+        self.assertEqual(report['ratios'], {'exact_match.hit_ratio': 0.75})
+
+
+class TestExactMatch(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, "Tallman_QA.txt")
+        with open(path, 'w') as f:
+            f.write("What are your opening hours?\n9 to 5.\n\n")
+        patcher = patch('app.utils.TALLMAN_QA_FILE', path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(utils.invalidate_qa_index, "Tallman")
+        utils.invalidate_qa_index("Tallman")
+
+    def test_normalized_lookup_and_counters(self):
+        self.assertEqual(utils.find_exact_match("Tallman", "  what are your OPENING hours ").answer, "9 to 5.")
+        self.assertIsNone(utils.find_exact_match("Tallman", "When do you open?"))
+        self.assertEqual(metrics.get("exact_match.hits"), 1)
+        self.assertEqual(metrics.get("exact_match.misses"), 1)
+
+    @patch('app.utils.get_embedding_function', return_value=None)
+    def test_corrections_replace_the_stored_answer(self, _):
+        utils.append_qa_pair("Tallman", "What are your opening hours?", "8 to 6.", is_update=True)
+        self.assertEqual(utils.find_exact_match("Tallman", "what are your opening hours").answer, "8 to 6.")
+
+
+class TestAskFastPath(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        flask_app.config['TESTING'] = True
+        flask_app.config['SECRET_KEY'] = 'test_secret_key'
+        self.client = flask_app.test_client()
+        app_context = flask_app.app_context()
+        app_context.push()
+        self.addCleanup(app_context.pop)
+
+        self.mocks = {}
+        for name in ('get_or_create_collection', 'query_collection', 'get_llm_answer', 'embed_query'):
+            patcher = patch(f'app.routes.{name}')
+            self.mocks[name] = patcher.start()
+            self.addCleanup(patcher.stop)
+        self.mocks['embed_query'].return_value = None
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = "user1"
+            sess['status'] = "user"
+
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, "Tallman_QA.txt")
+        with open(path, 'w') as f:
+            f.write("What are your opening hours?\n9 to 5.\n\n")
+        patcher = patch('app.utils.TALLMAN_QA_FILE', path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(utils.invalidate_qa_index, "Tallman")
+        utils.invalidate_qa_index("Tallman")
+
+    def ask(self, question, **extra):
+        payload = {'user_question': question, 'company': 'Tallman', 'question_type': 'General Help', **extra}
+        return self.client.post('/api/ask', json=payload)
+
+    def test_known_question_skips_retrieval_and_llm(self):
+        response = self.ask("What are your opening hours")
+        data = response.get_json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((data['answer'], data['source']), ("9 to 5.", 'exact_match'))
+        self.mocks['get_or_create_collection'].assert_not_called()
+        self.mocks['get_llm_answer'].assert_not_called()
+
+    def test_rephrase_uses_llm_with_stored_pair_only(self):
+        self.mocks['get_llm_answer'].return_value = "We are open from 9 to 5."
+        data = self.ask("What are your opening hours?", rephrase=True).get_json()
+        self.assertEqual((data['answer'], data['source']), ("We are open from 9 to 5.", 'exact_match'))
+        self.mocks['query_collection'].assert_not_called()
+        self.assertEqual(self.mocks['get_llm_answer'].call_args.args[3][0]['answer'], "9 to 5.")
+
+    def test_unknown_question_goes_through_retrieval(self):
+        self.mocks['query_collection'].return_value = []
+        self.mocks['get_llm_answer'].return_value = "Generated."
+        data = self.ask("Do you ship abroad?").get_json()
+        self.assertEqual(data['source'], 'retrieval')
+        self.mocks['query_collection'].assert_called_once()
+
+    def test_metrics_endpoint_reports_hit_ratio(self):
+        self.ask("What are your opening hours?")
+        self.mocks['query_collection'].return_value = []
+        self.mocks['get_llm_answer'].return_value = "Generated."
+        self.ask("Do you ship abroad?")
+        report = self.client.get('/metrics').get_json()
+        self.assertEqual(report['ratios']['exact_match.hit_ratio'], 0.5)
+        self.assertIn('embedding_cache', report)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+from app import compact, utils
+from app.models import QA
+from app.qa_index import QAIndex, normalize_question
+
+
+class TestQAIndex(unittest.TestCase):
+
+    def test_update_supersedes_same_normalized_question(self):
+        index = QAIndex("Tallman")
+        old = QA(id="old", question="What is X?", answer="Old", company="Tallman")
+        other = QA(id="other", question="What is Y?", answer="Y", company="Tallman")
+        new = QA(id="new", question="what is x", answer="New", company="Tallman")
+
+        index.add(old)
+        index.add(other)
+        superseded = index.add(new, is_update=True)
+
+        self.assertEqual(superseded, [old])
+        self.assertEqual(index.live_items(), [other, new])
+        self.assertEqual(index.lookup("WHAT IS X?"), [new])
+        self.assertEqual(index.superseded_count, 1)
+
+    def test_plain_additions_are_kept(self):
+        index = QAIndex("Tallman")
+        index.add(QA(id="a", question="Q", answer="A1", company="Tallman"))
+        superseded = index.add(QA(id="b", question="Q", answer="A2", company="Tallman"))
+        self.assertEqual(superseded, [])
+        self.assertEqual(len(index.lookup("Q")), 2)
+
+    def test_normalize_question(self):
+        self.assertEqual(normalize_question("  Where's the  HQ?! "), "where s the hq")
+
+
+class TestSupersedeInKnowledgeBase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "Tallman_QA.txt")
+        with open(self.path, 'w') as f:
+            f.write("What is X?\nOld answer\n\nWhat is Y?\nY answer\n\n")
+        self.path_patch = patch('app.utils.TALLMAN_QA_FILE', self.path)
+        self.path_patch.start()
+        utils.invalidate_qa_index("Tallman")
+
+    def tearDown(self):
+        self.path_patch.stop()
+        utils.invalidate_qa_index("Tallman")
+        self.tmpdir.cleanup()
+
+    def test_index_cache_is_bounded(self):
+        self.addCleanup(utils.invalidate_qa_index, "MCR")
+        with patch('app.utils.QA_INDEX_CACHE_SIZE', 1), patch('app.utils.MCR_QA_FILE', self.path):
+            first = utils.get_qa_index("Tallman")
+            self.assertIs(utils.get_qa_index("Tallman"), first)
+            utils.get_qa_index("MCR") # evicts Tallman
+            self.assertIsNot(utils.get_qa_index("Tallman"), first)
+
+    def test_load_qa_data_applies_updates(self):
+        with open(self.path, 'a') as f:
+            f.write("##Update##\nwhat is x\nNew answer\n\n")
+        answers = [qa.answer for qa in utils.load_qa_data("Tallman")]
+        self.assertEqual(answers, ["Y answer", "New answer"])
+
+    @patch('app.utils.get_or_create_collection')
+    @patch('app.utils.get_embedding_function')
+    def test_append_update_prunes_superseded_vectors(self, mock_get_ef, mock_get_collection):
+        mock_collection = MagicMock()
+        mock_get_collection.return_value = mock_collection
+        old_id = utils.load_qa_data("Tallman")[0].id
+
+        new_qa = utils.append_qa_pair("Tallman", "What is X?", "New answer", is_update=True)
+
+        mock_collection.delete.assert_called_once_with(ids=[old_id])
+        self.assertEqual([qa.id for qa in utils.load_qa_data("Tallman")][-1], new_qa.id)
+        # The cached index matches a fresh parse of the file
+        utils.invalidate_qa_index("Tallman")
+        self.assertEqual([qa.answer for qa in utils.load_qa_data("Tallman")], ["Y answer", "New answer"])
+
+    @patch('app.utils.get_embedding_function', return_value=None)
+    def test_append_duplicate_pair_gets_next_occurrence_id(self, mock_get_ef):
+        new_qa = utils.append_qa_pair("Tallman", "What is Y?", "Y answer")
+        self.assertEqual(new_qa.id, utils.make_qa_id("Tallman", "What is Y?", "Y answer", 1))
+
+    @patch('app.utils.get_embedding_function', return_value=None)
+    def test_external_edit_invalidates_cache(self, mock_get_ef):
+        self.assertEqual(len(utils.load_qa_data("Tallman")), 2)
+        with open(self.path, 'a') as f:
+            f.write("What is Z?\nZ answer\n\n")
+        self.assertEqual(len(utils.load_qa_data("Tallman")), 3)
+
+    @patch('app.compact.utils.sync_company_into_chroma')
+    @patch('app.compact.utils.get_embedding_function')
+    def test_compact_rewrites_file_and_syncs(self, mock_get_ef, mock_sync):
+        mock_sync.return_value = {'added': 0, 'deleted': 1, 'unchanged': 2}
+        with open(self.path, 'a') as f:
+            f.write("##Update##\nWhat is X?\nNew answer\n\n")
+        live_ids = [qa.id for qa in utils.load_qa_data("Tallman")]
+
+        stats = compact.compact_company("Tallman")
+
+        self.assertEqual(stats['records_before'], 3)
+        self.assertEqual(stats['superseded_removed'], 1)
+        mock_sync.assert_called_once_with("Tallman")
+        with open(self.path) as f:
+            self.assertEqual(f.read(), "What is Y?\nY answer\n\nWhat is X?\nNew answer\n\n")
+        # Live pairs keep their IDs, so the sync only has to delete the stale vectors
+        self.assertEqual([qa.id for qa in utils.load_qa_data("Tallman")], live_ids)
+
+    def test_compact_dry_run_leaves_file(self):
+        with open(self.path, 'a') as f:
+            f.write("##Update##\nWhat is X?\nNew answer\n\n")
+        with open(self.path) as f:
+            before = f.read()
+        stats = compact.compact_company("Tallman", dry_run=True)
+        self.assertEqual(stats['superseded_removed'], 1)
+        with open(self.path) as f:
+            self.assertEqual(f.read(), before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+from app.qa_parser import iter_qa_records, build_record_index, iter_qa_records_from
+
+
+class TestQAParser(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, content):
+        path = os.path.join(self.tmpdir.name, "QA.txt")
+        with open(path, 'wb') as f:
+            f.write(content.encode('utf-8'))
+        return path
+
+    def pairs(self, records):
+        return [(record.question, record.answer) for record in records]
+
+    def test_pairs_consecutive_lines(self):
+        path = self.write("Q1\nA1\n\n  Q2  \r\nA2")
+        self.assertEqual(self.pairs(iter_qa_records(path)), [("Q1", "A1"), ("Q2", "A2")])
+
+    def test_update_marker_handling(self):
+        # The marker flags the next pair; a question followed by a marker is dropped
+        path = self.write("Q1\nA1\n\nDropped question\n##Update##\nQ1\nA1 fixed\n\nQ3\n")
+        records = list(iter_qa_records(path))
+        self.assertEqual(self.pairs(records), [("Q1", "A1"), ("Q1", "A1 fixed")])
+        self.assertEqual([record.is_update for record in records], [False, True])
+
+    def test_empty_and_missing_files(self):
+        self.assertEqual(list(iter_qa_records(self.write(""))), [])
+        with self.assertRaises(FileNotFoundError):
+            list(iter_qa_records(os.path.join(self.tmpdir.name, "missing.txt")))
+
+    def test_utf8_content(self):
+        path = self.write("Qué tal?\nBien — gracias\n")
+        self.assertEqual(self.pairs(iter_qa_records(path)), [("Qué tal?", "Bien — gracias")])
+
+    def test_offsets_allow_resuming(self):
+        path = self.write("Q1\nA1\n\n##Update##\nQ2\nA2\n\nQ3\nA3\n")
+        records = list(iter_qa_records(path))
+        self.assertEqual(records[0].offset, 0)
+        self.assertEqual(records[1].offset, records[0].end_offset)
+
+        resumed = list(iter_qa_records(path, start_offset=records[0].end_offset))
+        self.assertEqual(resumed, records[1:])
+        self.assertTrue(resumed[0].is_update)
+        self.assertEqual(list(iter_qa_records(path, start_offset=records[-1].end_offset)), [])
+
+    def test_seek_to_record_n(self):
+        path = self.write("".join(f"Q{n}\nA{n}\n\n" for n in range(5)))
+        index = build_record_index(path)
+        self.assertEqual(len(index), 5)
+        self.assertEqual(self.pairs(iter_qa_records_from(path, 3, index)), [("Q3", "A3"), ("Q4", "A4")])
+        self.assertEqual(list(iter_qa_records_from(path, 5, index)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from app import bench, quantization
+from app.vector_store import NumpyCollection
+
+
+class TestCompressedIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.embeddings = bench.synthetic_embeddings(2000, 64)
+        self.queries = bench.make_queries(self.embeddings, 30)
+        self.truth = bench.exact_top_k(self.embeddings, self.queries, 3)
+
+    def test_first_pass_candidates_contain_exact_top_k(self):
+        alive = np.ones(len(self.embeddings), dtype=bool)
+        for spec in ('int8', 'binary', 'pca16'):
+            index = quantization.CompressedIndex(spec)
+            index.sync(self.embeddings, len(self.embeddings))
+            candidates = index.candidates(self.queries, alive, index.candidate_count(3))
+            recall = np.mean([len(set(row.tolist()) & expected) / 3 for row, expected in zip(candidates, self.truth)])
+            self.assertGreaterEqual(recall, 0.95, spec)
+
+    def test_code_sizes(self):
+        sizes = {}
+        for spec in ('int8', 'binary', 'pca16'):
+            index = quantization.CompressedIndex(spec)
+            index.sync(self.embeddings, len(self.embeddings))
+            sizes[spec] = index.nbytes
+        self.assertEqual(sizes, {'int8': 2000 * 64, 'binary': 2000 * 8, 'pca16': 2000 * 16 * 4})
+
+    def test_sync_encodes_appended_rows_and_refits_on_doubling(self):
+        index = quantization.CompressedIndex('int8')
+        index.sync(self.embeddings, 600)
+        index.sync(self.embeddings, 900)
+        self.assertEqual((index.rows, index.fitted_rows, len(index.codes)), (900, 600, 900))
+        index.sync(self.embeddings, 1200)
+        self.assertEqual((index.fitted_rows, len(index.codes)), (1200, 1200))
+
+    def test_unknown_spec(self):
+        with self.assertRaises(ValueError):
+            quantization.make_codec('int4')
+
+
+class TestCompressedCollection(unittest.TestCase):
+
+    def test_rerank_returns_exact_distances_and_skips_deleted(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        embeddings = bench.synthetic_embeddings(500, 32)
+        exact = NumpyCollection(path, "mcr_qa")
+        exact.add(ids=[str(i) for i in range(500)], embeddings=embeddings)
+        exact.delete(ids=["7"])
+        compressed = NumpyCollection(path, "mcr_qa", compression='binary')
+        queries = bench.make_queries(embeddings, 10)
+
+        for query in queries:
+            expected = exact.query(query_embeddings=[query], n_results=3)
+            found = compressed.query(query_embeddings=[query], n_results=3)
+            self.assertEqual(found['ids'], expected['ids'])
+            np.testing.assert_allclose(found['distances'], expected['distances'], atol=1e-6)
+        self.assertEqual(compressed.memory_bytes()['codes'], 500 * 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from app import metrics
+from app.rate_limiter import LLMRateLimiter, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, RateLimitTimeout, estimate_tokens
+
+
+class TestLLMRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_estimate_tokens(self):
+        messages = [{'role': "system", 'content': "x" * 400}, {'role': "user", 'content': "y" * 40}]
+        self.assertEqual(estimate_tokens(messages, max_tokens=100), 110 + 8 + 100)
+        self.assertGreater(estimate_tokens(messages), estimate_tokens(messages, max_tokens=100))
+
+    def test_empty_token_bucket_queues_until_refilled(self):
+        limiter = LLMRateLimiter(tokens_per_minute=6000) # 100 tokens/s
+        limiter.acquire(6000)
+        limiter.release()
+        started = time.monotonic()
+        limiter.acquire(10)
+        limiter.release()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+        self.assertEqual(metrics.get("llm.queued"), 1)
+
+    def test_queue_timeout(self):
+        limiter = LLMRateLimiter(requests_per_minute=1, queue_timeout=0.05)
+        limiter.acquire()
+        limiter.release()
+        with self.assertRaises(RateLimitTimeout):
+            limiter.acquire()
+        self.assertEqual(metrics.get("llm.queue_timeouts"), 1)
+        self.assertEqual(limiter.stats()['queued'], 0)
+
+    def test_interactive_calls_go_first(self):
+        limiter = LLMRateLimiter(max_concurrency=1)
+        limiter.acquire()
+        order = []
+
+        def call(name, priority):
+            limiter.acquire(priority=priority)
+            order.append(name)
+            limiter.release()
+
+        background = threading.Thread(target=call, args=("background", PRIORITY_BACKGROUND))
+        background.start()
+        while limiter.stats()['queued'] < 1:
+            time.sleep(0.001)
+        interactive = threading.Thread(target=call, args=("interactive", PRIORITY_INTERACTIVE))
+        interactive.start()
+        while limiter.stats()['queued'] < 2:
+            time.sleep(0.001)
+        limiter.release()
+        background.join(5)
+        interactive.join(5)
+        self.assertEqual(order, ["interactive", "background"])
+
+    def test_retry_after_pauses_and_slows_down(self):
+        limiter = LLMRateLimiter(requests_per_minute=600)
+        limiter.rate_limited(0.1)
+        self.assertEqual(limiter.stats()['rate_scale'], 0.5)
+        started = time.monotonic()
+        limiter.acquire()
+        limiter.release()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+        limiter.succeeded()
+        self.assertEqual(limiter.stats()['rate_scale'], 0.55)
+        self.assertEqual(metrics.get("llm.rate_limited"), 1)
+
+    def test_usage_corrects_the_estimate(self):
+        limiter = LLMRateLimiter(tokens_per_minute=1000)
+        limiter.acquire(600)
+        limiter.release()
+        limiter.record_usage(600, 100)
+        self.assertGreaterEqual(limiter.stats()['tokens_available'], 900)
+
+    def test_workers_share_a_state_file(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, "llm_rate_limit.json")
+        first = LLMRateLimiter(tokens_per_minute=60, queue_timeout=0.05, state_path=path)
+        second = LLMRateLimiter(tokens_per_minute=60, queue_timeout=0.05, state_path=path)
+        first.acquire(60)
+        first.release()
+        with self.assertRaises(RateLimitTimeout):
+            second.acquire(30)
+        second.rate_limited(5)
+        self.assertGreater(first.stats()['paused_seconds'], 4)
+
+    def test_stats_do_not_write_the_shared_state(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, "llm_rate_limit.json")
+        limiter = LLMRateLimiter(requests_per_minute=60, state_path=path)
+        self.assertEqual(limiter.stats()['requests_available'], 60)
+        self.assertEqual(os.listdir(tmpdir.name), []) # neither the state file nor its lock is created
+
+        limiter.acquire()
+        limiter.release()
+        with open(path) as f:
+            before = f.read()
+        mtime = os.stat(path).st_mtime_ns
+        time.sleep(0.01)
+        self.assertGreater(limiter.stats()['requests_available'], 58.9)
+        with open(path) as f:
+            self.assertEqual(f.read(), before)
+        self.assertEqual(os.stat(path).st_mtime_ns, mtime)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from app import app as flask_app
+from app import metrics, semantic_cache, utils
+from app.semantic_cache import SemanticCache
+
+OPEN = [1.0, 0.0, 0.0]
+OPEN_PARAPHRASE = [0.99, 0.1, 0.0]
+SHIPPING = [0.0, 1.0, 0.0]
+
+
+class SemanticCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, "Tallman_QA.txt")
+        with open(self.path, 'w') as f:
+            f.write("What are your opening hours?\n9 to 5.\n\n")
+        for target, value in (('TALLMAN_QA_FILE', self.path), ('get_embedding_function', lambda: None)):
+            patcher = patch(f'app.utils.{target}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(utils.invalidate_qa_index, "Tallman")
+        utils.invalidate_qa_index("Tallman")
+
+
+class TestSemanticCache(SemanticCacheTestCase):
+
+    def test_paraphrase_hits_and_counts_saved_time(self):
+        cache = SemanticCache(capacity=10, ttl=60, threshold=0.95)
+        cache.put("Tallman", "General Help", "When do you open?", OPEN, "At 9.", [{'id': 'x'}], llm_seconds=2.5)
+
+        hit = cache.get("Tallman", "General Help", OPEN_PARAPHRASE)
+        self.assertEqual((hit['question'], hit['answer'], hit['snippets']), ("When do you open?", "At 9.", [{'id': 'x'}]))
+        self.assertIsNone(cache.get("Tallman", "General Help", SHIPPING))
+        self.assertIsNone(cache.get("Tallman", "Sales", OPEN))
+        self.assertIsNone(cache.get("MCR", "General Help", OPEN))
+        report = metrics.report()
+        self.assertEqual(report['counters']['semantic_cache.saved_ms'], 2500)
+        self.assertEqual(report['ratios']['semantic_cache.hit_ratio'], 0.25)
+
+    def test_lru_eviction(self):
+        cache = SemanticCache(capacity=2, ttl=60, threshold=0.95)
+        cache.put("Tallman", "Sales", "a", [1, 0, 0], "A")
+        cache.put("Tallman", "Sales", "b", [0, 1, 0], "B")
+        cache.get("Tallman", "Sales", [1, 0, 0]) # "a" is now the most recently used
+        cache.put("Tallman", "Sales", "c", [0, 0, 1], "C")
+
+        self.assertIsNone(cache.get("Tallman", "Sales", [0, 1, 0]))
+        self.assertEqual(cache.get("Tallman", "Sales", [1, 0, 0])['answer'], "A")
+        self.assertEqual(cache.get("Tallman", "Sales", [0, 0, 1])['answer'], "C")
+
+    def test_bucket_grows_up_to_capacity(self):
+        cache = SemanticCache(capacity=40, ttl=60, threshold=0.95)
+        cache.put("Tallman", "Sales", "q0", [1, 0, 0], "A0")
+        bucket = cache._buckets[("Tallman", "Sales")]
+        self.assertEqual(bucket.vectors.shape, (16, 3))
+        for n in range(1, 45):
+            angle = n / 100
+            cache.put("Tallman", "Sales", f"q{n}", [np.cos(angle), np.sin(angle), 0], f"A{n}")
+        bucket = cache._buckets[("Tallman", "Sales")]
+        self.assertEqual((bucket.vectors.shape[0], len(bucket.recency)), (40, 40))
+        self.assertEqual(cache.get("Tallman", "Sales", [np.cos(0.44), np.sin(0.44), 0])['answer'], "A44")
+
+    def test_ttl_expiry(self):
+        cache = SemanticCache(capacity=2, ttl=10, threshold=0.95)
+        with patch('app.semantic_cache.time.monotonic', return_value=100.0):
+            cache.put("Tallman", "Sales", "a", OPEN, "A")
+        with patch('app.semantic_cache.time.monotonic', return_value=105.0):
+            self.assertIsNotNone(cache.get("Tallman", "Sales", OPEN))
+        with patch('app.semantic_cache.time.monotonic', return_value=111.0):
+            self.assertIsNone(cache.get("Tallman", "Sales", OPEN))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_kb_changes_invalidate_the_company(self):
+        cache = SemanticCache(capacity=10, ttl=60, threshold=0.95)
+        cache.put("Tallman", "Sales", "a", OPEN, "A")
+        cache.put("Tallman", "Product", "b", SHIPPING, "B")
+
+        utils.append_qa_pair("Tallman", "What are your opening hours?", "8 to 6.", is_update=True)
+
+        self.assertIsNone(cache.get("Tallman", "Sales", OPEN))
+        self.assertEqual(cache.stats()['buckets'], 0)
+
+    def test_disabled(self):
+        cache = SemanticCache(capacity=0, ttl=60, threshold=0.95)
+        cache.put("Tallman", "Sales", "a", OPEN, "A")
+        self.assertIsNone(cache.get("Tallman", "Sales", OPEN))
+
+
+class TestAskUsesSemanticCache(SemanticCacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        semantic_cache.cache.invalidate()
+        self.addCleanup(semantic_cache.cache.invalidate)
+        flask_app.config['TESTING'] = True
+        flask_app.config['SECRET_KEY'] = 'test_secret_key'
+        self.client = flask_app.test_client()
+        self.mocks = {}
+        for name in ('get_or_create_collection', 'query_collection', 'get_llm_answer', 'embed_query'):
+            patcher = patch(f'app.routes.{name}')
+            self.mocks[name] = patcher.start()
+            self.addCleanup(patcher.stop)
+        self.mocks['query_collection'].return_value = [{'id': 'x', 'question': "Hours?", 'answer': "9 to 5."}]
+        self.mocks['get_llm_answer'].return_value = "We open at 9."
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = "user1"
+            sess['status'] = "user"
+
+    def ask(self, question, embedding):
+        self.mocks['embed_query'].return_value = embedding
+        payload = {'user_question': question, 'company': 'Tallman', 'question_type': 'General Help'}
+        return self.client.post('/api/ask', json=payload).get_json()
+
+    def test_paraphrase_skips_retrieval_and_llm(self):
+        first = self.ask("When do you open?", OPEN)
+        second = self.ask("What time do you open", OPEN_PARAPHRASE)
+
+        self.assertEqual(first['source'], 'retrieval')
+        self.assertEqual((second['source'], second['answer']), ('semantic_cache', "We open at 9."))
+        self.assertEqual(second['cached_question'], "When do you open?")
+        self.assertEqual(self.mocks['get_llm_answer'].call_count, 1)
+        self.assertEqual(self.mocks['query_collection'].call_count, 1)
+        self.assertEqual(self.client.get('/metrics').get_json()['semantic_cache']['entries'], 1)
+
+    def test_llm_errors_are_not_cached(self):
+        self.mocks['get_llm_answer'].return_value = "Error generating answer from LLM: timeout"
+        self.ask("When do you open?", OPEN)
+        self.mocks['get_llm_answer'].return_value = "We open at 9."
+        self.assertEqual(self.ask("When do you open?", OPEN)['source'], 'retrieval')
+
+
+if __name__ == '__main__':
+    unittest.main()
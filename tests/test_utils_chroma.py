@@ -5,6 +5,8 @@ from app.utils import (
     add_qa_to_collection,
     query_collection,
     load_all_qa_into_chroma,
+    sync_company_into_chroma,
+    get_collection_ids,
     # Make sure client and sentence_transformer_ef from utils can be patched
 )
 from app.models import QA # Required for creating QA instances
@@ -100,10 +102,6 @@ class TestChromaDBOperations(unittest.TestCase):
     @patch('app.utils.sentence_transformer_ef') # Ensure it's mocked and not None
     @patch('app.utils.client') # Ensure client is mocked
     def test_load_all_qa_into_chroma(self, mock_chroma_client, mock_ef, mock_get_create_collection, mock_load_qa):
-        # Setup: sentence_transformer_ef is mocked by @patch decorator
-        # mock_ef is the MagicMock instance for sentence_transformer_ef
-
-        # Mock data for two companies
         qa_items_company1 = [
             QA(id="c1_q1", question="C1Q1", answer="C1A1", company="Company1"),
             QA(id="c1_q2", question="C1Q2", answer="C1A2", company="Company1")
@@ -111,67 +109,81 @@ class TestChromaDBOperations(unittest.TestCase):
         qa_items_company2 = [
             QA(id="c2_q1", question="C2Q1", answer="C2A1", company="Company2")
         ]
+        mock_load_qa.side_effect = lambda company_name: {
+            "Company1": qa_items_company1,
+            "Company2": qa_items_company2,
+        }.get(company_name, [])
 
-        # Configure load_qa_data mock
-        def load_qa_side_effect(company_name):
-            if company_name == "Company1":
-                return qa_items_company1
-            elif company_name == "Company2":
-                return qa_items_company2
-            elif company_name == "Company3": # Simulate a company with no data
-                return []
-            return []
-        mock_load_qa.side_effect = load_qa_side_effect
-
-        # Mock collections for each company
+        # Company1's collection is empty, Company2 already holds its only item
         mock_collection_c1 = MagicMock(name="CollectionC1")
+        mock_collection_c1.get.return_value = {'ids': []}
         mock_collection_c2 = MagicMock(name="CollectionC2")
-        mock_collection_c3 = MagicMock(name="CollectionC3") # For Company3
-
-        def get_collection_side_effect(company_name):
-            if company_name == "Company1":
-                return mock_collection_c1
-            elif company_name == "Company2":
-                return mock_collection_c2
-            elif company_name == "Company3":
-                return mock_collection_c3
-            return MagicMock() # Default mock
-        mock_get_create_collection.side_effect = get_collection_side_effect
-
-        # Call the function to test
-        companies_to_test = ["Company1", "Company2", "Company3"]
-        with patch('app.utils.companies', companies_to_test): # Temporarily override companies list in utils
-             load_all_qa_into_chroma()
-
-
-        # Assertions for Company1
-        mock_load_qa.assert_any_call("Company1")
-        mock_get_create_collection.assert_any_call("Company1")
-        expected_ids_c1 = [qa.id for qa in qa_items_company1]
-        expected_docs_c1 = [qa.question for qa in qa_items_company1]
-        expected_meta_c1 = [qa.to_dict() for qa in qa_items_company1]
+        mock_collection_c2.get.return_value = {'ids': ["c2_q1"]}
+        mock_collection_c3 = MagicMock(name="CollectionC3")
+        mock_collection_c3.get.return_value = {'ids': ["c3_old"]}
+        collections = {"Company1": mock_collection_c1, "Company2": mock_collection_c2, "Company3": mock_collection_c3}
+        mock_get_create_collection.side_effect = lambda company_name: collections[company_name]
+
+        with patch('app.utils.COMPANIES', ["Company1", "Company2", "Company3"]):
+            load_all_qa_into_chroma()
+
         mock_collection_c1.upsert.assert_called_once_with(
-            ids=expected_ids_c1,
-            documents=expected_docs_c1,
-            metadatas=expected_meta_c1
+            ids=[qa.id for qa in qa_items_company1],
+            documents=[qa.question for qa in qa_items_company1],
+            metadatas=[qa.to_dict() for qa in qa_items_company1]
         )
+        mock_collection_c1.delete.assert_not_called()
 
-        # Assertions for Company2
-        mock_load_qa.assert_any_call("Company2")
-        mock_get_create_collection.assert_any_call("Company2")
-        expected_ids_c2 = [qa.id for qa in qa_items_company2]
-        expected_docs_c2 = [qa.question for qa in qa_items_company2]
-        expected_meta_c2 = [qa.to_dict() for qa in qa_items_company2]
-        mock_collection_c2.upsert.assert_called_once_with(
-            ids=expected_ids_c2,
-            documents=expected_docs_c2,
-            metadatas=expected_meta_c2
-        )
+        # Nothing new for Company2, so nothing is re-embedded
+        mock_collection_c2.upsert.assert_not_called()
+        mock_collection_c2.delete.assert_not_called()
 
-        # Assertions for Company3 (no data, so no upsert)
-        mock_load_qa.assert_any_call("Company3")
-        mock_get_create_collection.assert_any_call("Company3")
+        # Company3's file is empty, so the vectors left in its collection are deleted
         mock_collection_c3.upsert.assert_not_called()
+        mock_collection_c3.delete.assert_called_once_with(ids=["c3_old"])
+
+    @patch('app.utils.load_qa_data')
+    @patch('app.utils.get_or_create_collection')
+    def test_sync_company_into_chroma_adds_new_and_deletes_stale(self, mock_get_create_collection, mock_load_qa):
+        kept = QA(id="kept", question="Q1", answer="A1", company="Tallman")
+        added = QA(id="added", question="Q2", answer="A2", company="Tallman")
+        mock_load_qa.return_value = [kept, added]
+        mock_collection = MagicMock()
+        mock_collection.get.return_value = {'ids': ["kept", "gone"]}
+        mock_get_create_collection.return_value = mock_collection
+
+        stats = sync_company_into_chroma("Tallman")
+
+        self.assertEqual(stats, {'added': 1, 'deleted': 1, 'unchanged': 1})
+        mock_collection.upsert.assert_called_once_with(
+            ids=["added"], documents=["Q2"], metadatas=[added.to_dict()]
+        )
+        mock_collection.delete.assert_called_once_with(ids=["gone"])
+
+    @patch('app.utils.load_qa_data')
+    @patch('app.utils.get_or_create_collection')
+    def test_sync_company_into_chroma_full(self, mock_get_create_collection, mock_load_qa):
+        mock_load_qa.return_value = [QA(id="kept", question="Q1", answer="A1", company="Tallman")]
+        mock_collection = MagicMock()
+        mock_collection.get.return_value = {'ids': ["kept", "gone"]}
+        mock_get_create_collection.return_value = mock_collection
+
+        stats = sync_company_into_chroma("Tallman", full=True)
+
+        self.assertEqual((stats['added'], stats['deleted']), (1, 1))
+        mock_collection.upsert.assert_called_once()
+        mock_collection.delete.assert_called_once_with(ids=["gone"])
+
+    @patch('app.utils.CHROMA_BATCH_SIZE', 2)
+    def test_get_collection_ids_pages(self):
+        mock_collection = MagicMock()
+        mock_collection.get.side_effect = [{'ids': ["a", "b"]}, {'ids': ["c"]}]
+
+        self.assertEqual(get_collection_ids(mock_collection), {"a", "b", "c"})
+        mock_collection.get.assert_has_calls([
+            call(include=[], limit=2, offset=0),
+            call(include=[], limit=2, offset=2),
+        ])
 
 
     @patch('app.utils.sentence_transformer_ef', new=None) # Simulate EF not available
@@ -1,27 +1,27 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 from app.utils import (
     format_snippets_for_llm,
     get_llm_answer,
     get_corrected_llm_answer,
-    # Make sure openai from utils can be patched
+    # Make sure the LLM client from utils can be patched
 )
 # If PROMPT_TEMPLATES is used directly in tests from app.data.Type, import it
 from app.data.Type import PROMPT_TEMPLATES
 
-# Patch 'app.utils.openai' to mock the openai module as used in utils.py
-@patch('app.utils.openai')
+# Patch 'app.utils.llm_client' to mock the LLM client (app/llm_client.py) as used in utils.py
+@patch('app.utils.llm_client')
 class TestLLMOperations(unittest.TestCase):
 
-    def test_format_snippets_for_llm_empty(self, mock_openai_module): # mock_openai_module is from class decorator
+    def test_format_snippets_for_llm_empty(self, mock_llm_client): # mock_llm_client is from class decorator
         self.assertEqual(format_snippets_for_llm([]), "No relevant information found.")
 
-    def test_format_snippets_for_llm_single_snippet(self, mock_openai_module):
+    def test_format_snippets_for_llm_single_snippet(self, mock_llm_client):
         snippets = [{'question': 'Q1', 'answer': 'A1'}]
         expected = "Snippet 1: Q: Q1 A: A1"
         self.assertEqual(format_snippets_for_llm(snippets), expected)
 
-    def test_format_snippets_for_llm_multiple_snippets(self, mock_openai_module):
+    def test_format_snippets_for_llm_multiple_snippets(self, mock_llm_client):
         snippets = [
             {'question': 'Q1', 'answer': 'A1'},
             {'question': 'Q2', 'answer': 'A2'}
@@ -29,11 +29,9 @@ class TestLLMOperations(unittest.TestCase):
         expected = "Snippet 1: Q: Q1 A: A1\nSnippet 2: Q: Q2 A: A2"
         self.assertEqual(format_snippets_for_llm(snippets), expected)
 
-    def test_get_llm_answer_success(self, mock_openai_module):
-        mock_openai_module.api_key = "fake_key" # Ensure API key is seen as "set"
-        mock_response = MagicMock()
-        mock_response.choices[0].message.content = " Mocked LLM Answer "
-        mock_openai_module.ChatCompletion.create.return_value = mock_response
+    def test_get_llm_answer_success(self, mock_llm_client):
+        mock_llm_client.api_key = "fake_key" # Ensure API key is seen as "set"
+        mock_llm_client.chat.return_value = " Mocked LLM Answer "
 
         user_question = "What is AI?"
         company = "TestCo"
@@ -43,13 +41,11 @@ class TestLLMOperations(unittest.TestCase):
         answer = get_llm_answer(user_question, company, question_type, context_snippets)
 
         self.assertEqual(answer, "Mocked LLM Answer")
-        mock_openai_module.ChatCompletion.create.assert_called_once()
-        call_args = mock_openai_module.ChatCompletion.create.call_args
+        mock_llm_client.chat.assert_called_once()
+        call_args = mock_llm_client.chat.call_args
 
-        # Check model
-        self.assertEqual(call_args.kwargs['model'], "gpt-3.5-turbo")
-        # Check messages structure and content (especially the user message)
-        messages = call_args.kwargs['messages']
+        # Check messages structure and content (especially the user message); the model is the client's LLM_MODEL
+        messages = call_args.args[0]
         self.assertEqual(messages[0]['role'], "system")
         self.assertIn(company, messages[0]['content'])
         self.assertEqual(messages[1]['role'], "user")
@@ -63,25 +59,23 @@ class TestLLMOperations(unittest.TestCase):
         self.assertEqual(messages[1]['content'], expected_prompt)
 
 
-    def test_get_llm_answer_no_api_key(self, mock_openai_module):
-        mock_openai_module.api_key = None # Simulate API key not set
+    def test_get_llm_answer_no_api_key(self, mock_llm_client):
+        mock_llm_client.api_key = None # Simulate API key not set
         answer = get_llm_answer("Q", "C", "T", [])
         self.assertEqual(answer, "OpenAI API key not configured. Please set the OPENAI_API_KEY environment variable.")
-        mock_openai_module.ChatCompletion.create.assert_not_called()
+        mock_llm_client.chat.assert_not_called()
 
-    def test_get_llm_answer_api_error(self, mock_openai_module):
-        mock_openai_module.api_key = "fake_key"
-        mock_openai_module.ChatCompletion.create.side_effect = Exception("API communication error")
+    def test_get_llm_answer_api_error(self, mock_llm_client):
+        mock_llm_client.api_key = "fake_key"
+        mock_llm_client.chat.side_effect = Exception("API communication error")
 
         answer = get_llm_answer("Q", "C", "T", [])
         self.assertEqual(answer, "Error generating answer from LLM.")
 
 
-    def test_get_corrected_llm_answer_success(self, mock_openai_module):
-        mock_openai_module.api_key = "fake_key"
-        mock_response = MagicMock()
-        mock_response.choices[0].message.content = " Mocked Corrected Answer "
-        mock_openai_module.ChatCompletion.create.return_value = mock_response
+    def test_get_corrected_llm_answer_success(self, mock_llm_client):
+        mock_llm_client.api_key = "fake_key"
+        mock_llm_client.chat.return_value = " Mocked Corrected Answer "
 
         original_question = "Original Q"
         incorrect_answer = "Incorrect A"
@@ -91,11 +85,10 @@ class TestLLMOperations(unittest.TestCase):
         corrected_answer = get_corrected_llm_answer(original_question, incorrect_answer, user_correction_text, company)
 
         self.assertEqual(corrected_answer, "Mocked Corrected Answer")
-        mock_openai_module.ChatCompletion.create.assert_called_once()
-        call_args = mock_openai_module.ChatCompletion.create.call_args
+        mock_llm_client.chat.assert_called_once()
+        call_args = mock_llm_client.chat.call_args
 
-        self.assertEqual(call_args.kwargs['model'], "gpt-3.5-turbo")
-        messages = call_args.kwargs['messages']
+        messages = call_args.args[0]
         self.assertEqual(messages[0]['role'], "system")
         self.assertIn(company, messages[0]['content'])
         self.assertEqual(messages[1]['role'], "user")
@@ -107,15 +100,15 @@ class TestLLMOperations(unittest.TestCase):
         )
         self.assertEqual(messages[1]['content'], expected_prompt)
 
-    def test_get_corrected_llm_answer_no_api_key(self, mock_openai_module):
-        mock_openai_module.api_key = None
+    def test_get_corrected_llm_answer_no_api_key(self, mock_llm_client):
+        mock_llm_client.api_key = None
         answer = get_corrected_llm_answer("OQ", "IA", "UC", "C")
         self.assertEqual(answer, "OpenAI API key not configured. Please set the OPENAI_API_KEY environment variable.")
-        mock_openai_module.ChatCompletion.create.assert_not_called()
+        mock_llm_client.chat.assert_not_called()
 
-    def test_get_corrected_llm_answer_api_error(self, mock_openai_module):
-        mock_openai_module.api_key = "fake_key"
-        mock_openai_module.ChatCompletion.create.side_effect = Exception("API communication error")
+    def test_get_corrected_llm_answer_api_error(self, mock_llm_client):
+        mock_llm_client.api_key = "fake_key"
+        mock_llm_client.chat.side_effect = Exception("API communication error")
         answer = get_corrected_llm_answer("OQ", "IA", "UC", "C")
         self.assertEqual(answer, "Error generating corrected answer from LLM.")
 
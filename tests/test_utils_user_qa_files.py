@@ -1,5 +1,7 @@
+import os
+import tempfile
 import unittest
-from unittest.mock import patch, mock_open, call
+from unittest.mock import patch, mock_open, call, MagicMock
 import json # Ensure json is imported
 from app.utils import (
     load_users,
@@ -7,6 +9,9 @@ from app.utils import (
     get_qa_filepath,
     load_qa_data,
     append_qa_pair,
+    append_qa_pairs,
+    make_qa_id,
+    normalize_question,
     USER_FILE,
     TALLMAN_QA_FILE,
     MCR_QA_FILE,
@@ -84,51 +89,56 @@ class TestQAFileOperations(unittest.TestCase):
         with self.assertRaises(ValueError):
             get_qa_filepath("InvalidCompany")
 
-    @patch('app.utils.open', new_callable=mock_open, read_data='''Question 1
-Answer 1
-
-Question 2
-Answer 2''')
-    @patch('uuid.uuid4') # Mock uuid4 to control IDs
-    def test_load_qa_data_success(self, mock_uuid, mock_file):
-        mock_uuid.return_value.hex = "test_uuid_1" # First call
-        def uuid_side_effect(): # Mock subsequent calls if needed, or set different return_value.hex
-            # This example assumes each QA item gets a new UUID hex
-            # For simplicity, let's make it deterministic
-            if mock_uuid.call_count == 1:
-                return type('obj', (object,), {'hex' : "test_uuid_1"})
-            return type('obj', (object,), {'hex' : "test_uuid_2"})
-        mock_uuid.side_effect = uuid_side_effect
-
-
-        qa_list = load_qa_data("Tallman")
+    def write_qa_file(self, content):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, "QA.txt")
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_load_qa_data_success(self):
+        path = self.write_qa_file("Question 1\nAnswer 1\n\nQuestion 2\nAnswer 2")
+        with patch('app.utils.TALLMAN_QA_FILE', path):
+            qa_list = load_qa_data("Tallman")
         self.assertEqual(len(qa_list), 2)
         self.assertIsInstance(qa_list[0], QA)
         self.assertEqual(qa_list[0].question, "Question 1")
         self.assertEqual(qa_list[0].answer, "Answer 1")
         self.assertEqual(qa_list[0].company, "Tallman")
-        self.assertEqual(qa_list[0].id, "test_uuid_1") # Check mocked ID
-        self.assertEqual(qa_list[1].id, "test_uuid_2") # Check mocked ID for second item
-        mock_file.assert_called_once_with(TALLMAN_QA_FILE, 'r')
-
+        self.assertEqual(qa_list[0].id, make_qa_id("Tallman", "Question 1", "Answer 1"))
+        self.assertEqual(qa_list[1].id, make_qa_id("Tallman", "Question 2", "Answer 2"))
 
-    @patch('app.utils.open', new_callable=mock_open, read_data='''##Update##
-Question 1
-Answer 1''')
-    @patch('uuid.uuid4')
-    def test_load_qa_data_with_update_tag(self, mock_uuid, mock_file):
-        mock_uuid.return_value.hex = "test_uuid_3"
-        qa_list = load_qa_data("MCR")
+    def test_load_qa_data_with_update_tag(self):
+        path = self.write_qa_file("##Update##\nQuestion 1\nAnswer 1")
+        with patch('app.utils.MCR_QA_FILE', path):
+            qa_list = load_qa_data("MCR")
         self.assertEqual(len(qa_list), 1)
         self.assertEqual(qa_list[0].question, "Question 1")
-        self.assertEqual(qa_list[0].id, "test_uuid_3")
-        mock_file.assert_called_once_with(MCR_QA_FILE, 'r')
-
-    @patch('app.utils.open', side_effect=FileNotFoundError)
-    def test_load_qa_data_file_not_found(self, mock_file):
-        qa_list = load_qa_data("Bradley")
+        self.assertEqual(qa_list[0].id, make_qa_id("MCR", "Question 1", "Answer 1"))
+
+    def test_load_qa_data_ids_are_stable_and_unique(self):
+        path = self.write_qa_file("Question 1\nAnswer 1\n\nQuestion 1\nAnswer 1")
+        with patch('app.utils.TALLMAN_QA_FILE', path):
+            first_load = load_qa_data("Tallman")
+            second_load = load_qa_data("Tallman")
+        self.assertEqual([qa.id for qa in first_load], [qa.id for qa in second_load])
+        # Exact duplicates are told apart by their occurrence number
+        self.assertNotEqual(first_load[0].id, first_load[1].id)
+        self.assertEqual(first_load[1].id, make_qa_id("Tallman", "Question 1", "Answer 1", 1))
+
+    def test_load_qa_data_file_not_found(self):
+        with patch('app.utils.BRADLEY_QA_FILE', "/nonexistent/Bradley_QA.txt"):
+            qa_list = load_qa_data("Bradley")
         self.assertEqual(len(qa_list), 0)
 
+    def test_make_qa_id_normalizes_question(self):
+        self.assertEqual(normalize_question("  What is   X?  "), "what is x")
+        self.assertEqual(make_qa_id("Tallman", "What is X?", "A"), make_qa_id("Tallman", "what is  x", "A"))
+        self.assertNotEqual(make_qa_id("Tallman", "What is X?", "A"), make_qa_id("MCR", "What is X?", "A"))
+        self.assertNotEqual(make_qa_id("Tallman", "What is X?", "A"), make_qa_id("Tallman", "What is X?", "B"))
+        self.assertEqual(len(make_qa_id("Tallman", "Q", "A")), 32)
+
     # Mocking sentence_transformer_ef and ChromaDB interactions for append_qa_pair
     @patch('app.utils.sentence_transformer_ef', new=None) # Simulate embedding function not available
     @patch('app.utils.open', new_callable=mock_open)
@@ -150,7 +160,7 @@ Answer 1''')
         self.assertIn(call("\n\n"), handle.write.call_args_list)
 
 
-        self.assertEqual(returned_qa.id, "append_uuid_1")
+        self.assertEqual(returned_qa.id, make_qa_id(company, question, answer))
         self.assertEqual(returned_qa.question, question)
         self.assertEqual(returned_qa.answer, answer)
         self.assertEqual(returned_qa.company, company)
@@ -183,16 +193,14 @@ Answer 1''')
     @patch('app.utils.get_or_create_collection')
     @patch('app.utils.add_qa_to_collection')
     @patch('app.utils.open', new_callable=mock_open)
-    @patch('uuid.uuid4')
     @patch('app.utils.sentence_transformer_ef') # Ensure it's not None
-    def test_append_qa_pair_with_chroma(self, mock_ef, mock_uuid, mock_file_open, mock_add_qa, mock_get_collection):
+    def test_append_qa_pair_with_chroma(self, mock_ef, mock_file_open, mock_add_qa, mock_get_collection):
         # Ensure sentence_transformer_ef is not None for this test
         # The patch decorator already does this by replacing it with a MagicMock
         # if 'new' is not specified or if it's a MagicMock instance.
         # Or, explicitly set it:
         # app.utils.sentence_transformer_ef = MagicMock()
 
-        mock_uuid.return_value.hex = "append_uuid_3"
         mock_collection_instance = unittest.mock.MagicMock()
         mock_get_collection.return_value = mock_collection_instance
 
@@ -210,9 +218,65 @@ Answer 1''')
         args, _ = mock_add_qa.call_args
         self.assertEqual(args[0], mock_collection_instance) # collection object
         passed_qa_item = args[1] # QA object
-        self.assertEqual(passed_qa_item.id, "append_uuid_3")
+        self.assertEqual(passed_qa_item.id, make_qa_id(company, question, answer))
         self.assertEqual(passed_qa_item.question, question)
 
+    @patch('app.utils.get_or_create_collection')
+    def test_append_qa_pairs_batches_write_embed_and_upsert(self, mock_get_collection):
+        path = self.write_qa_file("Old Q\nOld A\n\n")
+        mock_collection = MagicMock()
+        mock_get_collection.return_value = mock_collection
+        mock_ef = MagicMock(side_effect=lambda texts: [[float(len(text))] for text in texts])
+        pairs = [(f"Q{i}", f"A{i}") for i in range(5)]
+        timings = {}
+
+        with patch('app.utils.TALLMAN_QA_FILE', path), \
+             patch('app.utils.sentence_transformer_ef', mock_ef), \
+             patch('app.utils.EMBEDDING_BATCH_SIZE', 2), \
+             patch('app.utils.CHROMA_BATCH_SIZE', 3):
+            new_items = append_qa_pairs("Tallman", pairs, timings=timings)
+            live = load_qa_data("Tallman")
+
+        self.assertEqual([qa.id for qa in new_items], [make_qa_id("Tallman", q, a) for q, a in pairs])
+        self.assertEqual(len(live), 6)
+        with open(path) as f:
+            self.assertTrue(f.read().endswith("Q4\nA4\n\n"))
+        self.assertEqual(mock_ef.call_count, 3) # 5 questions in batches of 2
+        self.assertEqual(mock_collection.upsert.call_count, 2) # 5 items in chunks of 3
+        _, kwargs = mock_collection.upsert.call_args_list[0]
+        self.assertEqual(kwargs['ids'], [qa.id for qa in new_items[:3]])
+        self.assertEqual(kwargs['embeddings'], [[2.0], [2.0], [2.0]])
+        self.assertEqual(set(timings), {'write', 'embed', 'upsert'})
+
+    @patch('app.utils.upsert_qa_items', side_effect=RuntimeError("collection unavailable"))
+    @patch('app.utils.get_or_create_collection')
+    def test_append_qa_pairs_raises_when_indexing_fails(self, mock_get_collection, mock_upsert):
+        path = self.write_qa_file("")
+        mock_ef = MagicMock(side_effect=lambda texts: [[1.0] for _ in texts])
+
+        with patch('app.utils.TALLMAN_QA_FILE', path), patch('app.utils.sentence_transformer_ef', mock_ef):
+            with self.assertRaises(RuntimeError):
+                append_qa_pairs("Tallman", [("Q", "A")])
+            live = load_qa_data("Tallman")
+
+        self.assertEqual([(qa.question, qa.answer) for qa in live], [("Q", "A")]) # written; the next sync indexes it
+
+    @patch('app.utils.get_or_create_collection')
+    def test_append_qa_pairs_update_supersedes_within_batch(self, mock_get_collection):
+        path = self.write_qa_file("Q\nOld A\n\n")
+        mock_collection = MagicMock()
+        mock_get_collection.return_value = mock_collection
+        mock_ef = MagicMock(side_effect=lambda texts: [[1.0] for _ in texts])
+
+        with patch('app.utils.MCR_QA_FILE', path), patch('app.utils.sentence_transformer_ef', mock_ef):
+            new_items = append_qa_pairs("MCR", [("Q", "New A"), ("Q", "Newest A")], is_update=True)
+            live = load_qa_data("MCR")
+
+        self.assertEqual([qa.answer for qa in live], ["Newest A"])
+        _, kwargs = mock_collection.upsert.call_args
+        self.assertEqual(kwargs['ids'], [new_items[1].id]) # the superseded new pair is never embedded
+        mock_collection.delete.assert_called_once_with(ids=[make_qa_id("MCR", "Q", "Old A")])
+
 
 if __name__ == '__main__':
     unittest.main()
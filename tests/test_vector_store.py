@@ -0,0 +1,176 @@
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+
+from app import utils, vector_store
+from app.vector_store import NumpyCollection
+
+
+def fake_embedding_function(texts):
+    return [[float(len(text)), 1.0, float(text.count("a"))] for text in texts]
+
+
+class TestNumpyCollection(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def make(self):
+        return NumpyCollection(self.path, "tallman_qa", fake_embedding_function)
+
+    def test_query_matches_brute_force_cosine(self):
+        rng = np.random.default_rng(1)
+        vectors = rng.normal(size=(50, 8)).astype(np.float32)
+        collection = self.make()
+        collection.add(ids=[f"id{i}" for i in range(50)], documents=[f"q{i}" for i in range(50)],
+                       metadatas=[{'n': i} for i in range(50)], embeddings=vectors)
+        query = rng.normal(size=8).astype(np.float32)
+
+        result = collection.query(query_embeddings=[query], n_results=3)
+
+        normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        expected = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:3]
+        self.assertEqual(result['ids'][0], [f"id{i}" for i in expected])
+        self.assertEqual(result['metadatas'][0], [{'n': int(i)} for i in expected])
+        self.assertEqual(result['distances'][0], sorted(result['distances'][0]))
+
+    def test_upsert_replaces_and_delete_removes(self):
+        collection = self.make()
+        collection.upsert(ids=["a", "b"], documents=["aaa", "b"], metadatas=[{'v': 1}, {'v': 2}])
+        collection.upsert(ids=["a"], documents=["aaa"], metadatas=[{'v': 3}])
+        collection.delete(ids=["b", "missing"])
+
+        self.assertEqual(collection.count(), 1)
+        self.assertEqual(collection.get(ids=["a", "b"])['metadatas'], [{'v': 3}])
+        result = collection.query(query_texts=["aaa"], n_results=3)
+        self.assertEqual(result['ids'], [["a"]])
+
+    def test_persists_and_sees_other_writers(self):
+        first = self.make()
+        first.add(ids=["a"], documents=["aaa"], metadatas=[{'v': 1}])
+        second = self.make()
+        self.assertEqual(second.get(include=[])['ids'], ["a"])
+
+        second.add(ids=["b"], documents=["bbbb"], metadatas=[{'v': 2}])
+        first.delete(ids=["a"])
+
+        self.assertEqual(second.get(include=[])['ids'], ["b"])
+        self.assertEqual(first.query(query_texts=["bbbb"], n_results=2)['ids'], [["b"]])
+
+    def test_get_pages_and_includes_embeddings(self):
+        collection = self.make()
+        collection.add(ids=["a", "b", "c"], documents=["a", "bb", "ccc"])
+        page = collection.get(include=['embeddings', 'documents'], limit=2, offset=1)
+        self.assertEqual(page['ids'], ["b", "c"])
+        self.assertEqual(page['documents'], ["bb", "ccc"])
+        self.assertAlmostEqual(float(np.linalg.norm(page['embeddings'][0])), 1.0, places=5)
+        self.assertIsNone(page['metadatas'])
+
+    def test_grows_past_initial_capacity(self):
+        with patch('app.vector_store.INITIAL_CAPACITY', 4):
+            collection = self.make()
+            for start in range(0, 10, 3):
+                ids = [f"id{i}" for i in range(start, min(start + 3, 10))]
+                collection.add(ids=ids, documents=ids)
+        self.assertEqual(collection.count(), 10)
+        self.assertEqual(self.make().count(), 10)
+
+    def test_compact_drops_retired_rows(self):
+        collection = self.make()
+        collection.add(ids=["a", "b"], documents=["a", "bb"])
+        collection.upsert(ids=["a"], documents=["aaaa"])
+        collection.delete(ids=["b"])
+        other = self.make()
+
+        self.assertEqual(collection.compact(), 2)
+
+        self.assertEqual(collection.get(include=['documents'])['documents'], ["aaaa"])
+        self.assertEqual(other.query(query_texts=["aaaa"], n_results=5)['ids'], [["a"]])
+        other.add(ids=["c"], documents=["c"])
+        self.assertEqual(collection.count(), 2)
+
+    def test_where_filters_get_and_query(self):
+        collection = self.make()
+        collection.add(ids=["a", "b", "c", "d"], documents=["aaaa", "aaab", "aab", "b"],
+                       metadatas=[{'company': 'Tallman', 'v': 1}, {'company': 'MCR', 'v': 2},
+                                  {'company': 'Tallman', 'v': 3}, {'v': 4}])
+
+        self.assertEqual(collection.get(where={'company': 'Tallman'}, include=[])['ids'], ["a", "c"])
+        self.assertEqual(collection.get(where={'company': {'$ne': 'Tallman'}}, include=[])['ids'], ["b", "d"])
+        self.assertEqual(collection.get(ids=["a", "b"], where={'v': {'$in': [2, 3]}}, include=[])['ids'], ["b"])
+        self.assertEqual(collection.get(where={'$and': [{'company': 'Tallman'}, {'v': {'$eq': 3}}]}, include=[])['ids'], ["c"])
+        self.assertEqual(collection.get(where={'$or': [{'company': 'MCR'}, {'v': 4}]}, include=[])['ids'], ["b", "d"])
+
+        result = collection.query(query_texts=["aaab"], n_results=3, where={'company': 'Tallman'})
+        self.assertEqual(sorted(result['ids'][0]), ["a", "c"])
+        self.assertEqual(collection.query(query_texts=["aaab"], n_results=3, where={'company': 'Nobody'})['ids'], [[]])
+        with self.assertRaises(ValueError):
+            collection.get(where={'v': {'$gt': 1}})
+
+    def test_where_filter_skips_compressed_first_pass(self):
+        collection = NumpyCollection(self.path, "tallman_qa", fake_embedding_function, compression='binary')
+        ids = [f"id{i}" for i in range(200)]
+        collection.add(ids=ids, documents=["a" * (i % 7 + 1) + "b" * i for i in range(200)],
+                       metadatas=[{'even': i % 2 == 0} for i in range(200)])
+
+        result = collection.query(query_texts=["ab"], n_results=5, where={'even': False})
+
+        self.assertEqual(len(result['ids'][0]), 5)
+        self.assertTrue(all(int(qa_id[2:]) % 2 == 1 for qa_id in result['ids'][0]))
+
+    def test_empty_collection_query(self):
+        result = self.make().query(query_texts=["x"], n_results=3)
+        self.assertEqual(result['ids'], [[]])
+
+
+class TestBackendSelection(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        vector_store._collections.clear()
+        self.addCleanup(vector_store._collections.clear)
+
+    @patch('app.utils.get_chroma_client')
+    def test_numpy_backend_per_company(self, mock_get_client):
+        with patch('app.utils.sentence_transformer_ef', MagicMock(side_effect=fake_embedding_function)), \
+             patch('app.utils.VECTOR_INDEX_PATH', self.path), \
+             patch.dict('os.environ', {'VECTOR_BACKEND_MCR': 'numpy'}):
+            collection = utils.get_or_create_collection("MCR")
+            self.assertIsInstance(collection, NumpyCollection)
+            self.assertIs(utils.get_or_create_collection("MCR"), collection)
+            mock_get_client.assert_not_called()
+
+            utils.get_or_create_collection("Tallman")
+            mock_get_client.assert_called_once()
+
+    @patch('app.utils.get_chroma_client')
+    def test_config_change_reopens_the_cached_collection(self, mock_get_client):
+        utils.collection_cache.invalidate()
+        self.addCleanup(utils.collection_cache.invalidate)
+        with patch('app.utils.sentence_transformer_ef', MagicMock(side_effect=fake_embedding_function)), \
+             patch('app.utils.VECTOR_INDEX_PATH', self.path), \
+             patch.dict('os.environ', {'VECTOR_BACKEND_MCR': 'numpy'}):
+            plain = utils.get_or_create_collection("MCR")
+            with patch.dict('os.environ', {'VECTOR_COMPRESSION_MCR': 'int8'}):
+                compressed = utils.get_or_create_collection("MCR")
+            self.assertIsNot(compressed, plain)
+            self.assertEqual(compressed.compression, 'int8')
+            self.assertEqual(utils.collection_cache.stats()['open'], 1) # the stale handle was dropped
+
+            with patch.dict('os.environ', {'VECTOR_BACKEND_MCR': 'chroma'}):
+                self.assertIs(utils.get_or_create_collection("MCR"), mock_get_client.return_value.get_or_create_collection.return_value)
+            self.assertIsNone(utils.get_or_create_collection("MCR").compression)
+
+    def test_query_collection_works_on_numpy_backend(self):
+        collection = NumpyCollection(self.path, "mcr_qa", fake_embedding_function)
+        collection.add(ids=["a"], documents=["aaa"], metadatas=[{'question': "aaa", 'answer': "A"}])
+        self.assertEqual(utils.query_collection(collection, "aaa"), [{'question': "aaa", 'answer': "A"}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+from unittest.mock import patch, MagicMock
+from app import app as flask_app
+from app import warmup
+
+
+class TestWarmup(unittest.TestCase):
+
+    def setUp(self):
+        warmup.state.reset()
+
+    @patch('app.warmup.utils.sync_company_into_chroma')
+    @patch('app.warmup.utils.get_or_create_collection')
+    @patch('app.warmup.utils.get_chroma_client')
+    @patch('app.warmup.utils.get_embedding_function')
+    def test_run_warmup_marks_ready_with_progress(self, mock_get_ef, mock_get_client, mock_get_collection, mock_sync):
+        mock_get_ef.return_value = MagicMock()
+        mock_sync.return_value = {'added': 2, 'deleted': 0, 'unchanged': 5}
+
+        with patch('app.warmup.utils.COMPANIES', ["Tallman", "MCR"]):
+            warmup.state.reset()
+            warmup.run_warmup()
+
+        snapshot = warmup.state.snapshot()
+        self.assertEqual(snapshot['status'], 'ready')
+        self.assertTrue(warmup.is_ready())
+        self.assertEqual(snapshot['companies']['Tallman']['status'], 'ready')
+        self.assertEqual(snapshot['companies']['MCR']['added'], 2)
+        self.assertEqual(mock_get_collection.call_count, 2)
+
+    @patch('app.warmup.utils.get_embedding_function', return_value=None)
+    def test_run_warmup_fails_without_model(self, mock_get_ef):
+        warmup.run_warmup()
+        snapshot = warmup.state.snapshot()
+        self.assertEqual(snapshot['status'], 'failed')
+        self.assertIn("Embedding model", snapshot['error'])
+
+    @patch('app.warmup.utils.sync_company_into_chroma', side_effect=Exception("disk full"))
+    @patch('app.warmup.utils.get_or_create_collection')
+    @patch('app.warmup.utils.get_chroma_client')
+    @patch('app.warmup.utils.get_embedding_function')
+    def test_run_warmup_records_company_failure(self, mock_get_ef, mock_get_client, mock_get_collection, mock_sync):
+        with patch('app.warmup.utils.COMPANIES', ["Tallman"]):
+            warmup.state.reset()
+            warmup.run_warmup()
+
+        snapshot = warmup.state.snapshot()
+        self.assertEqual(snapshot['companies']['Tallman'], {'status': 'failed', 'error': 'disk full'})
+
+    @patch('app.warmup.utils.sync_company_into_chroma', return_value={})
+    @patch('app.warmup.utils.get_or_create_collection')
+    @patch('app.warmup.utils.get_chroma_client')
+    @patch('app.warmup.utils.get_embedding_function')
+    def test_run_warmup_skips_chroma_client_for_numpy_companies(self, mock_get_ef, mock_get_client, mock_get_collection, mock_sync):
+        with patch('app.warmup.utils.COMPANIES', ["Tallman", "MCR"]), patch('app.warmup.utils.VECTOR_BACKEND', 'numpy'):
+            warmup.run_warmup()
+            mock_get_client.assert_not_called()
+            self.assertEqual(warmup.state.snapshot()['status'], 'ready')
+
+            with patch.dict('os.environ', {'VECTOR_BACKEND_MCR': 'chroma'}):
+                warmup.state.reset()
+                warmup.run_warmup()
+            mock_get_client.assert_called_once()
+
+    @patch('app.warmup.threading.Thread')
+    def test_start_warmup_runs_once_per_process(self, mock_thread):
+        with patch('app.warmup._thread_pid', None):
+            self.assertTrue(warmup.start_warmup())
+            self.assertFalse(warmup.start_warmup())
+        mock_thread.return_value.start.assert_called_once()
+
+
+class TestHealthRoutes(unittest.TestCase):
+
+    def setUp(self):
+        flask_app.config['TESTING'] = True
+        self.client = flask_app.test_client()
+        warmup.state.reset()
+
+    def test_healthz(self):
+        response = self.client.get('/healthz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'status': 'ok'})
+
+    def test_readyz_not_ready(self):
+        response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.get_json()['status'], 'pending')
+
+    def test_readyz_ready(self):
+        warmup.state.finish()
+        response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['status'], 'ready')
+
+
+if __name__ == '__main__':
+    unittest.main()